@@ -1,34 +1,343 @@
 # coding: utf-8
 from __future__ import unicode_literals
 
+import hashlib
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (
+    Avg,
+    Case,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    Max,
+    Min,
+    Sum,
+    When,
+)
+from django.db.models.functions import TruncDay, TruncHour
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django_filters import rest_framework as filters
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import HueyExecutionLog
-from .serializers import HueyExecutionLogSerializer
+from .export import EXPORT_CSV, EXPORT_FORMATS, export_logs
+from .fulltext import FullTextSearchFilter
+from .metrics import get_metrics_registry
+from .models import (
+    HueyDailyRollup,
+    HueyExecutionLog,
+    HueyExecutionProfile,
+    HueyHourlyRollup,
+    HueyTaskStatus,
+)
+from .pagination import HueyExecutionLogPagination
+from .renderers import PrometheusRenderer
+from .serializers import (
+    HueyDailyRollupSerializer,
+    HueyExecutionLogSerializer,
+    HueyExecutionProfileSerializer,
+    HueyExecutionStatsSerializer,
+    HueyHourlyRollupSerializer,
+    HueyTaskStatusSerializer,
+)
 
 
 class HueyExecutionLogViewSet(viewsets.ReadOnlyModelViewSet):
     class FilterSet(filters.FilterSet):
-        start_time__gte = filters.DateFilter(
-            name="start_time", lookup_expr="date__gte"
-        )
-        start_time__lte = filters.DateFilter(
-            name="start_time", lookup_expr="date__lte"
-        )
+        start_time__gte = filters.DateFilter(method="filter_start_time")
+        start_time__lte = filters.DateFilter(method="filter_start_time")
 
         class Meta:
             model = HueyExecutionLog
-            fields = ["code", "is_success", "finnished", "id"]
+            fields = {
+                "code": ["exact"],
+                "is_success": ["exact"],
+                "finnished": ["exact"],
+                "id": ["exact"],
+                "error_fingerprint": ["exact"],
+                "crashed": ["exact"],
+                "wall_time": ["gte", "lte"],
+                "cpu_user_time": ["gte", "lte"],
+                "cpu_system_time": ["gte", "lte"],
+                "rss_delta": ["gte", "lte"],
+                "memory_peak": ["gte", "lte"],
+                "queue_wait": ["gte", "lte"],
+            }
+
+        def filter_start_time(self, queryset, name, value):
+            # half-open timestamp range instead of casting every row to date,
+            # so the start_time indexes can be used
+            day_start = timezone.make_aware(datetime.combine(value, time.min))
+            if name == "start_time__gte":
+                return queryset.filter(start_time__gte=day_start)
+            return queryset.filter(
+                start_time__lt=day_start + timedelta(days=1)
+            )
 
     serializer_class = HueyExecutionLogSerializer
     queryset = HueyExecutionLog.objects.all()
+    pagination_class = HueyExecutionLogPagination
+    # the full tracebacks are stored compressed, they are only searched by
+    # the full-text index of 'hueylogs_fulltext'
     search_fields = ("code", "error_description")
-    ordering_fields = "__all__"
-    filter_class = FilterSet
+    # columns only filled by 'register_log(metrics=True)' and by the signals
+    metric_fields = (
+        "wall_time",
+        "cpu_user_time",
+        "cpu_system_time",
+        "rss_delta",
+        "memory_peak",
+        "queue_wait",
+    )
+    # only indexed fields, so the pagination does not sort the whole table,
+    # the pagination adds the primary key to break the ties
+    ordering_fields = ("start_time", "end_time", "id") + metric_fields
+    ordering = ("-start_time", "-pk")
+    filterset_class = FilterSet
+    # uses the full-text index if 'hueylogs_fulltext' created it
     filter_backends = (
         filters.DjangoFilterBackend,
         OrderingFilter,
-        SearchFilter,
+        FullTextSearchFilter,
     )
+
+    stats_buckets = {"hour": TruncHour, "day": TruncDay}
+
+    def get_serializer_class(self):
+        if self.action == "stats":
+            return HueyExecutionStatsSerializer
+        return super(HueyExecutionLogViewSet, self).get_serializer_class()
+
+    def stats_params(self, request):
+        """Return the sorted parameters that change the stats, the others
+        (pagination, fields, ordering) do not split their cache."""
+        names = set(self.filterset_class.base_filters)
+        names.update([FullTextSearchFilter.search_param, "bucket"])
+        return sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            if name in names
+            for value in values
+        )
+
+    @action(detail=False)
+    def stats(self, request):
+        """Count, success ratio, duration and last run of each task, of the
+        finished logs selected by the same filters of the list.
+
+        Computed with one GROUP BY, by task and by hour or day with
+        '?bucket=hour' or '?bucket=day'. The sampled successes count as the
+        executions they represent, the durations are of the written logs.
+        The results are cached for 'HUEYLOGS_STATS_CACHE_TIMEOUT' seconds
+        (default 60, 0 disables it).
+        """
+        bucket = request.query_params.get("bucket")
+        if bucket is not None and bucket not in self.stats_buckets:
+            raise ValidationError(
+                {
+                    "bucket": "Must be one of: {}".format(
+                        ", ".join(sorted(self.stats_buckets))
+                    )
+                }
+            )
+        timeout = getattr(settings, "HUEYLOGS_STATS_CACHE_TIMEOUT", 60)
+        cache_key = "hueylogs.stats.{}".format(
+            hashlib.sha1(
+                urlencode(self.stats_params(request)).encode("utf-8")
+            ).hexdigest()
+        )
+        if timeout:
+            data = cache.get(cache_key)
+            if data is not None:
+                return Response(data)
+        groups = ["code"]
+        # the old logs without 'finnished' count as finished
+        queryset = self.filter_queryset(self.get_queryset()).exclude(
+            finnished=False
+        )
+        if bucket is not None:
+            queryset = queryset.annotate(
+                bucket=self.stats_buckets[bucket]("start_time")
+            )
+            groups.append("bucket")
+        duration = ExpressionWrapper(
+            F("end_time") - F("start_time"), output_field=DurationField()
+        )
+        # order_by() so the ordering does not become part of the GROUP BY
+        rows = (
+            queryset.order_by()
+            .values(*groups)
+            .annotate(
+                count=Sum("weight"),
+                success_count=Sum(
+                    Case(When(is_success=True, then="weight"), default=0)
+                ),
+                duration_avg=Avg(duration),
+                duration_min=Min(duration),
+                duration_max=Max(duration),
+                last_run=Max("start_time"),
+            )
+            .order_by(*groups)
+        )
+        # a plain list, the cache pickles it
+        data = list(self.get_serializer(rows, many=True).data)
+        if timeout:
+            cache.set(cache_key, data, timeout)
+        return Response(data)
+
+    @action(detail=False)
+    def export(self, request):
+        """Stream all the logs selected by the filters of the list.
+
+        '?file_format=csv' exports CSV instead of NDJSON, '?gzip=true'
+        compresses it and '?tracebacks=true' adds the full traceback of the
+        failures. The rows are not paginated nor serialized, see
+        export.export_logs.
+        """
+        file_format = request.query_params.get("file_format", "ndjson")
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {
+                    "file_format": "Must be one of: {}".format(
+                        ", ".join(EXPORT_FORMATS)
+                    )
+                }
+            )
+        compress = request.query_params.get("gzip") in ("true", "1")
+        tracebacks = request.query_params.get("tracebacks") in ("true", "1")
+        queryset = self.filter_queryset(self.get_queryset())
+        filename = "hueylogs.{}".format(file_format)
+        content_type = (
+            "text/csv" if file_format == EXPORT_CSV else "application/x-ndjson"
+        )
+        if compress:
+            filename += ".gz"
+            content_type = "application/gzip"
+        response = StreamingHttpResponse(
+            export_logs(
+                queryset, file_format, compress, tracebacks=tracebacks
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = 'attachment; filename="{}"'.format(
+            filename
+        )
+        return response
+
+    def get_queryset(self):
+        queryset = super(HueyExecutionLogViewSet, self).get_queryset()
+        params = self.request.query_params
+        for name in params.get("ordering", "").split(","):
+            # the cursor can not point to a null value, the logs without
+            # metrics are left out of the pages when ordering by them
+            if (
+                self.action == "list"
+                and name.lstrip("-") in self.metric_fields
+            ):
+                queryset = queryset.filter(
+                    **{name.lstrip("-") + "__isnull": False}
+                )
+        fields = self.get_serializer().fields
+        if "error_description" in fields:
+            queryset = queryset.select_related("traceback")
+        if not params.get("fields") and not params.get("omit"):
+            return queryset
+        # loads only the columns of the requested fields, so the lists do
+        # not read the tracebacks they do not show
+        model_fields = set(
+            field.name for field in HueyExecutionLog._meta.concrete_fields
+        )
+        sources = set(
+            field.source
+            for field in fields.values()
+            if field.source in model_fields
+        )
+        if "error_description" in fields:
+            sources.update(["error_description", "traceback__compressed_text"])
+        # read by the cursor pagination
+        sources.update(i for i in self.ordering_fields if i in model_fields)
+        return queryset.only(*sources)
+
+
+class HueyExecutionProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    class FilterSet(filters.FilterSet):
+        code = filters.CharFilter(field_name="log__code")
+
+        class Meta:
+            model = HueyExecutionProfile
+            fields = ["log", "profiler"]
+
+    serializer_class = HueyExecutionProfileSerializer
+    queryset = HueyExecutionProfile.objects.select_related("log")
+    filterset_class = FilterSet
+    ordering_fields = ("log", "own_time", "cumulative_time")
+    filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
+
+
+class HueyTaskStatusViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = HueyTaskStatusSerializer
+    queryset = HueyTaskStatus.objects.all()
+    # task codes are dotted paths
+    lookup_value_regex = "[^/]+"
+    search_fields = ("code",)
+    ordering_fields = "__all__"
+    filter_backends = (OrderingFilter, SearchFilter)
+
+
+class HueyExecutionRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    class FilterSet(filters.FilterSet):
+        bucket__gte = filters.IsoDateTimeFilter(
+            field_name="bucket", lookup_expr="gte"
+        )
+        bucket__lt = filters.IsoDateTimeFilter(
+            field_name="bucket", lookup_expr="lt"
+        )
+
+        class Meta:
+            fields = ["code"]
+
+    ordering_fields = ("code", "bucket", "run_count", "duration_max")
+    ordering = ("-bucket",)
+    filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
+
+
+class HueyHourlyRollupViewSet(HueyExecutionRollupViewSet):
+    class FilterSet(HueyExecutionRollupViewSet.FilterSet):
+        class Meta(HueyExecutionRollupViewSet.FilterSet.Meta):
+            model = HueyHourlyRollup
+
+    serializer_class = HueyHourlyRollupSerializer
+    queryset = HueyHourlyRollup.objects.all()
+    filterset_class = FilterSet
+
+
+class HueyDailyRollupViewSet(HueyExecutionRollupViewSet):
+    class FilterSet(HueyExecutionRollupViewSet.FilterSet):
+        class Meta(HueyExecutionRollupViewSet.FilterSet.Meta):
+            model = HueyDailyRollup
+
+    serializer_class = HueyDailyRollupSerializer
+    queryset = HueyDailyRollup.objects.all()
+    filterset_class = FilterSet
+
+
+class HueyMetricsView(APIView):
+    """The metrics of 'register_log' in the Prometheus text format, read
+    from memory without queries."""
+
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request, format=None):
+        registry = get_metrics_registry()
+        if registry is None:
+            return Response("")
+        return Response(registry.render())
@@ -6,3 +6,16 @@ from django.apps import AppConfig
 
 class HueylogsConfig(AppConfig):
     name = "hueylogs"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from hueylogs.fulltext import clear_fulltext_cache, repair_fulltext
+        from hueylogs.signals import connect_signals, get_signals_settings
+
+        if get_signals_settings()["enabled"]:
+            connect_signals()
+        connection_created.connect(clear_fulltext_cache)
+        # a migration can drop the triggers of the SQLite full-text index
+        post_migrate.connect(repair_fulltext, sender=self)
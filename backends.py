@@ -0,0 +1,395 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import atexit
+import bisect
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class TaskOutcomes(object):
+    """The state of a task needed by 'max_tries', computed from its recent
+    outcomes. Has the attributes of HueyTaskStatus that 'max_tries' uses.
+
+    Arguments:
+        - outcomes: list of (start_time, is_success), most recent first
+    """
+
+    def __init__(self, outcomes):
+        self.last_start = outcomes[0][0] if outcomes else None
+        self.consecutive_failures = 0
+        for start_time, is_success in outcomes:
+            if is_success:
+                break
+            self.consecutive_failures += 1
+
+    def reached_max_tries(self, max_tries):
+        return self.consecutive_failures >= max_tries
+
+
+class LogBackend(object):
+    """Where 'register_log' writes the executions and 'max_tries' reads the
+    recent outcomes of a task from."""
+
+    def write_start(self, log_instance):
+        """Write the log of an execution that started."""
+        raise NotImplementedError
+
+    def write_finish(self, log_instance):
+        """Write the log of an execution that finished. The full traceback
+        of the failures is in 'log_instance.error_text'."""
+        raise NotImplementedError
+
+    def recent_outcomes(self, code, limit):
+        """Return the (start_time, is_success) of the last 'limit' finished
+        executions of 'code', most recent first."""
+        raise NotImplementedError
+
+    def task_status(self, code, max_tries):
+        """Return the state of the task used by 'max_tries' or None if the
+        task never finished."""
+        outcomes = self.recent_outcomes(code, max(max_tries, 1))
+        if not outcomes:
+            return None
+        return TaskOutcomes(outcomes)
+
+
+class DatabaseBackend(LogBackend):
+    """Write the logs with the Django ORM, the default backend.
+
+    Arguments:
+        - writer: a BufferedLogWriter to write the logs in batches, if None
+            each log is saved when it changes
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+
+    def write_start(self, log_instance):
+        type(log_instance)._write_log(log_instance, self.writer)
+
+    def write_finish(self, log_instance):
+        from hueylogs.models import HueyTraceback
+
+        if not log_instance.is_success and log_instance.traceback_id is None:
+            log_instance.traceback_id = HueyTraceback.store(
+                log_instance.error_text
+            )
+        if log_instance.last_heartbeat is not None and log_instance.pk:
+            # written at once, unless reap_crashed finished it meanwhile
+            if self._write_unless_crashed(log_instance):
+                type(log_instance)._logs_finished([log_instance])
+            return
+        type(log_instance)._write_log(log_instance, self.writer)
+        if self.writer is None:
+            type(log_instance)._logs_finished([log_instance])
+
+    def _write_unless_crashed(self, log_instance):
+        """Update the log if it is not marked as crashed, return True if it
+        was updated."""
+        model = type(log_instance)
+        values = {
+            field.attname: getattr(log_instance, field.attname)
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+        }
+        return bool(
+            model.objects.filter(pk=log_instance.pk, crashed=False).update(
+                **values
+            )
+        )
+
+    def recent_outcomes(self, code, limit):
+        from hueylogs.models import HueyExecutionLog
+
+        return list(
+            HueyExecutionLog.objects.filter(code=code)
+            .exclude(finnished=False)
+            .order_by("-start_time")
+            .values_list("start_time", "is_success")[:limit]
+        )
+
+    def task_status(self, code, max_tries):
+        from hueylogs.models import HueyTaskStatus
+
+        # one primary key lookup instead of reading the logs
+        return HueyTaskStatus.objects.filter(pk=code).first()
+
+
+def _log_record(event, log_instance):
+    """Return the fields of 'log_instance' that are serialized to JSON."""
+    record = {"event": event}
+    for field in log_instance._meta.concrete_fields:
+        if field.primary_key or field.is_relation:
+            continue
+        value = getattr(log_instance, field.attname)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        record[field.attname] = value
+    if event == "finish" and not log_instance.is_success:
+        record["error_text"] = log_instance.error_text
+    return record
+
+
+class FileBackend(LogBackend):
+    """Append the logs as JSON lines to segment files in a directory.
+
+    Each process writes its own segments, named by its creation time and
+    process id, and starts a new one when the current reaches
+    'segment_size' bytes. The lines are written when the log changes (so
+    other processes read them at once) and the file is fsynced after
+    'fsync_every' lines or 'fsync_interval' seconds, trading durability on
+    a machine crash for less disk flushes.
+
+    'recent_outcomes' reads the last 'max_outcomes' outcomes of each task
+    from memory. The segments are read once, the first time, and then only
+    the lines appended by other processes since the last read; the lines
+    written by this process are added when they are written.
+
+    Arguments:
+        - directory: where the segments are written
+        - segment_size: max bytes of a segment
+        - fsync_every: lines written between fsyncs
+        - fsync_interval: max seconds a line waits to be fsynced
+        - max_outcomes: how many outcomes are kept in memory by task
+    """
+
+    def __init__(
+        self,
+        directory,
+        segment_size=16 * 1024 * 1024,
+        fsync_every=100,
+        fsync_interval=1.0,
+        max_outcomes=100,
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_outcomes = max_outcomes
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._fd = None
+        self._path = None
+        # bytes of each segment already read and the outcomes by code,
+        # oldest first
+        self._tail_lock = threading.Lock()
+        self._offsets = {}
+        self._outcomes = {}
+        self._pid = None
+        self._segment_bytes = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        atexit.register(self.close)
+
+    def _open_segment(self):
+        name = "hueylogs-{:.6f}-{}.ndjson".format(time.time(), os.getpid())
+        self._path = os.path.join(self.directory, name)
+        self._fd = os.open(
+            self._path,
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644,
+        )
+        self._pid = os.getpid()
+        self._segment_bytes = 0
+
+    def _append(self, record):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode(
+            "utf-8"
+        )
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker: the segment of the parent is not ours
+                self._fd = None
+            if self._fd is None or self._segment_bytes >= self.segment_size:
+                self._sync()
+                if self._fd is not None:
+                    os.close(self._fd)
+                self._open_segment()
+            os.write(self._fd, line)
+            self._segment_bytes += len(line)
+            with self._tail_lock:
+                # our own lines are not read back
+                self._offsets[self._path] = self._segment_bytes
+                self._add_outcome(record)
+            self._unsynced += 1
+            if (
+                self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def write_start(self, log_instance):
+        # identifies the start and finish lines of the same execution
+        log_instance.backend_id = "{}-{}".format(os.getpid(), next(self._ids))
+        record = _log_record("start", log_instance)
+        record["id"] = log_instance.backend_id
+        self._append(record)
+
+    def write_finish(self, log_instance):
+        record = _log_record("finish", log_instance)
+        record["id"] = getattr(log_instance, "backend_id", None)
+        self._append(record)
+
+    def _segments(self):
+        """Return the paths of the segments, newest first."""
+        return sorted(
+            glob.glob(os.path.join(self.directory, "hueylogs-*.ndjson")),
+            key=lambda path: float(os.path.basename(path).split("-")[1]),
+            reverse=True,
+        )
+
+    def _add_outcome(self, record):
+        if record["event"] != "finish":
+            return
+        outcomes = self._outcomes.setdefault(record["code"], [])
+        bisect.insort(
+            outcomes,
+            (
+                datetime.fromisoformat(record["start_time"]),
+                record["is_success"],
+            ),
+        )
+        if len(outcomes) > self.max_outcomes:
+            del outcomes[0]
+
+    def _read_appended(self):
+        """Add the outcomes of the lines appended to the segments since the
+        last read."""
+        paths = self._segments()
+        for path in paths:
+            offset = self._offsets.get(path, 0)
+            try:
+                if os.path.getsize(path) <= offset:
+                    continue
+                with open(path, "rb") as segment:
+                    segment.seek(offset)
+                    data = segment.read()
+            except FileNotFoundError:
+                continue
+            # a line being written by other process is read the next time
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                self._add_outcome(record)
+            self._offsets[path] = offset + end
+        for path in set(self._offsets).difference(paths):
+            # deleted segments
+            del self._offsets[path]
+
+    def recent_outcomes(self, code, limit):
+        with self._tail_lock:
+            self._read_appended()
+            outcomes = self._outcomes.get(code, [])
+            return outcomes[::-1][:limit]
+
+    def close(self):
+        """Fsync and close the current segment."""
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                self._sync()
+                os.close(self._fd)
+            self._fd = None
+
+
+class HueyStorageBackend(LogBackend):
+    """Keep the recent outcomes of each task in the huey storage.
+
+    Only the last 'max_outcomes' finished executions of each task are kept,
+    so it is meant for checking 'max_tries' where the database is slow or
+    far, not for keeping the history. Two executions of the same task
+    finishing at the same time can lose one of the outcomes.
+
+    Arguments:
+        - huey: the Huey instance, default is the one of djhuey
+        - max_outcomes: how many outcomes are kept by task
+    """
+
+    key_prefix = "hueylogs.outcomes."
+
+    def __init__(self, huey=None, max_outcomes=100):
+        self._huey = huey
+        self.max_outcomes = max_outcomes
+
+    @property
+    def huey(self):
+        if self._huey is None:
+            from huey.contrib.djhuey import HUEY
+
+            self._huey = HUEY
+        return self._huey
+
+    def _read(self, code):
+        from huey.constants import EmptyData
+
+        data = self.huey.storage.peek_data(self.key_prefix + code)
+        if data is EmptyData:
+            return []
+        return json.loads(data.decode("utf-8"))
+
+    def write_start(self, log_instance):
+        pass
+
+    def write_finish(self, log_instance):
+        outcomes = self._read(log_instance.code)
+        outcomes.insert(
+            0,
+            [log_instance.start_time.isoformat(), log_instance.is_success],
+        )
+        self.huey.storage.put_data(
+            self.key_prefix + log_instance.code,
+            json.dumps(outcomes[: self.max_outcomes]).encode("utf-8"),
+        )
+
+    def recent_outcomes(self, code, limit):
+        return [
+            (datetime.fromisoformat(start_time), is_success)
+            for start_time, is_success in self._read(code)[:limit]
+        ]
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_default_backend():
+    """Return the backend configured by the 'HUEYLOGS_BACKEND' setting.
+
+    The setting is a dict with the dotted path of the backend class in
+    'backend' and its arguments, example:
+
+    HUEYLOGS_BACKEND = {
+        "backend": "hueylogs.backends.FileBackend",
+        "directory": "/var/log/hueylogs",
+    }
+
+    Without the setting the logs are written with the Django ORM.
+    """
+    global _default_backend
+    options = dict(getattr(settings, "HUEYLOGS_BACKEND", {}))
+    if not options:
+        return DatabaseBackend()
+    with _default_backend_lock:
+        if _default_backend is None:
+            backend_class = import_string(options.pop("backend"))
+            _default_backend = backend_class(**options)
+        return _default_backend
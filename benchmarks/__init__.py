@@ -0,0 +1,67 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.db import connections, router
+from django.utils import timezone
+
+from hueylogs.models import HueyExecutionLog, HueyExecutionProfile
+
+
+def _clear_logs(connection):
+    """Delete all the logs with raw SQL, the cascade of the ORM would load
+    every row into memory first."""
+    tables = [
+        connection.ops.quote_name(model._meta.db_table)
+        # the profiles reference the logs
+        for model in (HueyExecutionProfile, HueyExecutionLog)
+    ]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("TRUNCATE {}".format(", ".join(tables)))
+            return
+        for table in tables:
+            cursor.execute("DELETE FROM {}".format(table))
+
+
+def fill_logs(rows, codes=100, chunk_size=10000):
+    """Fill the log table with 'rows' logs of 'codes' different tasks.
+
+    The rows are inserted with raw 'executemany' because creating model
+    instances would dominate the time to fill millions of rows.
+    """
+    connection = connections[router.db_for_write(HueyExecutionLog)]
+    _clear_logs(connection)
+    columns = ["code", "start_time", "end_time", "is_success", "finnished"]
+    # the other not null columns get their default
+    defaults = [
+        (field.column, field.get_default())
+        for field in HueyExecutionLog._meta.concrete_fields
+        if not field.primary_key
+        and not field.null
+        and field.column not in columns
+    ]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        connection.ops.quote_name(HueyExecutionLog._meta.db_table),
+        ", ".join(columns + [column for column, value in defaults]),
+        ", ".join(["%s"] * (len(columns) + len(defaults))),
+    )
+    default_values = tuple(value for column, value in defaults)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for chunk_start in range(0, rows, chunk_size):
+            params = []
+            for i in range(chunk_start, min(chunk_start + chunk_size, rows)):
+                start_time = now - timedelta(minutes=rows - i)
+                params.append(
+                    (
+                        "benchmark.task_{}".format(i % codes),
+                        start_time,
+                        start_time + timedelta(seconds=1),
+                        i % 10 != 0,
+                        True,
+                    )
+                    + default_values
+                )
+            cursor.executemany(sql, params)
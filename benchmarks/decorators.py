@@ -0,0 +1,110 @@
+# coding: utf-8
+"""Per-call overhead and queries of the decorators, success and failure."""
+
+from __future__ import unicode_literals
+
+import time
+from datetime import time as datetimetime
+
+from django.db import connections, router
+from django.test.utils import CaptureQueriesContext
+
+from hueylogs.benchmarks import fill_logs
+from hueylogs.models import HueyExecutionLog, HueyExecutionSlot
+
+CALLS = 200
+QUERY_CALLS = 5
+# windows open all the time, so run_at_times and logs always run
+HOURS = [datetimetime(hour, 0) for hour in range(24)]
+MINUTES_TOLERANCE = 59
+
+
+def bench_task(fail):
+    if fail:
+        raise ValueError("benchmark error")
+
+
+def _stacks():
+    """Return the decorated functions by name, the functions receive
+    'fail' and are called as a huey consumer would call them."""
+    max_tries = 10**9
+    logs_task = HueyExecutionLog.logs(
+        hours=HOURS,
+        minutes_tolerance=MINUTES_TOLERANCE,
+        max_tries=max_tries,
+        lock=False,
+    )(bench_task)
+    return {
+        "bare": bench_task,
+        "register_log": HueyExecutionLog.register_log(bench_task),
+        "max_tries": HueyExecutionLog.max_tries(max_tries, 0)(
+            HueyExecutionLog.register_log(bench_task)
+        ),
+        "run_at_times": HueyExecutionLog.run_at_times(
+            HOURS, MINUTES_TOLERANCE
+        )(HueyExecutionLog.register_log(bench_task)),
+        "logs": logs_task.call_local,
+    }
+
+
+def _call(func, fail):
+    """Call 'func' and return how many seconds it took."""
+    # the window claimed by the last call is released, so every call runs
+    HueyExecutionSlot.objects.all().delete()
+    started = time.perf_counter()
+    try:
+        func(fail)
+    except Exception:
+        pass
+    return time.perf_counter() - started
+
+
+def _count_queries(connection, func, fail):
+    """Return the mean number of queries of the calls of 'func'."""
+    total = 0
+    for i in range(QUERY_CALLS):
+        HueyExecutionSlot.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                func(fail)
+            except Exception:
+                pass
+        total += len(queries)
+    return total / float(QUERY_CALLS)
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100.0), len(values) - 1)]
+
+
+def run(rows, options=None):
+    results = []
+    stacks = _stacks()
+    connection = connections[router.db_for_write(HueyExecutionLog)]
+    for size in rows:
+        fill_logs(size)
+        for fail in (False, True):
+            bare_mean = None
+            for name, func in stacks.items():
+                _call(func, fail)
+                durations = [_call(func, fail) for i in range(CALLS)]
+                mean = sum(durations) / len(durations)
+                if bare_mean is None:
+                    bare_mean = mean
+                results.append(
+                    {
+                        "rows": size,
+                        "decorator": name,
+                        "path": "failure" if fail else "success",
+                        "calls": CALLS,
+                        "mean_us": mean * 1e6,
+                        "p50_us": _percentile(durations, 50) * 1e6,
+                        "p95_us": _percentile(durations, 95) * 1e6,
+                        "overhead_us": (mean - bare_mean) * 1e6,
+                        "queries_per_call": _count_queries(
+                            connection, func, fail
+                        ),
+                    }
+                )
+    return results
@@ -0,0 +1,283 @@
+# coding: utf-8
+"""Concurrent load of the scheduling and retry decorators.
+
+Many workers (threads or processes) call the same periodic task at each
+tick of a simulated clock, like many huey consumers would, so a simulated
+day runs in seconds. Reports the throughput, the latency added by the
+decorators, the lock contention and if each window of 'run_at_times' ran
+exactly once.
+"""
+
+from __future__ import unicode_literals
+
+import contextlib
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from datetime import time as datetimetime
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connections
+from huey.exceptions import TaskLockedException
+
+from hueylogs.benchmarks import fill_logs
+from hueylogs.exceptions import HueyMaxTriesException
+from hueylogs.models import (
+    HueyExecutionLog,
+    HueyExecutionSlot,
+    HueyTaskStatus,
+)
+from hueylogs.schedule import Schedule
+
+# a window every hour, the clock moves a minute by tick
+HOURS = [datetimetime(hour, 0) for hour in range(24)]
+MINUTES_TOLERANCE = 10
+TICK = timedelta(minutes=1)
+SIMULATED_HOURS = 24
+MAX_TRIES = 3
+TRY_AGAIN_DELAY = 5
+FAILURE_RATE = 0.1
+# real seconds the task takes, so the executions of the workers overlap
+TASK_SECONDS = 0.002
+START = datetime(2020, 1, 1)
+
+
+class SimulatedClock(object):
+    """The time seen by the decorators, shared by the threads of a process.
+
+    Every worker sets it to the time of the tick before calling the task,
+    all of them set the same value since the ticks are synchronized by a
+    barrier.
+    """
+
+    def __init__(self):
+        self.local = START
+        self.utc = HueyExecutionLog.local_to_utc(START)
+
+    def set(self, local):
+        self.local = local
+        self.utc = HueyExecutionLog.local_to_utc(local)
+
+    @contextlib.contextmanager
+    def patch(self):
+        clock = self
+
+        class SimulatedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                if tz is None:
+                    return clock.local
+                return clock.utc.astimezone(tz)
+
+        with mock.patch("hueylogs.models.datetime", SimulatedDatetime):
+            with mock.patch("django.utils.timezone.now", lambda: clock.utc):
+                yield
+
+
+_clock = None
+_worker = threading.local()
+
+
+def _task_body():
+    _worker.executions.append(_clock.local)
+    time.sleep(TASK_SECONDS)
+    if _worker.random.random() < FAILURE_RATE:
+        raise ValueError("load error")
+
+
+def load_logs_task():
+    _task_body()
+
+
+def load_stacked_task():
+    _task_body()
+
+
+_scenarios = None
+
+
+def _get_scenarios():
+    """Return the decorated tasks by name, decorated once because huey
+    does not register the same task twice."""
+    global _scenarios
+    if _scenarios is None:
+        _scenarios = {
+            "logs": HueyExecutionLog.logs(
+                hours=HOURS,
+                minutes_tolerance=MINUTES_TOLERANCE,
+                max_tries=MAX_TRIES,
+                try_again_delay=TRY_AGAIN_DELAY,
+                lock=True,
+            )(load_logs_task).call_local,
+            "run_at_times": HueyExecutionLog.run_at_times(
+                HOURS, MINUTES_TOLERANCE
+            )(
+                HueyExecutionLog.max_tries(MAX_TRIES, TRY_AGAIN_DELAY)(
+                    HueyExecutionLog.register_log(load_stacked_task)
+                )
+            ),
+        }
+    return _scenarios
+
+
+def _work(func, barrier, ticks, seed):
+    """Call 'func' at every tick, return the latencies, outcomes and
+    executions of this worker."""
+    _worker.executions = []
+    _worker.random = random.Random(seed)
+    latencies = []
+    outcomes = {}
+    try:
+        for tick in range(ticks):
+            barrier.wait()
+            _clock.set(START + tick * TICK)
+            executed = len(_worker.executions)
+            started = time.perf_counter()
+            try:
+                func()
+                outcome = "ok"
+            except ValueError:
+                outcome = "failed"
+            except HueyMaxTriesException:
+                outcome = "max_tries"
+            except TaskLockedException:
+                outcome = "locked"
+            except Exception:
+                outcome = "error"
+            elapsed = time.perf_counter() - started
+            if len(_worker.executions) > executed:
+                # only the time added by the decorators
+                elapsed -= TASK_SECONDS
+            else:
+                outcome = "skipped" if outcome == "ok" else outcome
+            latencies.append(elapsed)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    finally:
+        connections.close_all()
+    return latencies, outcomes, _worker.executions
+
+
+def _process_work(func, barrier, ticks, seed, queue):
+    queue.put(_work(func, barrier, ticks, seed))
+
+
+def _run_workers(func, workers, worker_type, ticks):
+    """Return the results of each worker."""
+    if worker_type == "process":
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(workers)
+        queue = context.Queue()
+        # the connections can not be shared with the forked workers
+        connections.close_all()
+        processes = [
+            context.Process(
+                target=_process_work, args=(func, barrier, ticks, i, queue)
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        results = [queue.get() for process in processes]
+        for process in processes:
+            process.join()
+        return results
+    barrier = threading.Barrier(workers)
+    results = [None] * workers
+
+    def _thread_work(i):
+        results[i] = _work(func, barrier, ticks, i)
+
+    threads = [
+        threading.Thread(target=_thread_work, args=(i,))
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100.0), len(values) - 1)]
+
+
+def _window_counts(results, ticks):
+    """Return how many times the task ran in each window of the period."""
+    schedule = Schedule(HOURS, MINUTES_TOLERANCE)
+    counts = {}
+    for tick in range(ticks):
+        slot_start = schedule.slot_start(START + tick * TICK)
+        if slot_start is not None:
+            counts.setdefault(slot_start, 0)
+    for latencies, outcomes, executions in results:
+        for now in executions:
+            counts[schedule.slot_start(now)] += 1
+    return counts
+
+
+def run(rows, options=None):
+    global _clock
+    workers_list = [
+        int(i) for i in getattr(options, "workers", "4").split(",")
+    ]
+    worker_type = getattr(options, "worker_type", "thread")
+    ticks = int(SIMULATED_HOURS * timedelta(hours=1) / TICK)
+    scenarios = _get_scenarios()
+    _clock = SimulatedClock()
+    results = []
+    # 'max_tries' prints the skipped executions, the results go to stdout
+    with contextlib.redirect_stdout(sys.stderr), _clock.patch():
+        for size in rows:
+            fill_logs(size)
+            for workers in workers_list:
+                for name, func in scenarios.items():
+                    HueyExecutionSlot.objects.all().delete()
+                    HueyTaskStatus.objects.all().delete()
+                    started = time.perf_counter()
+                    worker_results = _run_workers(
+                        func, workers, worker_type, ticks
+                    )
+                    elapsed = time.perf_counter() - started
+                    latencies = []
+                    outcomes = {}
+                    for (
+                        worker_latencies,
+                        worker_outcomes,
+                        executions,
+                    ) in worker_results:
+                        latencies.extend(worker_latencies)
+                        for outcome, count in worker_outcomes.items():
+                            outcomes[outcome] = (
+                                outcomes.get(outcome, 0) + count
+                            )
+                    counts = _window_counts(worker_results, ticks)
+                    results.append(
+                        {
+                            "rows": size,
+                            "decorator": name,
+                            "worker_type": worker_type,
+                            "workers": workers,
+                            "calls": len(latencies),
+                            "calls_per_second": len(latencies) / elapsed,
+                            "p50_us": _percentile(latencies, 50) * 1e6,
+                            "p99_us": _percentile(latencies, 99) * 1e6,
+                            "outcomes": outcomes,
+                            "lock_contention": outcomes.get("locked", 0),
+                            "windows": len(counts),
+                            "duplicate_slot_executions": sum(
+                                count - 1
+                                for count in counts.values()
+                                if count > 1
+                            ),
+                            "missed_slots": sum(
+                                1 for count in counts.values() if not count
+                            ),
+                        }
+                    )
+    return results
@@ -0,0 +1,49 @@
+# coding: utf-8
+"""Query plans of the lookups done by the decorators and the API."""
+
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+
+from hueylogs.api_views import HueyExecutionLogViewSet
+from hueylogs.benchmarks import fill_logs
+from hueylogs.models import HueyExecutionLog, HueyTaskStatus
+
+INDEX_NAME = "hueylogs_code_start_idx"
+
+
+def _querysets():
+    code = "benchmark.task_1"
+    filterset = HueyExecutionLogViewSet.FilterSet(
+        data={"start_time__gte": date.today() - timedelta(days=1)},
+        queryset=HueyExecutionLog.objects.all(),
+    )
+    return {
+        "last_executions": HueyExecutionLog.objects.filter(code=code)
+        .order_by("-start_time")
+        .values_list("start_time", "is_success")[:3],
+        "task_status": HueyTaskStatus.objects.filter(pk=code),
+        "api_start_time_filter": filterset.qs,
+        "running_executions": HueyExecutionLog.objects.filter(
+            finnished=False
+        ).order_by("start_time"),
+    }
+
+
+def run(rows, options=None):
+    results = []
+    for size in rows:
+        fill_logs(size)
+        for name, queryset in _querysets().items():
+            plan = queryset.explain()
+            results.append(
+                {
+                    "rows": size,
+                    "query": name,
+                    "plan": plan,
+                    "uses_index": "USING INDEX" in plan
+                    or "USING COVERING INDEX" in plan,
+                    "uses_code_start_index": INDEX_NAME in plan,
+                }
+            )
+    return results
@@ -0,0 +1,146 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, timedelta
+
+EXPORT_NDJSON = "ndjson"
+EXPORT_CSV = "csv"
+EXPORT_FORMATS = (EXPORT_NDJSON, EXPORT_CSV)
+
+# columns of HueyExecutionLog exported, the full traceback can be found by
+# 'traceback_id' in HueyTraceback or exported with 'tracebacks=True'
+EXPORT_FIELDS = (
+    "id",
+    "code",
+    "start_time",
+    "end_time",
+    "is_success",
+    "finnished",
+    "crashed",
+    "error_description",
+    "error_fingerprint",
+    "traceback_id",
+    "weight",
+    "wall_time",
+    "cpu_user_time",
+    "cpu_system_time",
+    "rss_delta",
+    "memory_peak",
+    "queue_wait",
+)
+
+# the full traceback column, after the others
+TRACEBACK_FIELD = "traceback"
+
+# bytes joined before being yielded, so each row is not a write
+BATCH_SIZE = 64 * 1024
+
+
+def _json_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+def _ndjson_lines(rows, fields):
+    for row in rows:
+        record = dict(zip(fields, (_json_value(i) for i in row)))
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def _csv_lines(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def _line(values):
+        writer.writerow(values)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield _line(fields)
+    for row in rows:
+        yield _line([_json_value(i) for i in row])
+
+
+def _with_tracebacks(rows):
+    # the last value is the compressed traceback
+    for row in rows:
+        if row[-1] is not None:
+            text = zlib.decompress(bytes(row[-1])).decode("utf-8")
+            row = row[:-1] + (text,)
+        yield row
+
+
+def _batched(lines):
+    batch = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        batch.append(data)
+        size += len(data)
+        if size >= BATCH_SIZE:
+            yield b"".join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield b"".join(batch)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_logs(
+    queryset,
+    file_format=EXPORT_NDJSON,
+    compress=False,
+    chunk_size=2000,
+    tracebacks=False,
+):
+    """Return an iterator of the bytes of the logs of 'queryset' exported as
+    NDJSON or CSV.
+
+    The rows are read as tuples with a server-side cursor where the
+    database supports it, 'chunk_size' rows at a time, so the memory used
+    does not depend on how many logs are exported.
+
+    Arguments:
+        - queryset: the HueyExecutionLog queryset, its ordering is kept
+        - file_format: 'ndjson' (one JSON object by line) or 'csv' (with
+            a header)
+        - compress: if True the bytes are compressed with gzip
+        - chunk_size: rows fetched from the database at a time
+        - tracebacks: if True the full traceback text of the failures is
+            exported in the 'traceback' column, read with a join
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError("Invalid export format: {}".format(file_format))
+    fields = EXPORT_FIELDS
+    columns = EXPORT_FIELDS
+    if tracebacks:
+        fields += ("traceback__compressed_text",)
+        columns += (TRACEBACK_FIELD,)
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    if tracebacks:
+        rows = _with_tracebacks(rows)
+    if file_format == EXPORT_CSV:
+        lines = _csv_lines(rows, columns)
+    else:
+        lines = _ndjson_lines(rows, columns)
+    chunks = _batched(lines)
+    if compress:
+        chunks = _gzipped(chunks)
+    return chunks
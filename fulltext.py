@@ -0,0 +1,417 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import re
+import zlib
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+# the SQLite virtual tables and triggers
+FULLTEXT_SUFFIX = "_fts"
+TRIGGER_EVENTS = ("insert", "delete", "update")
+# the PostgreSQL expression index of the logs, created by the migration
+# 0020_fulltext_indexes, the queries repeat the expression to use it
+FULLTEXT_INDEX = "hueylogs_log_search_idx"
+LOG_VECTOR = (
+    "to_tsvector('simple', "
+    "coalesce(code, '') || ' ' || coalesce(error_description, ''))"
+)
+# the text of the tracebacks is only stored compressed, its words are
+# indexed by 'search_key' in a table filled by HueyTraceback.store, created
+# by the migration 0021_remove_hueytraceback_search_text on PostgreSQL
+FULLTEXT_TRACEBACK_TABLE = "hueylogs_traceback_search"
+FULLTEXT_TRACEBACK_INDEX = "hueylogs_traceback_search_idx"
+# tracebacks read at a time to fill the index
+CHUNK_SIZE = 1000
+
+_word_re = re.compile(r"\w+", re.UNICODE)
+
+
+def _log_model():
+    from hueylogs.models import HueyExecutionLog
+
+    return HueyExecutionLog
+
+
+def _traceback_model():
+    from hueylogs.models import HueyTraceback
+
+    return HueyTraceback
+
+
+def _names(connection):
+    table = _log_model()._meta.db_table
+    traceback_table = _traceback_model()._meta.db_table
+    quote_name = connection.ops.quote_name
+    return {
+        "table": quote_name(table),
+        "fts": quote_name(table + FULLTEXT_SUFFIX),
+        "fts_name": table + FULLTEXT_SUFFIX,
+        "index": quote_name(FULLTEXT_INDEX),
+        "log_vector": LOG_VECTOR,
+        "trigger": table + FULLTEXT_SUFFIX,
+        "traceback_table": quote_name(traceback_table),
+        "traceback_fts": quote_name(traceback_table + FULLTEXT_SUFFIX),
+        "traceback_fts_name": traceback_table + FULLTEXT_SUFFIX,
+        "traceback_search": quote_name(FULLTEXT_TRACEBACK_TABLE),
+        "traceback_index": quote_name(FULLTEXT_TRACEBACK_INDEX),
+    }
+
+
+def _sqlite_objects(names):
+    """Return the names of the tables and triggers of the SQLite index."""
+    objects = [names["fts_name"], names["traceback_fts_name"]]
+    for event in TRIGGER_EVENTS:
+        objects.append("{}_{}".format(names["trigger"], event))
+    return objects
+
+
+def supports_fulltext(connection):
+    """True if the database of 'connection' has a full-text index that
+    'enable_fulltext' can create, SQLite with FTS5 or PostgreSQL."""
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in [row[0] for row in cursor.fetchall()]
+
+
+def _fulltext_created(connection):
+    """Return True if all the index is in the database, on SQLite a table
+    remake (of 'migrate') drops the triggers that keep it in sync."""
+    names = _names(connection)
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            objects = _sqlite_objects(names)
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name IN ({})".format(
+                    ", ".join(["%s"] * len(objects))
+                ),
+                objects,
+            )
+            return cursor.fetchone()[0] == len(objects)
+        if connection.vendor == "postgresql":
+            # an index that failed to be built concurrently is not valid
+            cursor.execute(
+                "SELECT count(*) FROM pg_class c "
+                "JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname IN (%s, %s) AND i.indisvalid",
+                [FULLTEXT_INDEX, FULLTEXT_TRACEBACK_INDEX],
+            )
+            return cursor.fetchone()[0] == 2
+    return False
+
+
+def fulltext_enabled(connection):
+    """True if 'enable_fulltext' was run in the database of 'connection'.
+
+    Checked once by database connection, 'repair_fulltext' recreates the
+    triggers that a migration dropped.
+    """
+    enabled = getattr(connection, "hueylogs_fulltext", None)
+    if enabled is None:
+        enabled = connection.hueylogs_fulltext = _fulltext_created(connection)
+    return enabled
+
+
+def clear_fulltext_cache(connection, **kwargs):
+    """Forget if the index is enabled, connected to 'connection_created'."""
+    connection.hueylogs_fulltext = None
+
+
+def enable_fulltext(using=None):
+    """Create the full-text index of 'code' and 'error_description' of the
+    logs and of the text of the tracebacks, and fill it with the rows
+    already written.
+
+    On SQLite they are FTS5 tables, the one of the logs kept in sync by
+    triggers, so every write of the logs (also the bulk ones of the buffered
+    writer) updates it. On PostgreSQL they are GIN indexes created by the
+    migrations, this only builds them again (concurrently, so outside a
+    transaction) if they were dropped. The tracebacks, stored compressed,
+    are indexed by HueyTraceback.store. Return False if the database does
+    not support it.
+
+    Arguments:
+        - using: the database alias, default is the one of the logs
+    """
+    connection = connections[using or router.db_for_write(_log_model())]
+    if not supports_fulltext(connection):
+        return False
+    names = _names(connection)
+    if connection.vendor == "sqlite":
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            "code, error_description, content={table}, content_rowid=id)",
+            "CREATE TRIGGER IF NOT EXISTS {trigger}_insert AFTER INSERT "
+            "ON {table} BEGIN "
+            "INSERT INTO {fts}(rowid, code, error_description) "
+            "VALUES (new.id, new.code, new.error_description); END",
+            "CREATE TRIGGER IF NOT EXISTS {trigger}_delete AFTER DELETE "
+            "ON {table} BEGIN "
+            "INSERT INTO {fts}({fts}, rowid, code, error_description) "
+            "VALUES ('delete', old.id, old.code, old.error_description); END",
+            "CREATE TRIGGER IF NOT EXISTS {trigger}_update AFTER UPDATE "
+            "OF code, error_description ON {table} BEGIN "
+            "INSERT INTO {fts}({fts}, rowid, code, error_description) "
+            "VALUES ('delete', old.id, old.code, old.error_description); "
+            "INSERT INTO {fts}(rowid, code, error_description) "
+            "VALUES (new.id, new.code, new.error_description); END",
+            # contentless, the text of the tracebacks is only stored
+            # compressed, indexed by 'search_key' because the implicit rowid
+            # of a table with a text primary key can be renumbered
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {traceback_fts} "
+            "USING fts5(text, content='')",
+            "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+            "INSERT INTO {traceback_fts}({traceback_fts}) "
+            "VALUES ('delete-all')",
+        ]
+    else:
+        # without rewriting nor locking the tables
+        statements = [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} "
+            "USING GIN ({log_vector})",
+            "CREATE TABLE IF NOT EXISTS {traceback_search} ("
+            "search_key bigint PRIMARY KEY, search_vector tsvector NOT NULL)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS {traceback_index} "
+            "ON {traceback_search} USING GIN (search_vector)",
+        ]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(**names))
+    _index_all_tracebacks(connection)
+    clear_fulltext_cache(connection)
+    return True
+
+
+def _index_statement(connection):
+    """Return the statement that indexes a traceback once, its parameters
+    are 'search_key' and the text."""
+    if connection.vendor == "sqlite":
+        statement = (
+            "INSERT INTO {traceback_fts}(rowid, text) SELECT %s, %s "
+            "WHERE NOT EXISTS "
+            "(SELECT 1 FROM {traceback_fts} WHERE rowid = %s)"
+        )
+    else:
+        statement = (
+            "INSERT INTO {traceback_search} (search_key, search_vector) "
+            "VALUES (%s, to_tsvector('simple', %s)) ON CONFLICT DO NOTHING"
+        )
+    return statement.format(**_names(connection))
+
+
+def _index_params(connection, search_key, text):
+    if connection.vendor == "sqlite":
+        return [search_key, text, search_key]
+    return [search_key, text]
+
+
+def _index_all_tracebacks(connection):
+    """Index the tracebacks already stored, 'CHUNK_SIZE' at a time."""
+    statement = _index_statement(connection)
+    queryset = (
+        _traceback_model()
+        .objects.using(connection.alias)
+        .only("digest", "search_key", "compressed_text")
+        .order_by("digest")
+    )
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(digest__gt=last)
+        chunk = list(chunk[:CHUNK_SIZE])
+        if not chunk:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                statement,
+                [
+                    _index_params(connection, i.search_key, i.text)
+                    for i in chunk
+                ],
+            )
+        last = chunk[-1].pk
+
+
+def index_traceback(using, search_key, text):
+    """Add a traceback to the index, if enabled and not already in it,
+    called by HueyTraceback.store.
+
+    Arguments:
+        - using: the database alias of the tracebacks
+        - search_key: the 'search_key' of the traceback
+        - text: its text
+    """
+    connection = connections[using]
+    if not fulltext_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _index_statement(connection),
+            _index_params(connection, search_key, text),
+        )
+
+
+def unindex_tracebacks(queryset):
+    """Remove the tracebacks of 'queryset' from the index, called before
+    they are deleted.
+
+    Arguments:
+        - queryset: a HueyTraceback queryset
+    """
+    connection = connections[queryset.db]
+    if not fulltext_enabled(connection):
+        return
+    names = _names(connection)
+    rows = dict(queryset.values_list("search_key", "compressed_text"))
+    if not rows:
+        return
+    placeholders = ", ".join(["%s"] * len(rows))
+    with connection.cursor() as cursor:
+        if connection.vendor != "sqlite":
+            cursor.execute(
+                "DELETE FROM {} WHERE search_key IN ({})".format(
+                    names["traceback_search"], placeholders
+                ),
+                list(rows),
+            )
+            return
+        # a contentless table deletes with the text that was indexed, only
+        # the rows that are in it
+        cursor.execute(
+            "SELECT rowid FROM {} WHERE rowid IN ({})".format(
+                names["traceback_fts"], placeholders
+            ),
+            list(rows),
+        )
+        indexed = [row[0] for row in cursor.fetchall()]
+        cursor.executemany(
+            "INSERT INTO {traceback_fts}({traceback_fts}, rowid, text) "
+            "VALUES ('delete', %s, %s)".format(**names),
+            [
+                [key, zlib.decompress(bytes(rows[key])).decode("utf-8")]
+                for key in indexed
+            ],
+        )
+
+
+def repair_fulltext(using=None, **kwargs):
+    """Recreate the SQLite triggers of the index dropped by a table remake
+    and fill it again, connected to 'post_migrate'.
+
+    Arguments:
+        - using: the database alias, default is the one of the logs
+    """
+    connection = connections[using or router.db_for_write(_log_model())]
+    clear_fulltext_cache(connection)
+    if connection.vendor != "sqlite":
+        return
+    names = _names(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [names["fts_name"]],
+        )
+        if cursor.fetchone() is None:
+            # not enabled
+            return
+    if not _fulltext_created(connection):
+        enable_fulltext(connection.alias)
+
+
+def disable_fulltext(using=None):
+    """Drop what 'enable_fulltext' created.
+
+    Arguments:
+        - using: the database alias, default is the one of the logs
+    """
+    connection = connections[using or router.db_for_write(_log_model())]
+    names = _names(connection)
+    if connection.vendor == "sqlite":
+        statements = [
+            "DROP TRIGGER IF EXISTS {}".format(name)
+            for name in _sqlite_objects(names)[2:]
+        ]
+        statements += [
+            "DROP TABLE IF EXISTS {fts}",
+            "DROP TABLE IF EXISTS {traceback_fts}",
+        ]
+    elif connection.vendor == "postgresql":
+        statements = [
+            "DROP INDEX CONCURRENTLY IF EXISTS {index}",
+            "DROP TABLE IF EXISTS {traceback_search}",
+        ]
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(**names))
+    clear_fulltext_cache(connection)
+
+
+def _fts5_query(terms):
+    # every term is a quoted prefix, so its punctuation is not syntax
+    return " AND ".join(
+        '"{}"*'.format(term.replace('"', '""')) for term in terms
+    )
+
+
+def _tsquery(terms):
+    words = [word for term in terms for word in _word_re.findall(term)]
+    return " & ".join("{}:*".format(word) for word in words)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """Search the logs with the full-text index created by
+    'enable_fulltext', the terms match the words of 'code' and
+    'error_description' or of the traceback that start with them.
+
+    Without the index, like on databases that do not support it, the
+    search is done by 'search_fields' as SearchFilter does, the tracebacks
+    are then not searched since their text is only stored compressed.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        connection = connections[queryset.db]
+        if not fulltext_enabled(connection):
+            return super(FullTextSearchFilter, self).filter_queryset(
+                request, queryset, view
+            )
+        names = _names(connection)
+        if connection.vendor == "sqlite":
+            query = _fts5_query(terms)
+            sql = "SELECT rowid FROM {fts} WHERE {fts} MATCH %s"
+            traceback_sql = (
+                "SELECT digest FROM {traceback_table} WHERE search_key IN "
+                "(SELECT rowid FROM {traceback_fts} "
+                "WHERE {traceback_fts} MATCH %s)"
+            )
+        else:
+            query = _tsquery(terms)
+            sql = (
+                "SELECT id FROM {table} "
+                "WHERE {log_vector} @@ to_tsquery('simple', %s)"
+            )
+            traceback_sql = (
+                "SELECT digest FROM {traceback_table} WHERE search_key IN "
+                "(SELECT search_key FROM {traceback_search} "
+                "WHERE search_vector @@ to_tsquery('simple', %s))"
+            )
+        if not query:
+            return super(FullTextSearchFilter, self).filter_queryset(
+                request, queryset, view
+            )
+        return queryset.filter(
+            Q(pk__in=RawSQL(sql.format(**names), [query]))
+            | Q(
+                traceback_id__in=RawSQL(traceback_sql.format(**names), [query])
+            )
+        )
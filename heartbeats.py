@@ -0,0 +1,155 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger("hueylogs")
+
+
+def get_heartbeat_settings():
+    """Return the 'HUEYLOGS_HEARTBEAT' setting with the default values.
+
+    Example of the setting:
+
+    HUEYLOGS_HEARTBEAT = {
+        "interval": 60,  # seconds between the heartbeats
+        "stale_after": 300,  # seconds without heartbeat to be crashed
+        "crontab": {"minute": "*/5"},  # reap the crashed periodically
+    }
+    """
+    options = {"interval": 60, "stale_after": 300, "crontab": None}
+    options.update(getattr(settings, "HUEYLOGS_HEARTBEAT", {}))
+    return options
+
+
+class Heartbeat(object):
+    """Update 'last_heartbeat' of the logs of the running executions.
+
+    Only one background thread is used for all the executions of the
+    process, every 'interval' seconds it updates all of them with one query.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._logs = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = os.getpid()
+
+    def add(self, log_instance):
+        with self._condition:
+            if self._pid != os.getpid():
+                # forked worker: the thread of the parent is not ours
+                self._logs = {}
+                self._thread = None
+                self._pid = os.getpid()
+            self._logs[id(log_instance)] = log_instance
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="hueylogs-heartbeat"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+    def remove(self, log_instance):
+        with self._condition:
+            self._logs.pop(id(log_instance), None)
+
+    def beat(self):
+        """Update the running logs, return how many were updated."""
+        with self._condition:
+            logs = list(self._logs.values())
+        # buffered logs not written yet have no pk
+        pks = [i.pk for i in logs if i.pk is not None]
+        if not pks:
+            return 0
+        model = type(logs[0])
+        return model.objects.filter(pk__in=pks, finnished=False).update(
+            last_heartbeat=timezone.now()
+        )
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait(self.interval)
+                try:
+                    self.beat()
+                except Exception:
+                    logger.exception("hueylogs could not update heartbeats")
+        finally:
+            connections.close_all()
+
+
+_heartbeat = None
+_heartbeat_lock = threading.Lock()
+
+
+def get_heartbeat():
+    """Return the Heartbeat shared by all the executions."""
+    global _heartbeat
+    with _heartbeat_lock:
+        if _heartbeat is None:
+            _heartbeat = Heartbeat(get_heartbeat_settings()["interval"])
+        return _heartbeat
+
+
+def reap_crashed(stale_after=None, now=None):
+    """Mark as crashed the running executions without a recent heartbeat.
+
+    They are finished as failures, so 'max_tries' counts them, and the
+    window of 'run_at_times' they claimed is released so it can run again.
+    If a marked execution finishes later its finish is not written, it is
+    already counted as crashed. Return how many executions were marked.
+
+    Arguments:
+        - stale_after: seconds or timedelta without heartbeat, default is
+            'stale_after' of the 'HUEYLOGS_HEARTBEAT' setting
+        - now: datetime used as the current time
+    """
+    from hueylogs.models import HueyExecutionLog, HueyExecutionSlot
+
+    if stale_after is None:
+        stale_after = get_heartbeat_settings()["stale_after"]
+    if not isinstance(stale_after, timedelta):
+        stale_after = timedelta(seconds=stale_after)
+    now = now or timezone.now()
+    # served by the partial index of the unfinished logs
+    stale = list(
+        HueyExecutionLog.objects.filter(
+            finnished=False, last_heartbeat__lt=now - stale_after
+        )
+    )
+    crashed = []
+    for log_instance in stale:
+        updated = HueyExecutionLog.objects.filter(
+            pk=log_instance.pk, finnished=False
+        ).update(
+            finnished=True,
+            is_success=False,
+            crashed=True,
+            end_time=log_instance.last_heartbeat,
+            error_description="Crashed, no heartbeat since {}".format(
+                log_instance.last_heartbeat.isoformat()
+            ),
+        )
+        # finished by the execution meanwhile
+        if not updated:
+            continue
+        log_instance.refresh_from_db()
+        crashed.append(log_instance)
+        if log_instance.claimed_slot is not None:
+            HueyExecutionSlot.release(
+                log_instance.code, log_instance.claimed_slot
+            )
+    if crashed:
+        HueyExecutionLog._logs_finished(crashed)
+    logger.info("hueylogs marked %s executions as crashed", len(crashed))
+    return len(crashed)
@@ -0,0 +1,103 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import sys
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from hueylogs.export import EXPORT_FORMATS, EXPORT_NDJSON, export_logs
+from hueylogs.models import HueyExecutionLog
+
+
+def _day_start(value):
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError("Invalid date, use YYYY-MM-DD: {}".format(value))
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the logs as NDJSON or CSV, streamed from the database so "
+        "the memory used does not grow with the number of logs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            dest="file_format",
+            choices=EXPORT_FORMATS,
+            default=EXPORT_NDJSON,
+        )
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="file where the logs are written, default is stdout",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="compress the output with gzip",
+        )
+        parser.add_argument("--code", help="export only the logs of a task")
+        parser.add_argument(
+            "--since",
+            help="export the logs started in this day (YYYY-MM-DD) or after",
+        )
+        parser.add_argument(
+            "--until",
+            help="export the logs started in this day (YYYY-MM-DD) or before",
+        )
+        parser.add_argument(
+            "--failures",
+            action="store_true",
+            help="export only the failures",
+        )
+        parser.add_argument(
+            "--tracebacks",
+            action="store_true",
+            help="add the full traceback of the failures",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="rows fetched from the database at a time",
+        )
+
+    def handle(self, *args, **options):
+        queryset = HueyExecutionLog.objects.order_by("start_time", "pk")
+        if options["code"]:
+            queryset = queryset.filter(code=options["code"])
+        if options["since"]:
+            queryset = queryset.filter(
+                start_time__gte=_day_start(options["since"])
+            )
+        if options["until"]:
+            queryset = queryset.filter(
+                start_time__lt=_day_start(options["until"]) + timedelta(days=1)
+            )
+        if options["failures"]:
+            queryset = queryset.filter(is_success=False).exclude(
+                finnished=False
+            )
+        chunks = export_logs(
+            queryset,
+            options["file_format"],
+            options["gzip"],
+            options["chunk_size"],
+            options["tracebacks"],
+        )
+        if options["output"] == "-":
+            # the bytes are written to the binary stream under stdout
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+            return
+        with open(options["output"], "wb") as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,36 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hueylogs.fulltext import disable_fulltext, enable_fulltext
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the full-text index used by '?search=' of the logs API "
+        "(SQLite FTS5), filled with the logs already written. On PostgreSQL "
+        "the migrations create it, this only builds it again if dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--disable",
+            action="store_true",
+            help="drop the index, the search goes back to 'icontains'",
+        )
+        parser.add_argument(
+            "--database",
+            help="database alias, default is the one of the logs",
+        )
+
+    def handle(self, *args, **options):
+        if options["disable"]:
+            disable_fulltext(options["database"])
+            self.stdout.write(self.style.SUCCESS("Full-text index dropped"))
+            return
+        if not enable_fulltext(options["database"]):
+            raise CommandError(
+                "The database does not support the full-text index"
+            )
+        self.stdout.write(self.style.SUCCESS("Full-text index created"))
@@ -0,0 +1,44 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from hueylogs.retention import prune_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the logs out of the retention configured in the "
+        "'HUEYLOGS_RETENTION' setting, the arguments override the setting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=float,
+            help="days after which the logs are deleted",
+        )
+        parser.add_argument(
+            "--keep-last",
+            type=int,
+            help="how many logs of each task are kept",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="max number of logs deleted by query",
+        )
+
+    def handle(self, *args, **options):
+        report = prune_logs(
+            max_age=options["max_age"],
+            keep_last=options["keep_last"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{deleted} logs, {slots_deleted} slots and "
+                "{tracebacks_deleted} tracebacks deleted in "
+                "{elapsed:.2f} seconds".format(**report)
+            )
+        )
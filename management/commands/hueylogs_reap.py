@@ -0,0 +1,28 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from hueylogs.heartbeats import reap_crashed
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark as crashed the running executions without a heartbeat for "
+        "'stale_after' seconds of the 'HUEYLOGS_HEARTBEAT' setting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale-after",
+            type=float,
+            help="seconds without heartbeat to mark an execution as crashed",
+        )
+
+    def handle(self, *args, **options):
+        crashed = reap_crashed(stale_after=options["stale_after"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} executions marked as crashed".format(crashed)
+            )
+        )
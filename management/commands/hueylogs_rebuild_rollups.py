@@ -0,0 +1,62 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from hueylogs.models import (
+    HueyDailyRollup,
+    HueyExecutionLog,
+    HueyHourlyRollup,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hourly and daily rollups from the logs. The logs "
+        "finished while it runs can be counted twice, so prefer to run it "
+        "with the consumers stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="how many logs are read and aggregated at once",
+        )
+        parser.add_argument(
+            "--code", help="rebuild only the rollups of this task"
+        )
+
+    def handle(self, *args, **options):
+        rollup_models = (HueyHourlyRollup, HueyDailyRollup)
+        # logs from before the 'finnished' field have it null
+        logs = (
+            HueyExecutionLog.objects.exclude(finnished=False)
+            .only("code", "start_time", "end_time", "is_success", "weight")
+            .order_by("pk")
+        )
+        if options["code"]:
+            logs = logs.filter(code=options["code"])
+        for model in rollup_models:
+            rollups = model.objects.all()
+            if options["code"]:
+                rollups = rollups.filter(code=options["code"])
+            rollups.delete()
+
+        last_pk = 0
+        total = 0
+        while True:
+            chunk = list(logs.filter(pk__gt=last_pk)[: options["chunk_size"]])
+            if not chunk:
+                break
+            with transaction.atomic(
+                using=router.db_for_write(HueyHourlyRollup)
+            ):
+                for model in rollup_models:
+                    model.record(chunk)
+            last_pk = chunk[-1].pk
+            total += len(chunk)
+            self.stdout.write("{} logs aggregated".format(total))
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt"))
@@ -0,0 +1,319 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import atexit
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+logger = logging.getLogger("hueylogs")
+
+
+def get_metrics_settings():
+    """Return the 'HUEYLOGS_METRICS' setting with the default values.
+
+    Example of the setting:
+
+    HUEYLOGS_METRICS = {
+        "enabled": True,  # count the calls of register_log in memory
+        # with process workers, each process writes its metrics here and
+        # the view sums them
+        "multiprocess_dir": "/var/run/hueylogs-metrics",
+        "flush_interval": 1.0,  # seconds between the writes of a process
+    }
+    """
+    options = {
+        "enabled": True,
+        "multiprocess_dir": None,
+        "flush_interval": 1.0,
+    }
+    options.update(getattr(settings, "HUEYLOGS_METRICS", {}))
+    return options
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_bound(bound):
+    return "{:g}".format(bound)
+
+
+class _TaskMetrics(object):
+    def __init__(self, buckets):
+        self.runs = 0
+        self.successes = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.duration_sum = 0.0
+        # the last bucket counts the durations greater than the last bound
+        self.duration_buckets = [0] * (len(buckets) + 1)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def add(self, data):
+        for name, value in data.items():
+            if name == "duration_buckets":
+                self.duration_buckets = [
+                    i + j for i, j in zip(self.duration_buckets, value)
+                ]
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+
+class MetricsRegistry(object):
+    """Counters of the calls of each task, kept in memory.
+
+    For each task code it counts the runs, successes and failures, the
+    calls in flight and a histogram of the durations. Updating it is a dict
+    lookup under a lock, reading it never touches the database.
+
+    Arguments:
+        - buckets: upper bounds, in seconds, of the duration histogram
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._tasks = {}
+        self._pid = os.getpid()
+
+    def _task(self, code):
+        if self._pid != os.getpid():
+            # forked worker: the calls of the parent are not ours
+            self._reset()
+        task = self._tasks.get(code)
+        if task is None:
+            task = self._tasks[code] = _TaskMetrics(self.buckets)
+        return task
+
+    def start(self, code):
+        """Count a call of 'code' that started."""
+        with self._lock:
+            self._task(code).in_flight += 1
+
+    def finish(self, code, duration, is_success):
+        """Count a call of 'code' that finished.
+
+        Arguments:
+            - code: the task code
+            - duration: seconds the call took
+            - is_success: if the call did not raise
+        """
+        with self._lock:
+            task = self._task(code)
+            task.in_flight -= 1
+            task.runs += 1
+            if is_success:
+                task.successes += 1
+            else:
+                task.failures += 1
+            task.duration_sum += duration
+            task.duration_buckets[bisect_left(self.buckets, duration)] += 1
+
+    def snapshot(self):
+        """Return the metrics of each task code as dicts."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return {code: task.to_dict() for code, task in self._tasks.items()}
+
+    def collect(self):
+        """Return the metrics of each task code, the ones of all the
+        processes in multiprocess mode."""
+        return self.snapshot()
+
+    def render(self):
+        """Return the metrics in the Prometheus text format."""
+        tasks = self.collect()
+        lines = []
+
+        def _add(name, kind, help_text, attribute):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for code in sorted(tasks):
+                lines.append(
+                    '{}{{code="{}"}} {}'.format(
+                        name, _escape(code), tasks[code][attribute]
+                    )
+                )
+
+        _add("hueylogs_runs_total", "counter", "Finished calls.", "runs")
+        _add(
+            "hueylogs_successes_total",
+            "counter",
+            "Calls that succeeded.",
+            "successes",
+        )
+        _add(
+            "hueylogs_failures_total",
+            "counter",
+            "Calls that raised.",
+            "failures",
+        )
+        _add(
+            "hueylogs_in_flight",
+            "gauge",
+            "Calls running now.",
+            "in_flight",
+        )
+        name = "hueylogs_duration_seconds"
+        lines.append("# HELP {} Duration of the calls.".format(name))
+        lines.append("# TYPE {} histogram".format(name))
+        for code in sorted(tasks):
+            task = tasks[code]
+            cumulative = 0
+            bounds = [_format_bound(i) for i in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, task["duration_buckets"]):
+                cumulative += count
+                lines.append(
+                    '{}_bucket{{code="{}",le="{}"}} {}'.format(
+                        name, _escape(code), bound, cumulative
+                    )
+                )
+            lines.append(
+                '{}_sum{{code="{}"}} {}'.format(
+                    name, _escape(code), task["duration_sum"]
+                )
+            )
+            lines.append(
+                '{}_count{{code="{}"}} {}'.format(
+                    name, _escape(code), cumulative
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessMetricsRegistry(MetricsRegistry):
+    """A MetricsRegistry that also works with process workers.
+
+    Each process counts in memory and a background thread writes its
+    metrics to a JSON file of 'directory' every 'flush_interval' seconds
+    when they changed. 'collect' sums the files of all the processes, the
+    calls in flight of the processes that exited are ignored.
+
+    Arguments:
+        - buckets: upper bounds, in seconds, of the duration histogram
+        - directory: where the files of the processes are written
+        - flush_interval: seconds between the writes of a process
+    """
+
+    def __init__(self, buckets, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        super(MultiprocessMetricsRegistry, self).__init__(buckets)
+
+    def _reset(self):
+        super(MultiprocessMetricsRegistry, self)._reset()
+        self._changed = False
+        self._thread = None
+
+    def _task(self, code):
+        task = super(MultiprocessMetricsRegistry, self)._task(code)
+        self._changed = True
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="hueylogs-metrics"
+            )
+            self._thread.daemon = True
+            self._thread.start()
+            atexit.register(self.flush)
+        return task
+
+    def _path(self, pid):
+        return os.path.join(
+            self.directory, "hueylogs-metrics-{}.json".format(pid)
+        )
+
+    def flush(self):
+        """Write the metrics of this process if they changed."""
+        with self._lock:
+            if not self._changed or self._pid != os.getpid():
+                return
+            self._changed = False
+            data = json.dumps(
+                {code: task.to_dict() for code, task in self._tasks.items()}
+            )
+        # replaced at once so the view never reads half of a file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, self._path(os.getpid()))
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("hueylogs could not write the metrics")
+
+    def collect(self):
+        self.flush()
+        tasks = {}
+        pattern = os.path.join(self.directory, "hueylogs-metrics-*.json")
+        for path in glob.glob(pattern):
+            pid = int(os.path.basename(path)[17:-5])
+            try:
+                with open(path) as metrics_file:
+                    data = json.load(metrics_file)
+            except (IOError, ValueError):
+                continue
+            alive = _pid_alive(pid)
+            for code, values in data.items():
+                if not alive:
+                    values["in_flight"] = 0
+                task = tasks.get(code)
+                if task is None:
+                    task = tasks[code] = _TaskMetrics(self.buckets)
+                task.add(values)
+        return {code: task.to_dict() for code, task in tasks.items()}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry():
+    """Return the registry configured by 'HUEYLOGS_METRICS' setting or
+    None if it is disabled."""
+    global _registry
+    options = get_metrics_settings()
+    if not options["enabled"]:
+        return None
+    with _registry_lock:
+        if _registry is None:
+            from hueylogs.models import DURATION_BUCKETS
+
+            if options["multiprocess_dir"]:
+                _registry = MultiprocessMetricsRegistry(
+                    DURATION_BUCKETS,
+                    options["multiprocess_dir"],
+                    options["flush_interval"],
+                )
+            else:
+                _registry = MetricsRegistry(DURATION_BUCKETS)
+        return _registry
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hueylogs', '0004_alter_hueyexecutionlog_finnished'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hueyexecutionlog',
+            index=models.Index(fields=['code', '-start_time'], name='hueylogs_code_start_idx'),
+        ),
+        migrations.AlterField(
+            model_name='hueyexecutionlog',
+            name='code',
+            field=models.CharField(max_length=255),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hueylogs', '0005_hueyexecutionlog_code_start_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HueyExecutionSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=255)),
+                ('slot_start', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('code', 'slot_start')},
+            },
+        ),
+    ]
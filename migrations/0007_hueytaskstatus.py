@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def fill_task_status(apps, schema_editor):
+    HueyExecutionLog = apps.get_model('hueylogs', 'HueyExecutionLog')
+    HueyTaskStatus = apps.get_model('hueylogs', 'HueyTaskStatus')
+    codes = HueyExecutionLog.objects.values_list('code', flat=True).distinct()
+    for code in codes.order_by():
+        # logs from before the 'finnished' field have it null
+        logs = HueyExecutionLog.objects.filter(code=code).exclude(finnished=False)
+        values = logs.aggregate(
+            total_runs=Count('pk'),
+            last_start=Max('start_time'),
+            last_success=Max('end_time', filter=Q(is_success=True)),
+            last_failure=Max('end_time', filter=Q(is_success=False)),
+            last_success_start=Max('start_time', filter=Q(is_success=True)),
+        )
+        failures = logs.filter(is_success=False)
+        last_success_start = values.pop('last_success_start')
+        if last_success_start is not None:
+            failures = failures.filter(start_time__gt=last_success_start)
+        HueyTaskStatus.objects.create(
+            code=code, consecutive_failures=failures.count(), **values
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hueylogs', '0006_hueyexecutionslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HueyTaskStatus',
+            fields=[
+                ('code', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('last_start', models.DateTimeField(blank=True, null=True)),
+                ('last_success', models.DateTimeField(blank=True, null=True)),
+                ('last_failure', models.DateTimeField(blank=True, null=True)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('total_runs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_task_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hueylogs', '0007_hueytaskstatus'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HueyDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=255)),
+                ('bucket', models.DateTimeField(db_index=True)),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0)),
+                ('duration_min', models.FloatField(default=0)),
+                ('duration_max', models.FloatField(default=0)),
+                ('histogram_0', models.PositiveIntegerField(default=0)),
+                ('histogram_1', models.PositiveIntegerField(default=0)),
+                ('histogram_2', models.PositiveIntegerField(default=0)),
+                ('histogram_3', models.PositiveIntegerField(default=0)),
+                ('histogram_4', models.PositiveIntegerField(default=0)),
+                ('histogram_5', models.PositiveIntegerField(default=0)),
+                ('histogram_6', models.PositiveIntegerField(default=0)),
+                ('histogram_7', models.PositiveIntegerField(default=0)),
+                ('histogram_8', models.PositiveIntegerField(default=0)),
+                ('histogram_9', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('code', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HueyHourlyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=255)),
+                ('bucket', models.DateTimeField(db_index=True)),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0)),
+                ('duration_min', models.FloatField(default=0)),
+                ('duration_max', models.FloatField(default=0)),
+                ('histogram_0', models.PositiveIntegerField(default=0)),
+                ('histogram_1', models.PositiveIntegerField(default=0)),
+                ('histogram_2', models.PositiveIntegerField(default=0)),
+                ('histogram_3', models.PositiveIntegerField(default=0)),
+                ('histogram_4', models.PositiveIntegerField(default=0)),
+                ('histogram_5', models.PositiveIntegerField(default=0)),
+                ('histogram_6', models.PositiveIntegerField(default=0)),
+                ('histogram_7', models.PositiveIntegerField(default=0)),
+                ('histogram_8', models.PositiveIntegerField(default=0)),
+                ('histogram_9', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('code', 'bucket')},
+            },
+        ),
+    ]
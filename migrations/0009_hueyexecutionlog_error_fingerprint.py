@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0008_execution_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="error_fingerprint",
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:46
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+
+def move_tracebacks(apps, schema_editor):
+    """Move the tracebacks of error_description to HueyTraceback, leaving
+    only its last line in error_description."""
+    HueyExecutionLog = apps.get_model("hueylogs", "HueyExecutionLog")
+    HueyTraceback = apps.get_model("hueylogs", "HueyTraceback")
+    logs = (
+        HueyExecutionLog.objects.filter(traceback__isnull=True)
+        .exclude(error_description="")
+        .only("pk", "error_description")
+        .order_by("pk")
+    )
+    last_pk = 0
+    while True:
+        chunk = list(logs.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        tracebacks = {}
+        for log in chunk:
+            data = log.error_description.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()
+            tracebacks[digest] = HueyTraceback(
+                digest=digest, compressed_text=zlib.compress(data)
+            )
+            lines = log.error_description.rstrip().splitlines()
+            log.error_description = lines[-1][:1000] if lines else ""
+            log.traceback_id = digest
+        HueyTraceback.objects.bulk_create(
+            tracebacks.values(), ignore_conflicts=True
+        )
+        HueyExecutionLog.objects.bulk_update(
+            chunk, ["error_description", "traceback"]
+        )
+        last_pk = chunk[-1].pk
+
+
+def restore_tracebacks(apps, schema_editor):
+    """Write the full tracebacks back to error_description."""
+    HueyExecutionLog = apps.get_model("hueylogs", "HueyExecutionLog")
+    logs = (
+        HueyExecutionLog.objects.filter(traceback__isnull=False)
+        .select_related("traceback")
+        .only("pk", "error_description", "traceback__compressed_text")
+        .order_by("pk")
+    )
+    last_pk = 0
+    while True:
+        chunk = list(logs.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for log in chunk:
+            log.error_description = zlib.decompress(
+                bytes(log.traceback.compressed_text)
+            ).decode("utf-8")
+        HueyExecutionLog.objects.bulk_update(chunk, ["error_description"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # each chunk of moved tracebacks is committed on its own
+    atomic = False
+
+    dependencies = [
+        ("hueylogs", "0009_hueyexecutionlog_error_fingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HueyTraceback",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(
+                        max_length=64, primary_key=True, serialize=False
+                    ),
+                ),
+                ("compressed_text", models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="traceback",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="logs",
+                to="hueylogs.hueytraceback",
+            ),
+        ),
+        migrations.RunPython(move_tracebacks, restore_tracebacks),
+    ]
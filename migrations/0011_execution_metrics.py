@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0010_hueytraceback"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="cpu_system_time",
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="cpu_user_time",
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="memory_peak",
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="rss_delta",
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="wall_time",
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+    ]
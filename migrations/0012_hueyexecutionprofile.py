@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0011_execution_metrics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HueyExecutionProfile",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "profiler",
+                    models.CharField(
+                        choices=[
+                            ("cprofile", "cProfile"),
+                            ("sampling", "Stack sampling"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("function", models.CharField(max_length=500)),
+                ("calls", models.PositiveIntegerField(blank=True, null=True)),
+                ("own_time", models.FloatField()),
+                ("cumulative_time", models.FloatField()),
+                (
+                    "log",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="profile_functions",
+                        to="hueylogs.hueyexecutionlog",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("log", "-cumulative_time"),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0012_hueyexecutionprofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="weight",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0013_hueyexecutionlog_weight"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="queue_wait",
+            field=models.DurationField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0014_hueyexecutionlog_queue_wait"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="crashed",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="last_heartbeat",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="hueyexecutionlog",
+            index=models.Index(
+                condition=models.Q(("finnished", False)),
+                fields=["start_time"],
+                name="hueylogs_unfinished_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0015_heartbeats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueytraceback",
+            name="last_stored",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
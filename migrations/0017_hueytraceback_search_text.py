@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:27
+
+import zlib
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+
+def fill_search_text(apps, schema_editor):
+    """Copy the decompressed text of the stored tracebacks to search_text."""
+    HueyTraceback = apps.get_model("hueylogs", "HueyTraceback")
+    tracebacks = (
+        HueyTraceback.objects.using(schema_editor.connection.alias)
+        .filter(search_text="")
+        .only("pk", "compressed_text")
+        .order_by("pk")
+    )
+    last_pk = ""
+    while True:
+        chunk = list(tracebacks.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for traceback in chunk:
+            traceback.search_text = zlib.decompress(
+                bytes(traceback.compressed_text)
+            ).decode("utf-8")
+        HueyTraceback.objects.using(
+            schema_editor.connection.alias
+        ).bulk_update(chunk, ["search_text"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # each chunk is committed on its own
+    atomic = False
+
+    dependencies = [
+        ("hueylogs", "0016_hueytraceback_last_stored"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueytraceback",
+            name="search_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+    ]
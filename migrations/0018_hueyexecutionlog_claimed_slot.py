@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hueylogs", "0017_hueytraceback_search_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueyexecutionlog",
+            name="claimed_slot",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:45
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+
+def fill_search_key(apps, schema_editor):
+    """Set the integer key of the digest of the stored tracebacks."""
+    HueyTraceback = apps.get_model("hueylogs", "HueyTraceback")
+    tracebacks = (
+        HueyTraceback.objects.using(schema_editor.connection.alias)
+        .filter(search_key__isnull=True)
+        .only("pk")
+        .order_by("pk")
+    )
+    last_pk = ""
+    while True:
+        chunk = list(tracebacks.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for traceback in chunk:
+            # the same as HueyTraceback.digest_key
+            traceback.search_key = int(traceback.pk[:15], 16)
+        HueyTraceback.objects.using(
+            schema_editor.connection.alias
+        ).bulk_update(chunk, ["search_key"])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # each chunk is committed on its own
+    atomic = False
+
+    dependencies = [
+        ("hueylogs", "0018_hueyexecutionlog_claimed_slot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hueytraceback",
+            name="search_key",
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_search_key, migrations.RunPython.noop),
+    ]
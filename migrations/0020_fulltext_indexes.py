@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:50
+
+from django.db import migrations
+
+# the same expressions of hueylogs.fulltext, the queries must repeat them
+LOG_VECTOR = (
+    "to_tsvector('simple', "
+    "coalesce(code, '') || ' ' || coalesce(error_description, ''))"
+)
+TRACEBACK_VECTOR = "to_tsvector('simple', coalesce(search_text, ''))"
+
+
+def _tables(apps, schema_editor):
+    quote_name = schema_editor.quote_name
+    return {
+        "table": quote_name(
+            apps.get_model("hueylogs", "HueyExecutionLog")._meta.db_table
+        ),
+        "traceback_table": quote_name(
+            apps.get_model("hueylogs", "HueyTraceback")._meta.db_table
+        ),
+    }
+
+
+def create_indexes(apps, schema_editor):
+    """Create the GIN expression indexes of the full-text search on
+    PostgreSQL, concurrently so the tables are not locked nor rewritten."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    statements = [
+        # the generated columns created by older 'hueylogs_fulltext'
+        "ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+        "ALTER TABLE {traceback_table} DROP COLUMN IF EXISTS search_vector",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS hueylogs_log_search_idx "
+        "ON {table} USING GIN (" + LOG_VECTOR + ")",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+        "hueylogs_traceback_search_idx ON {traceback_table} "
+        "USING GIN (" + TRACEBACK_VECTOR + ")",
+    ]
+    tables = _tables(apps, schema_editor)
+    for statement in statements:
+        schema_editor.execute(statement.format(**tables))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "DROP INDEX CONCURRENTLY IF EXISTS hueylogs_log_search_idx"
+    )
+    schema_editor.execute(
+        "DROP INDEX CONCURRENTLY IF EXISTS hueylogs_traceback_search_idx"
+    )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can not run in a transaction
+    atomic = False
+
+    dependencies = [
+        ("hueylogs", "0019_hueytraceback_search_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
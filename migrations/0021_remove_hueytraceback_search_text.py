@@ -0,0 +1,143 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:49
+
+import zlib
+
+from django.db import migrations
+
+CHUNK_SIZE = 1000
+# the same names of hueylogs.fulltext
+TRACEBACK_SEARCH_TABLE = "hueylogs_traceback_search"
+TRACEBACK_INDEX = "hueylogs_traceback_search_idx"
+FULLTEXT_SUFFIX = "_fts"
+TRIGGER_EVENTS = ("insert", "delete", "update")
+
+
+def _chunks(apps, schema_editor, fields):
+    HueyTraceback = apps.get_model("hueylogs", "HueyTraceback")
+    tracebacks = (
+        HueyTraceback.objects.using(schema_editor.connection.alias)
+        .only(*fields)
+        .order_by("pk")
+    )
+    last_pk = ""
+    while True:
+        chunk = list(tracebacks.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def _text(traceback):
+    return zlib.decompress(bytes(traceback.compressed_text)).decode("utf-8")
+
+
+def index_tracebacks(apps, schema_editor):
+    """Index the words of the tracebacks without their uncompressed copy.
+
+    On PostgreSQL they are moved to a table of tsvector by 'search_key'
+    with its GIN index. On SQLite the FTS5 table that read the copy is
+    dropped, 'migrate' creates the new one and fills it if the index is
+    enabled.
+    """
+    connection = schema_editor.connection
+    table = apps.get_model("hueylogs", "HueyTraceback")._meta.db_table
+    quote_name = schema_editor.quote_name
+    if connection.vendor == "sqlite":
+        for event in TRIGGER_EVENTS:
+            schema_editor.execute(
+                "DROP TRIGGER IF EXISTS {}{}_{}".format(
+                    table, FULLTEXT_SUFFIX, event
+                )
+            )
+        schema_editor.execute(
+            "DROP TABLE IF EXISTS {}".format(
+                quote_name(table + FULLTEXT_SUFFIX)
+            )
+        )
+        return
+    if connection.vendor != "postgresql":
+        return
+    # the expression index of 0020_fulltext_indexes
+    schema_editor.execute(
+        "DROP INDEX CONCURRENTLY IF EXISTS {}".format(
+            quote_name(TRACEBACK_INDEX)
+        )
+    )
+    schema_editor.execute(
+        "CREATE TABLE IF NOT EXISTS {} (search_key bigint PRIMARY KEY, "
+        "search_vector tsvector NOT NULL)".format(
+            quote_name(TRACEBACK_SEARCH_TABLE)
+        )
+    )
+    statement = (
+        "INSERT INTO {} (search_key, search_vector) "
+        "VALUES (%s, to_tsvector('simple', %s)) "
+        "ON CONFLICT DO NOTHING".format(quote_name(TRACEBACK_SEARCH_TABLE))
+    )
+    fields = ["pk", "search_key", "compressed_text"]
+    for chunk in _chunks(apps, schema_editor, fields):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                statement,
+                [[i.search_key, _text(i)] for i in chunk],
+            )
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} "
+        "USING GIN (search_vector)".format(
+            quote_name(TRACEBACK_INDEX), quote_name(TRACEBACK_SEARCH_TABLE)
+        )
+    )
+
+
+def restore_search_text(apps, schema_editor):
+    """Write the uncompressed copy of the tracebacks back and drop their
+    index, the one of 0020_fulltext_indexes is built again."""
+    HueyTraceback = apps.get_model("hueylogs", "HueyTraceback")
+    connection = schema_editor.connection
+    table = HueyTraceback._meta.db_table
+    quote_name = schema_editor.quote_name
+    fields = ["pk", "compressed_text"]
+    for chunk in _chunks(apps, schema_editor, fields):
+        for traceback in chunk:
+            traceback.search_text = _text(traceback)
+        HueyTraceback.objects.using(connection.alias).bulk_update(
+            chunk, ["search_text"]
+        )
+    if connection.vendor == "sqlite":
+        schema_editor.execute(
+            "DROP TABLE IF EXISTS {}".format(
+                quote_name(table + FULLTEXT_SUFFIX)
+            )
+        )
+    elif connection.vendor == "postgresql":
+        schema_editor.execute(
+            "DROP TABLE IF EXISTS {}".format(
+                quote_name(TRACEBACK_SEARCH_TABLE)
+            )
+        )
+        schema_editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} USING GIN "
+            "(to_tsvector('simple', coalesce(search_text, '')))".format(
+                quote_name(TRACEBACK_INDEX), quote_name(table)
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    # each chunk is committed on its own, CREATE INDEX CONCURRENTLY can not
+    # run in a transaction
+    atomic = False
+
+    dependencies = [
+        ("hueylogs", "0020_fulltext_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(index_tracebacks, restore_search_text),
+        migrations.RemoveField(
+            model_name="hueytraceback",
+            name="search_text",
+        ),
+    ]
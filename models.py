@@ -1,37 +1,140 @@
 # coding: utf-8
 from __future__ import print_function, unicode_literals
 
+import asyncio
 import calendar
+import contextvars
+import hashlib
+import inspect
 import logging
-import sys
-import traceback
-from datetime import datetime
-from datetime import time as datetimetime
-from datetime import timedelta
-
-from dateutil.relativedelta import relativedelta
-from django.db import models
+import time
+import zlib
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import (
+    IntegrityError,
+    connections,
+    models,
+    router,
+    transaction,
+)
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Least
 from django.utils import timezone
 from huey import crontab
 from huey.contrib.djhuey import db_periodic_task, lock_task
-from six import text_type as unicode
 
+from hueylogs.backends import DatabaseBackend, get_default_backend
 from hueylogs.exceptions import HueyMaxTriesException
+from hueylogs.heartbeats import get_heartbeat
+from hueylogs.metrics import get_metrics_registry
+from hueylogs.profiling import (
+    PROFILER_CPROFILE,
+    PROFILER_SAMPLING,
+    ExecutionProfiler,
+)
+from hueylogs.resources import ResourceUsage
+from hueylogs.sampling import success_sampler
+from hueylogs.schedule import Schedule
+from hueylogs.tracebacks import capture_exception, summarize_traceback
+from hueylogs.writers import BufferedLogWriter, get_default_writer
 
 logger = logging.getLogger("hueylogs")
 
+# (code, slot_start) of the window of 'run_at_times' claimed by the running
+# call, stored in its log so 'reap_crashed' releases only that window
+_claimed_slot = contextvars.ContextVar("hueylogs_claimed_slot", default=None)
+
 
 class HueyExecutionLog(models.Model):
-    code = models.CharField(max_length=255, db_index=True)
+    # codes of the functions decorated with 'register_log'
+    registered_codes = set()
+
+    # 'code' lookups are served by the (code, start_time) index
+    code = models.CharField(max_length=255)
     start_time = models.DateTimeField(db_index=True)
     end_time = models.DateTimeField(db_index=True)
     is_success = models.BooleanField(default=False)
+    # only the last line of the traceback, the full traceback is stored
+    # once in HueyTraceback, see 'error_text'
     error_description = models.TextField(blank=True)
+    # without constraint so pruning tracebacks never blocks writing logs
+    traceback = models.ForeignKey(
+        "HueyTraceback",
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="logs",
+    )
+    # groups the logs of the same error, see tracebacks.capture_exception
+    error_fingerprint = models.CharField(
+        max_length=40, blank=True, db_index=True
+    )
     finnished = models.BooleanField(default=None, null=True)
+    # resources used by the execution, only filled with 'metrics=True', see
+    # resources.ResourceUsage
+    wall_time = models.FloatField(null=True, blank=True, db_index=True)
+    cpu_user_time = models.FloatField(null=True, blank=True, db_index=True)
+    cpu_system_time = models.FloatField(null=True, blank=True, db_index=True)
+    rss_delta = models.BigIntegerField(null=True, blank=True, db_index=True)
+    memory_peak = models.BigIntegerField(null=True, blank=True, db_index=True)
+    # how many executions the log represents, only successes of tasks with
+    # 'sample_rate' are greater than 1
+    weight = models.PositiveIntegerField(default=1)
+    # time between the task being enqueued (or its eta) and the start of the
+    # execution, only known for the logs written by signals.SignalLogger
+    queue_wait = models.DurationField(null=True, blank=True, db_index=True)
+    # updated while the execution runs with 'heartbeat=True', see
+    # heartbeats.reap_crashed
+    last_heartbeat = models.DateTimeField(null=True, blank=True)
+    crashed = models.BooleanField(default=False)
+    # the window of 'run_at_times' claimed by the execution
+    claimed_slot = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["code", "-start_time"], name="hueylogs_code_start_idx"
+            ),
+            # only the running executions, a small part of the table
+            models.Index(
+                fields=["start_time"],
+                condition=Q(finnished=False),
+                name="hueylogs_unfinished_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.code
 
+    @property
+    def error_text(self):
+        """Return the full traceback of the execution."""
+        if getattr(self, "_error_text", None):
+            # not stored yet
+            return self._error_text
+        if self.traceback_id:
+            try:
+                if self.traceback is not None:
+                    return self.traceback.text
+            except HueyTraceback.DoesNotExist:
+                pass
+        return self.error_description
+
+    @error_text.setter
+    def error_text(self, value):
+        self._error_text = value
+
+    def set_metrics(self, values):
+        """Set the resource fields from a dict of field name to value."""
+        for name, value in values.items():
+            setattr(self, name, value)
+
     @classmethod
     def task_to_string(cls, task_class):
         """Return the string representation of a function."""
@@ -45,67 +148,122 @@ class HueyExecutionLog(models.Model):
         max_tries=3,
         try_again_delay=5,
         lock=True,
+        metrics=False,
+        trace_memory=False,
+        profile_threshold=None,
+        profile_sample_rate=0,
+        sample_rate=1,
+        backend=None,
     ):
         """Concentrate all decorators in only one decorator.
 
         Not that have no need to decorate the function with huey decorators.
+        Each window of 'hours' is claimed in HueyExecutionSlot before the
+        execution, so it runs only once even with many consumers and
+        'lock=False'. 'metrics', 'trace_memory', 'profile_threshold',
+        'profile_sample_rate', 'sample_rate' and 'backend' are passed to
+        'register_log'.
+
+        Raise TypeError for coroutine functions, huey tasks can not be
+        coroutines.
         """
+        schedule = Schedule(hours, minutes_tolerance)
 
         def _decorator(func):
-            run_at_times_decorator = HueyExecutionLog.run_at_times(
-                hours=hours, minutes_tolerance=minutes_tolerance
-            )
-            max_tries_decorator = HueyExecutionLog.max_tries(
-                max_tries=max_tries, try_again_delay=try_again_delay
+            if inspect.iscoroutinefunction(func):
+                # the task would return a coroutine that is never awaited
+                raise TypeError("'logs' can not decorate coroutine functions")
+            code = HueyExecutionLog.task_to_string(func)
+            logged_func = HueyExecutionLog.register_log(
+                func,
+                metrics=metrics,
+                trace_memory=trace_memory,
+                profile_threshold=profile_threshold,
+                profile_sample_rate=profile_sample_rate,
+                sample_rate=sample_rate,
+                backend=backend,
             )
-            db_periodic_task_decorator = db_periodic_task(lambda dt: True)
+
+            # behaves like run_at_times(max_tries(register_log(func))) but
+            # the state needed by max_tries is read with only one primary key
+            # lookup and only by the consumer that claimed the window
+            def _inner_function(*args, **kwargs):
+                now = datetime.now()
+                slot_start = schedule.slot_start(now)
+                if slot_start is None:
+                    return
+                slot_start = HueyExecutionLog.local_to_utc(slot_start)
+                if not HueyExecutionSlot.claim(code, slot_start):
+                    return
+                status = logged_func.log_backend.task_status(code, max_tries)
+                if HueyExecutionLog._must_wait(
+                    status, max_tries, try_again_delay
+                ):
+                    # so it can be tried again in this window
+                    HueyExecutionSlot.release(code, slot_start)
+                    return
+                if status is not None and status.consecutive_failures:
+                    success_sampler.add_failure(code)
+                token = _claimed_slot.set((code, slot_start))
+                try:
+                    return logged_func(*args, **kwargs)
+                except:
+                    HueyExecutionLog._check_max_tries(code, status, max_tries)
+                    raise
+                finally:
+                    _claimed_slot.reset(token)
+
+            _inner_function.__module__ = func.__module__
+            _inner_function.__name__ = func.__name__
+            _inner_function.register_log_called = True
+
             lock_task_decorator = lambda func: func
             if lock:
-                lock_task_decorator = lock_task(
-                    HueyExecutionLog.task_to_string(func)
-                )
-            return db_periodic_task_decorator(
-                lock_task_decorator(
-                    run_at_times_decorator(
-                        max_tries_decorator(
-                            HueyExecutionLog.register_log(func)
-                        )
-                    )
-                )
+                lock_task_decorator = lock_task(code)
+            return db_periodic_task(lambda dt: True)(
+                lock_task_decorator(_inner_function)
             )
 
         return _decorator
 
     @classmethod
     def _reached_max_tries(cls, code, max_tries):
-        failed_tries = HueyExecutionLog.objects.filter(code=code).order_by(
-            "-start_time"
-        )[:max_tries]
-        if failed_tries.count() < max_tries:
+        status = HueyTaskStatus.objects.filter(pk=code).first()
+        return status is not None and status.reached_max_tries(max_tries)
+
+    @classmethod
+    def _must_wait(cls, status, max_tries, try_again_delay):
+        """True if the task reached 'max_tries' and 'try_again_delay' minutes
+        have not passed since the last execution."""
+        if status is None or not status.reached_max_tries(max_tries):
             return False
-        fails = [
-            not i for i in failed_tries.values_list("is_success", flat=True)
-        ]
-        return all(fails)
+        minutes = (timezone.now() - status.last_start).seconds / 60.0
+        if minutes < try_again_delay:
+            print(
+                "Skipping execution to detriment of "
+                "'try_again_delay' of {}".format(try_again_delay)
+            )
+            return True
+        return False
+
+    @classmethod
+    def _check_max_tries(cls, code, status, max_tries):
+        """Raise HueyMaxTriesException if the failure that just happened
+        reached 'max_tries', 'status' is the status before the failure."""
+        failures = 1
+        if status is not None:
+            failures += status.consecutive_failures
+        if failures >= max_tries:
+            raise HueyMaxTriesException(
+                "The function '{}' have reached the maximum "
+                "of {} tries".format(code, max_tries)
+            )
 
     @classmethod
     def check_incompatible_hours(cls, hours, minutes_tolerance):
-        """True if a hour is less than 'minutes_tolerance' of another."""
-        _times_copy = list(hours)
-        while len(_times_copy):
-            hour_to_check = _times_copy.pop()
-            for remaining_hour in _times_copy:
-                now = datetime.now()
-                dt_a = datetime.combine(now, remaining_hour)
-                dt_b = datetime.combine(now, hour_to_check)
-                delta_minutes = abs((dt_a - dt_b).total_seconds()) / 60.0
-                if delta_minutes <= minutes_tolerance:
-                    raise ValueError(
-                        "Is not possible have hours with less than {} minutes "
-                        "of distance. Incompatible hours: {} and {}".format(
-                            delta_minutes, dt_a, dt_b
-                        )
-                    )
+        """Raise ValueError if a hour is less than 'minutes_tolerance' of
+        another."""
+        Schedule(hours, minutes_tolerance)
 
     @classmethod
     def utc_to_local(cls, utc_dt):
@@ -119,6 +277,13 @@ class HueyExecutionLog(models.Model):
         assert utc_dt.resolution >= timedelta(microseconds=1)
         return local_dt.replace(microsecond=utc_dt.microsecond)
 
+    @classmethod
+    def local_to_utc(cls, local_dt):
+        """Convert local datetime without tzinfo to UTC with tzinfo."""
+        timestamp = time.mktime(local_dt.timetuple())
+        utc_dt = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+        return utc_dt.replace(microsecond=local_dt.microsecond)
+
     @classmethod
     def its_time(cls, hour, now, minutes_tolerance):
         """Return True if its time.
@@ -131,28 +296,23 @@ class HueyExecutionLog(models.Model):
             - hour: datetime.time, with time to be sent
             - now: datetime.datetime, now date
             - minutes_tolerance: int, how many minutes will be tolerated AFTER
+
+        Kept for compatibility, the decorators compile the hours once in a
+        Schedule instead of calling it for each hour.
         """
         # removing time zone data
         if now.tzinfo:
             now = HueyExecutionLog.utc_to_local(now)
-        hour = datetimetime(hour.hour, hour.minute)
-        assert isinstance(hour, datetimetime), "hour is not datetime.time"
-        assert isinstance(now, datetime), "now is not datetime.datetime"
-
-        # removing seconds info
-        now = datetime.combine(now.date(), datetimetime(now.hour, now.minute))
-        start = datetime(now.year, now.month, now.day, hour.hour, hour.minute)
-        end = datetime(
-            now.year, now.month, now.day, hour.hour, hour.minute
-        ) + relativedelta(minutes=minutes_tolerance)
-        return (now >= start) and (now <= end)
+        return Schedule([hour], minutes_tolerance).slot(now) is not None
 
     @classmethod
     def run_at_times(self, hours, minutes_tolerance=15):
         """Make sure that the task will be runned only in some hours.
 
         Note that if 'hours' must have a minimum distance of 'minutes_tolerance'
-        minutes.
+        minutes. Each window is claimed in HueyExecutionSlot before calling
+        the function, so it runs only once by window even with many
+        consumers.
 
         Arguments:
             - hours: a list of datetime.time
@@ -161,7 +321,7 @@ class HueyExecutionLog(models.Model):
                 so if the task manager not run the task exactly in 00:00
                 but a little bit after, you can execute it still
         """
-        HueyExecutionLog.check_incompatible_hours(hours, minutes_tolerance)
+        schedule = Schedule(hours, minutes_tolerance)
 
         def _decorator(func):
             if not getattr(func, "register_log_called", None):
@@ -172,34 +332,42 @@ class HueyExecutionLog(models.Model):
                     )
                 )
 
-            def _inner_function(*args, **kwargs):
+            code = HueyExecutionLog.task_to_string(func)
+
+            def _claim_slot():
+                """Return the start of the window claimed or None."""
                 now = datetime.now()
-                hour = None
-                for i in hours:
-                    if HueyExecutionLog.its_time(i, now, minutes_tolerance):
-                        hour = i
-                        break
-                if hour is None:
+                slot_start = schedule.slot_start(now)
+                if slot_start is None:
+                    return None
+                slot_start = HueyExecutionLog.local_to_utc(slot_start)
+                # only the first call of the window claims it
+                if not HueyExecutionSlot.claim(code, slot_start):
+                    return None
+                return slot_start
+
+            def _inner_function(*args, **kwargs):
+                slot_start = _claim_slot()
+                if slot_start is None:
                     return
-                # verifying if the function was already called today
-                last_execution = (
-                    HueyExecutionLog.objects.filter(
-                        code=HueyExecutionLog.task_to_string(func),
-                        start_time__day=now.day,
-                        start_time__month=now.month,
-                        start_time__year=now.year,
-                    )
-                    .order_by("-start_time")
-                    .first()
-                )
-                if last_execution:
-                    already_runned = HueyExecutionLog.its_time(
-                        hour, last_execution.start_time, minutes_tolerance
-                    )
-                    if already_runned:
-                        return
-                return func(*args, **kwargs)
+                token = _claimed_slot.set((code, slot_start))
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _claimed_slot.reset(token)
+
+            async def _async_inner_function(*args, **kwargs):
+                slot_start = await sync_to_async(_claim_slot)()
+                if slot_start is None:
+                    return
+                token = _claimed_slot.set((code, slot_start))
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _claimed_slot.reset(token)
 
+            if inspect.iscoroutinefunction(func):
+                _inner_function = _async_inner_function
             _inner_function.__module__ = func.__module__
             _inner_function.__name__ = func.__name__
             _inner_function.register_log_called = True
@@ -234,36 +402,49 @@ class HueyExecutionLog(models.Model):
                     )
                 )
 
+            code = HueyExecutionLog.task_to_string(func)
+            backend = getattr(func, "log_backend", None)
+            if backend is None:
+                backend = get_default_backend()
+
+            def _read_status():
+                """Return the status and if the call must be skipped."""
+                status = backend.task_status(code, max_tries)
+                if HueyExecutionLog._must_wait(
+                    status, max_tries, try_again_delay
+                ):
+                    claimed = _claimed_slot.get()
+                    if claimed is not None and claimed[0] == code:
+                        # the window of run_at_times can be tried again
+                        HueyExecutionSlot.release(*claimed)
+                    return status, True
+                if status is not None and status.consecutive_failures:
+                    # the failures must be reset by the next success
+                    success_sampler.add_failure(code)
+                return status, False
+
             def _inner_function(*args, **kwargs):
-                code = HueyExecutionLog.task_to_string(func)
-                if HueyExecutionLog._reached_max_tries(code, max_tries):
-                    last_execution = (
-                        HueyExecutionLog.objects.filter(code=code)
-                        .only("start_time")
-                        .order_by("-start_time")
-                        .first()
-                        .start_time
-                    )
-                    minutes = (timezone.now() - last_execution).seconds / 60.0
-                    if minutes < try_again_delay:
-                        print(
-                            "Skipping execution to detriment of "
-                            "'try_again_delay' of {}".format(try_again_delay)
-                        )
-                        return
+                status, must_wait = _read_status()
+                if must_wait:
+                    return
                 try:
                     return func(*args, **kwargs)
                 except:
-                    reached = HueyExecutionLog._reached_max_tries(
-                        code, max_tries
-                    )
-                    if reached:
-                        raise HueyMaxTriesException(
-                            "The function '{}' have reached the maximum "
-                            "of {} tries".format(code, max_tries)
-                        )
+                    HueyExecutionLog._check_max_tries(code, status, max_tries)
                     raise
 
+            async def _async_inner_function(*args, **kwargs):
+                status, must_wait = await sync_to_async(_read_status)()
+                if must_wait:
+                    return
+                try:
+                    return await func(*args, **kwargs)
+                except:
+                    HueyExecutionLog._check_max_tries(code, status, max_tries)
+                    raise
+
+            if inspect.iscoroutinefunction(func):
+                _inner_function = _async_inner_function
             # changing the name of returned function because huey uses it
             # as unique names to registry
             _inner_function.__name__ = func.__name__
@@ -274,50 +455,598 @@ class HueyExecutionLog(models.Model):
         return _decorator
 
     @classmethod
-    def register_log(cls, func):
-        """Register the execution of a function."""
+    def _write_log(cls, log_instance, writer=None):
+        """Save the log now or buffer it in 'writer'."""
+        if writer is None:
+            log_instance.save()
+        else:
+            writer.add(log_instance)
 
-        def _inner_function(*args, **kwargs):
+    @classmethod
+    def _logs_finished(cls, logs):
+        """Called with the logs of finished executions once written."""
+        HueyExecutionProfile.record(logs)
+        HueyTaskStatus.record(logs)
+        # opt-in, they are two more upserts by finished call
+        if getattr(settings, "HUEYLOGS_ROLLUPS", False):
+            HueyHourlyRollup.record(logs)
+            HueyDailyRollup.record(logs)
+
+    @classmethod
+    def register_log(
+        cls,
+        func=None,
+        buffered=False,
+        metrics=False,
+        trace_memory=False,
+        profile_threshold=None,
+        profile_sample_rate=0,
+        sample_rate=1,
+        backend=None,
+        heartbeat=False,
+    ):
+        """Register the execution of a function.
+
+        Can be used directly as decorator or called with arguments:
+
+        @HueyExecutionLog.register_log(buffered=True)
+        def my_task():
+            pass
+
+        Arguments:
+            - buffered: if True the logs are written in batches by the
+                writer configured in 'HUEYLOGS_BUFFER' setting instead of
+                two queries per call. A BufferedLogWriter can be passed too.
+                Note that 'max_tries' and 'run_at_times' only see the logs
+                already flushed
+            - metrics: if True the wall time, cpu time and peak RSS growth
+                of each call are stored in the log
+            - trace_memory: if True the peak of memory allocated by python
+                is stored too, measured with tracemalloc (implies 'metrics').
+                Slows the allocations of the task down
+            - profile_threshold: seconds after which the stack of the call
+                starts being sampled, the functions where the time was spent
+                are stored in HueyExecutionProfile
+            - profile_sample_rate: fraction of the calls profiled with
+                cProfile, stored in HueyExecutionProfile too
+            - sample_rate: fraction of the successful calls written, the
+                failures are always written. The written successes store in
+                'weight' how many successes they represent. The calls are
+                not written when they start, only when they finish
+            - backend: the LogBackend where the logs are written and the
+                recent outcomes read by 'max_tries' and 'logs' are read
+                from, default is the one configured in 'HUEYLOGS_BACKEND'
+                setting or the database
+            - heartbeat: if True 'last_heartbeat' is updated while the call
+                runs, every 'interval' seconds of 'HUEYLOGS_HEARTBEAT'
+                setting, so the crashed executions can be found by
+                heartbeats.reap_crashed. Only for the database backend
+
+        Every call, written or not, is counted in the in-memory registry of
+        metrics.get_metrics_registry, unless 'HUEYLOGS_METRICS' disables it.
+
+        Coroutine functions are decorated by coroutine functions that await
+        them, their logs are written in a thread. Their metrics and profiles
+        include the other coroutines running in the same event loop. A
+        cancelled coroutine is logged as a failure.
+        """
+        if func is None:
+            return lambda func: HueyExecutionLog.register_log(
+                func,
+                buffered=buffered,
+                metrics=metrics,
+                trace_memory=trace_memory,
+                profile_threshold=profile_threshold,
+                profile_sample_rate=profile_sample_rate,
+                sample_rate=sample_rate,
+                backend=backend,
+                heartbeat=heartbeat,
+            )
+        if not 0 < sample_rate <= 1:
+            raise ValueError("'sample_rate' must be greater than 0 and <= 1")
+        if backend is not None and buffered:
+            raise ValueError("'buffered' can only be used without 'backend'")
+
+        if isinstance(buffered, BufferedLogWriter):
+            backend = DatabaseBackend(buffered)
+        elif buffered:
+            backend = DatabaseBackend(get_default_writer())
+        elif backend is None:
+            backend = get_default_backend()
+        if heartbeat and not isinstance(backend, DatabaseBackend):
+            raise ValueError("'heartbeat' needs the database backend")
+        code = HueyExecutionLog.task_to_string(func)
+        metrics = metrics or trace_memory
+        profiling = profile_threshold is not None or profile_sample_rate
+        sampled = sample_rate < 1
+
+        def _new_log():
             start_time = timezone.now()
-            log_instance = HueyExecutionLog.objects.create(
-                code=HueyExecutionLog.task_to_string(func),
+            claimed = _claimed_slot.get()
+            return HueyExecutionLog(
+                code=code,
                 start_time=start_time,
                 end_time=start_time,
                 finnished=False,
                 is_success=False,
+                last_heartbeat=start_time if heartbeat else None,
+                # not the window of other task called by this one
+                claimed_slot=(
+                    claimed[1] if claimed and claimed[0] == code else None
+                ),
             )
+
+        def _start_measures(log_instance, root):
+            registry = get_metrics_registry()
+            if registry is not None:
+                registry.start(code)
+            if heartbeat:
+                get_heartbeat().add(log_instance)
+            usage = None
+            if metrics:
+                usage = ResourceUsage(trace_memory).start()
+            profiler = None
+            if profiling:
+                profiler = ExecutionProfiler(
+                    profile_threshold, profile_sample_rate
+                ).start(root)
+            return usage, profiler
+
+        def _stop_measures(log_instance, is_success, usage, profiler):
+            """Called once by call, also if it was cancelled."""
+            registry = get_metrics_registry()
+            if registry is not None:
+                registry.finish(
+                    code,
+                    (timezone.now() - log_instance.start_time).total_seconds(),
+                    is_success,
+                )
+            if heartbeat:
+                get_heartbeat().remove(log_instance)
+            if profiler is not None:
+                log_instance._profile = (profiler.name, profiler.stop())
+            if usage is not None:
+                log_instance.set_metrics(usage.stop())
+
+        def _set_success(log_instance):
+            """Finish the log, return False if it must not be written."""
+            log_instance.finnished = True
+            log_instance.end_time = timezone.now()
+            log_instance.is_success = True
+            if sampled:
+                weight = success_sampler.add_success(code, sample_rate)
+                if weight is None:
+                    return False
+                log_instance.weight = weight
+            return True
+
+        def _set_failure(log_instance):
+            """Finish the log with the exception being handled."""
+            error_text, error_fingerprint = capture_exception()
+            log_instance.is_success = False
+            log_instance.finnished = True
+            log_instance.end_time = timezone.now()
+            log_instance.error_description = summarize_traceback(error_text)
+            log_instance.error_text = error_text
+            log_instance.error_fingerprint = error_fingerprint
+            if sampled:
+                success_sampler.add_failure(code)
+
+        # the errors of the backend writes are not failures of the call
+        def _inner_function(*args, **kwargs):
+            log_instance = _new_log()
+            if not sampled:
+                backend.write_start(log_instance)
+            measures = _start_measures(log_instance, inspect.currentframe())
+            is_success = False
             try:
-                result = func(*args, **kwargs)
-                log_instance.finnished = True
-                log_instance.end_time = timezone.now()
-                log_instance.is_success = True
-                log_instance.save()
-                return result
+                try:
+                    result = func(*args, **kwargs)
+                    is_success = True
+                finally:
+                    _stop_measures(log_instance, is_success, *measures)
             except Exception as e:
+                _set_failure(log_instance)
+                backend.write_finish(log_instance)
+                logger.error(e)
+                raise
+            if _set_success(log_instance):
+                backend.write_finish(log_instance)
+            return result
 
-                class DummyFile:
-                    def __init__(self):
-                        self.value = ""
-
-                    def write(self, value):
-                        if type(value) is not unicode:
-                            value = value.decode("utf-8")
-                        self.value += value + "\n"
-
-                t, v, trace = sys.exc_info()
-                dummy_file = DummyFile()
-                traceback.print_exception(t, v, trace, file=dummy_file)
-                log_instance.is_success = False
-                log_instance.finnished = True
-                log_instance.end_time = timezone.now()
-                log_instance.error_description = dummy_file.value
-                log_instance.save()
+        # the writes run in a thread so they do not block the event loop, a
+        # cancelled call is written as a failure
+        async def _async_inner_function(*args, **kwargs):
+            log_instance = _new_log()
+            if not sampled:
+                await sync_to_async(backend.write_start)(log_instance)
+            measures = _start_measures(log_instance, inspect.currentframe())
+            is_success = False
+            try:
+                try:
+                    result = await func(*args, **kwargs)
+                    is_success = True
+                finally:
+                    _stop_measures(log_instance, is_success, *measures)
+            except (Exception, asyncio.CancelledError) as e:
+                _set_failure(log_instance)
+                await sync_to_async(backend.write_finish)(log_instance)
                 logger.error(e)
                 raise
+            if _set_success(log_instance):
+                await sync_to_async(backend.write_finish)(log_instance)
+            return result
+
+        if inspect.iscoroutinefunction(func):
+            _inner_function = _async_inner_function
 
         # changing the name of returned function because huey uses it
         # as unique names to registry
         _inner_function.__name__ = func.__name__
         _inner_function.__module__ = func.__module__
         _inner_function.register_log_called = True
+        _inner_function.log_backend = backend
+        HueyExecutionLog.registered_codes.add(code)
         return _inner_function
+
+
+class HueyTraceback(models.Model):
+    """A traceback stored only once, compressed, by the hash of its text.
+
+    The text is not stored uncompressed: the '?search=' of the API finds it
+    through the full-text index of 'hueylogs.fulltext', by 'search_key'.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    compressed_text = models.BinaryField()
+    # integer key of the digest, used by the full-text index, see
+    # 'digest_key'
+    search_key = models.BigIntegerField(null=True, blank=True, unique=True)
+    # refreshed by every store, the orphans are only pruned after a while
+    # so a traceback stored just before its log is written is kept
+    last_stored = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.digest
+
+    @property
+    def text(self):
+        return zlib.decompress(bytes(self.compressed_text)).decode("utf-8")
+
+    @staticmethod
+    def digest_key(digest):
+        """Return the first 60 bits of the digest as an integer."""
+        return int(digest[:15], 16)
+
+    @classmethod
+    def store(cls, text):
+        """Store the traceback if it is new, refresh its 'last_stored' if
+        not, and return its digest."""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        using = router.db_for_write(cls)
+        # MySQL does not accept the conflict target
+        unique_fields = None
+        if connections[using].features.supports_update_conflicts_with_target:
+            unique_fields = ["digest"]
+        HueyTraceback.objects.using(using).bulk_create(
+            [
+                HueyTraceback(
+                    digest=digest,
+                    compressed_text=zlib.compress(data),
+                    search_key=cls.digest_key(digest),
+                    last_stored=timezone.now(),
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=["last_stored"],
+        )
+        from hueylogs.fulltext import index_traceback
+
+        index_traceback(using, cls.digest_key(digest), text)
+        return digest
+
+
+class HueyExecutionProfile(models.Model):
+    """A function where a profiled execution spent its time."""
+
+    PROFILER_CHOICES = (
+        (PROFILER_CPROFILE, "cProfile"),
+        (PROFILER_SAMPLING, "Stack sampling"),
+    )
+
+    log = models.ForeignKey(
+        HueyExecutionLog,
+        on_delete=models.CASCADE,
+        related_name="profile_functions",
+    )
+    profiler = models.CharField(max_length=20, choices=PROFILER_CHOICES)
+    function = models.CharField(max_length=500)
+    # only known with cProfile
+    calls = models.PositiveIntegerField(null=True, blank=True)
+    own_time = models.FloatField()
+    cumulative_time = models.FloatField()
+
+    class Meta:
+        ordering = ("log", "-cumulative_time")
+
+    def __str__(self):
+        return self.function
+
+    @classmethod
+    def record(cls, logs):
+        """Write the profile of the logs that were profiled."""
+        profiles = []
+        for log_instance in logs:
+            profiler, rows = getattr(log_instance, "_profile", (None, None))
+            # the pk is unknown on backends that do not return it from bulk
+            # inserts of buffered logs
+            if not rows or log_instance.pk is None:
+                continue
+            profiles.extend(
+                cls(log=log_instance, profiler=profiler, **row) for row in rows
+            )
+            del log_instance._profile
+        if profiles:
+            cls.objects.bulk_create(profiles)
+
+
+class HueyTaskStatus(models.Model):
+    """Summary of the executions of a task, updated by every finished log.
+
+    Answers the state of a task with a primary key lookup instead of
+    scanning HueyExecutionLog.
+    """
+
+    code = models.CharField(max_length=255, primary_key=True)
+    last_start = models.DateTimeField(null=True, blank=True)
+    last_success = models.DateTimeField(null=True, blank=True)
+    last_failure = models.DateTimeField(null=True, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    total_runs = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.code
+
+    @property
+    def is_healthy(self):
+        return self.consecutive_failures == 0
+
+    def reached_max_tries(self, max_tries):
+        return self.consecutive_failures >= max_tries
+
+    @classmethod
+    def record(cls, logs):
+        """Update the status of the tasks with its finished 'logs'.
+
+        Is done one update by task, also when many logs are written at once.
+        """
+        logs_by_code = {}
+        for log_instance in logs:
+            logs_by_code.setdefault(log_instance.code, []).append(log_instance)
+        for code, code_logs in logs_by_code.items():
+            code_logs.sort(key=lambda log_instance: log_instance.start_time)
+            values = {"last_start": code_logs[-1].start_time}
+            successes = [i for i in code_logs if i.is_success]
+            failures = [i for i in code_logs if not i.is_success]
+            if successes:
+                values["last_success"] = successes[-1].end_time
+            if failures:
+                values["last_failure"] = failures[-1].end_time
+            trailing_failures = 0
+            for log_instance in reversed(code_logs):
+                if log_instance.is_success:
+                    break
+                trailing_failures += 1
+            runs = sum(i.weight for i in code_logs)
+            updates = dict(values, total_runs=F("total_runs") + runs)
+            if successes:
+                updates["consecutive_failures"] = trailing_failures
+            else:
+                updates["consecutive_failures"] = (
+                    F("consecutive_failures") + trailing_failures
+                )
+            if HueyTaskStatus.objects.filter(pk=code).update(**updates):
+                continue
+            try:
+                with transaction.atomic(using=router.db_for_write(cls)):
+                    HueyTaskStatus.objects.create(
+                        code=code,
+                        total_runs=runs,
+                        consecutive_failures=trailing_failures,
+                        **values
+                    )
+            except IntegrityError:
+                # created by a concurrent execution
+                HueyTaskStatus.objects.filter(pk=code).update(**updates)
+
+
+class HueyExecutionSlot(models.Model):
+    """A window of 'run_at_times' claimed by one execution."""
+
+    code = models.CharField(max_length=255)
+    slot_start = models.DateTimeField()
+
+    class Meta:
+        unique_together = [("code", "slot_start")]
+
+    def __str__(self):
+        return "{} {}".format(self.code, self.slot_start)
+
+    @classmethod
+    def claim(cls, code, slot_start):
+        """Return True if the slot was claimed by this call.
+
+        The claim is a single insert, the unique constraint makes sure that
+        only one of concurrent callers succeeds.
+        """
+        try:
+            with transaction.atomic(using=router.db_for_write(cls)):
+                HueyExecutionSlot.objects.create(
+                    code=code, slot_start=slot_start
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def release(cls, code, slot_start):
+        """Allow the slot to be claimed again."""
+        HueyExecutionSlot.objects.filter(
+            code=code, slot_start=slot_start
+        ).delete()
+
+
+# upper bounds, in seconds, of the duration histogram buckets of the rollups,
+# the last bucket counts the durations greater than the last bound
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+
+def _truncate_hour(dt):
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def _truncate_day(dt):
+    return timezone.localtime(dt).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+# start of the period of a datetime, by the 'period' of the rollup models
+ROLLUP_PERIODS = {"hour": _truncate_hour, "day": _truncate_day}
+
+
+class HueyExecutionRollup(models.Model):
+    """Statistics of the finished executions of a task in a period.
+
+    Updated incrementally when the logs are finished, the rows can be rebuilt
+    from HueyExecutionLog with the 'hueylogs_rebuild_rollups' command.
+    """
+
+    code = models.CharField(max_length=255)
+    bucket = models.DateTimeField(db_index=True)
+    run_count = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0)
+    duration_min = models.FloatField(default=0)
+    duration_max = models.FloatField(default=0)
+    # histogram of the durations, see DURATION_BUCKETS
+    histogram_0 = models.PositiveIntegerField(default=0)
+    histogram_1 = models.PositiveIntegerField(default=0)
+    histogram_2 = models.PositiveIntegerField(default=0)
+    histogram_3 = models.PositiveIntegerField(default=0)
+    histogram_4 = models.PositiveIntegerField(default=0)
+    histogram_5 = models.PositiveIntegerField(default=0)
+    histogram_6 = models.PositiveIntegerField(default=0)
+    histogram_7 = models.PositiveIntegerField(default=0)
+    histogram_8 = models.PositiveIntegerField(default=0)
+    histogram_9 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        unique_together = [("code", "bucket")]
+
+    def __str__(self):
+        return "{} {}".format(self.code, self.bucket)
+
+    @classmethod
+    def truncate(cls, dt):
+        """Return the start of the period of 'dt'."""
+        return ROLLUP_PERIODS[cls.period](dt)
+
+    @property
+    def histogram(self):
+        return [
+            getattr(self, "histogram_{}".format(i))
+            for i in range(len(DURATION_BUCKETS) + 1)
+        ]
+
+    @property
+    def duration_avg(self):
+        if not self.run_count:
+            return None
+        return self.duration_sum / self.run_count
+
+    @property
+    def failure_rate(self):
+        if not self.run_count:
+            return None
+        return 1 - float(self.success_count) / self.run_count
+
+    def percentile(self, percent):
+        """Estimate the duration percentile from the histogram.
+
+        Returns the upper bound of the bucket of the percentile, limited by
+        the max duration.
+        """
+        if not self.run_count:
+            return None
+        rank = self.run_count * percent / 100.0
+        accumulated = 0
+        for bound, count in zip(DURATION_BUCKETS, self.histogram):
+            accumulated += count
+            if accumulated >= rank:
+                return min(bound, self.duration_max)
+        return self.duration_max
+
+    @classmethod
+    def record(cls, logs):
+        """Add the finished 'logs' to the rollups of its periods.
+
+        Is done one update by task and period, also when many logs are
+        written at once.
+        """
+        groups = {}
+        for log_instance in logs:
+            key = (log_instance.code, cls.truncate(log_instance.start_time))
+            groups.setdefault(key, []).append(log_instance)
+        for (code, bucket), group_logs in groups.items():
+            durations = [
+                (i.end_time - i.start_time).total_seconds() for i in group_logs
+            ]
+            # sampled successes count as the executions they represent
+            weights = [i.weight for i in group_logs]
+            values = {
+                "run_count": sum(weights),
+                "success_count": sum(
+                    i.weight for i in group_logs if i.is_success
+                ),
+                "duration_sum": sum(
+                    duration * weight
+                    for duration, weight in zip(durations, weights)
+                ),
+            }
+            for duration, weight in zip(durations, weights):
+                name = "histogram_{}".format(
+                    bisect_left(DURATION_BUCKETS, duration)
+                )
+                values[name] = values.get(name, 0) + weight
+            updates = dict(
+                (name, F(name) + value) for name, value in values.items()
+            )
+            updates["duration_min"] = Least("duration_min", min(durations))
+            updates["duration_max"] = Greatest("duration_max", max(durations))
+            queryset = cls.objects.filter(code=code, bucket=bucket)
+            if queryset.update(**updates):
+                continue
+            try:
+                with transaction.atomic(using=router.db_for_write(cls)):
+                    cls.objects.create(
+                        code=code,
+                        bucket=bucket,
+                        duration_min=min(durations),
+                        duration_max=max(durations),
+                        **values
+                    )
+            except IntegrityError:
+                # created by a concurrent execution
+                queryset.update(**updates)
+
+
+class HueyHourlyRollup(HueyExecutionRollup):
+    period = "hour"
+
+
+class HueyDailyRollup(HueyExecutionRollup):
+    period = "day"
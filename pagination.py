@@ -0,0 +1,23 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from rest_framework.pagination import CursorPagination
+
+
+class HueyExecutionLogPagination(CursorPagination):
+    """Keyset pagination, the cost of a page does not grow with its depth."""
+
+    ordering = ("-start_time", "-pk")
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        """Append the primary key to the ordering of '?ordering=', the
+        pages by a field with equal values could skip or repeat rows."""
+        ordering = super(HueyExecutionLogPagination, self).get_ordering(
+            request, queryset, view
+        )
+        if [i for i in ordering if i.lstrip("-") in ("pk", "id")]:
+            return ordering
+        return ordering + ("-pk" if ordering[0].startswith("-") else "pk",)
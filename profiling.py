@@ -0,0 +1,247 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import cProfile
+import logging
+import pstats
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from hueylogs.tracebacks import _normalize_filename
+
+logger = logging.getLogger("hueylogs")
+
+PROFILER_CPROFILE = "cprofile"
+PROFILER_SAMPLING = "sampling"
+
+
+def get_profiling_settings():
+    """Return the 'HUEYLOGS_PROFILING' setting with the default values.
+
+    Example of the setting:
+
+    HUEYLOGS_PROFILING = {
+        "top": 20,  # functions stored by profiled execution
+        "interval": 0.005,  # seconds between the stack samples
+    }
+    """
+    options = {"top": 20, "interval": 0.005}
+    options.update(getattr(settings, "HUEYLOGS_PROFILING", {}))
+    return options
+
+
+def _function_name(filename, lineno, name):
+    return "{}:{}({})".format(_normalize_filename(filename), lineno, name)
+
+
+def _top(rows, top):
+    rows.sort(key=lambda row: row["cumulative_time"], reverse=True)
+    return rows[:top]
+
+
+class CProfileProfiler(object):
+    """Profile the whole execution with cProfile."""
+
+    name = PROFILER_CPROFILE
+
+    def __init__(self, top):
+        self.top = top
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+        return self
+
+    def stop(self):
+        """Return the top functions by cumulative time."""
+        self._profile.disable()
+        stats = pstats.Stats(self._profile).stats
+        rows = [
+            {
+                "function": _function_name(*function),
+                "calls": calls,
+                "own_time": own_time,
+                "cumulative_time": cumulative_time,
+            }
+            for function, (
+                primitive_calls,
+                calls,
+                own_time,
+                cumulative_time,
+                callers,
+            ) in stats.items()
+        ]
+        return _top(rows, self.top)
+
+
+class _SampledExecution(object):
+    def __init__(self, thread_id, deadline, root=None):
+        self.thread_id = thread_id
+        self.deadline = deadline
+        # the frame of the wrapper, the frames under it (the consumer, the
+        # threading ones) are in every sample and are not recorded
+        self.root = root
+        self.samples = 0
+        self.own = {}
+        self.cumulative = {}
+
+    def sample(self, frame):
+        self.samples += 1
+        seen = set()
+        top = True
+        while frame is not None and frame is not self.root:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if top:
+                self.own[key] = self.own.get(key, 0) + 1
+                top = False
+            # recursive functions are counted once by sample
+            if key not in seen:
+                seen.add(key)
+                self.cumulative[key] = self.cumulative.get(key, 0) + 1
+            frame = frame.f_back
+
+
+class StackSampler(object):
+    """Sample the stack of the executions that last more than a threshold.
+
+    Only one background thread is used for all the executions, it sleeps
+    while there is no execution being watched, so each call only pays for
+    adding and removing itself from a dict. The stack of an execution is
+    sampled every 'interval' seconds after its threshold.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._executions = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, threshold, root=None):
+        """Start watching the current thread, return the execution.
+
+        Arguments:
+            - threshold: seconds after which the stack is sampled
+            - root: the frame where the walk of the stack stops, the
+                functions it calls are recorded but not it nor its callers
+        """
+        execution = _SampledExecution(
+            threading.get_ident(), time.monotonic() + threshold, root
+        )
+        with self._condition:
+            self._executions[id(execution)] = execution
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="hueylogs-sampler"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+        return execution
+
+    def unwatch(self, execution, top):
+        """Stop watching 'execution', return its top functions by
+        cumulative time or None if it was not sampled."""
+        with self._condition:
+            self._executions.pop(id(execution), None)
+        if not execution.samples:
+            return None
+        rows = [
+            {
+                "function": _function_name(*key),
+                "calls": None,
+                "own_time": execution.own.get(key, 0) * self.interval,
+                "cumulative_time": count * self.interval,
+            }
+            for key, count in execution.cumulative.items()
+        ]
+        return _top(rows, top)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._executions:
+                    self._condition.wait()
+                now = time.monotonic()
+                due = [
+                    execution
+                    for execution in self._executions.values()
+                    if execution.deadline <= now
+                ]
+                if due:
+                    frames = sys._current_frames()
+                    for execution in due:
+                        frame = frames.get(execution.thread_id)
+                        if frame is not None:
+                            execution.sample(frame)
+                    next_wake = self.interval
+                else:
+                    next_wake = min(
+                        execution.deadline - now
+                        for execution in self._executions.values()
+                    )
+                # woken early when a new execution is watched
+                self._condition.wait(max(next_wake, self.interval))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Return the StackSampler shared by all the executions."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = StackSampler(get_profiling_settings()["interval"])
+        return _sampler
+
+
+class ExecutionProfiler(object):
+    """Profile an execution if it is selected by 'sample_rate' (with
+    cProfile) or if it lasts more than 'threshold' seconds (with the stack
+    sampler).
+
+    Arguments:
+        - threshold: seconds after which the stack of the execution starts
+            being sampled. None disables it
+        - sample_rate: fraction of the executions profiled with cProfile
+    """
+
+    def __init__(self, threshold=None, sample_rate=0):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.name = None
+        self._profiler = None
+        self._execution = None
+
+    def start(self, root=None):
+        """Start profiling, 'root' is the frame of the wrapper of the
+        execution, the stack samples stop there."""
+        top = get_profiling_settings()["top"]
+        if self.sample_rate and random.random() < self.sample_rate:
+            try:
+                self._profiler = CProfileProfiler(top).start()
+                self.name = PROFILER_CPROFILE
+                return self
+            except ValueError:
+                # other profiler is running in this thread
+                logger.warning("hueylogs could not start cProfile")
+        if self.threshold is not None:
+            self._execution = get_sampler().watch(self.threshold, root)
+            self.name = PROFILER_SAMPLING
+        return self
+
+    def stop(self):
+        """Return the top functions of the execution or None if it was not
+        profiled."""
+        top = get_profiling_settings()["top"]
+        if self._profiler is not None:
+            return self._profiler.stop()
+        if self._execution is not None:
+            return get_sampler().unwatch(self._execution, top)
+        return None
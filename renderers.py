@@ -0,0 +1,18 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from rest_framework.renderers import BaseRenderer
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Render the text of the Prometheus exposition format as it is."""
+
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            # the errors, like the ones of the permissions
+            data = "{}\n".format(data)
+        return data.encode(self.charset)
@@ -0,0 +1,115 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# huey workers are threads, so the cpu time is measured by thread when the
+# platform allows it
+RUSAGE_CPU = getattr(resource, "RUSAGE_THREAD", None)
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+# tracemalloc is process wide, it is started by the first execution that
+# traces the memory and stopped by the last one
+_tracing = {"count": 0, "started": False}
+_tracing_lock = threading.Lock()
+
+
+def _start_tracing():
+    """Return the memory traced now."""
+    with _tracing_lock:
+        if not _tracing["count"]:
+            _tracing["started"] = not tracemalloc.is_tracing()
+            if _tracing["started"]:
+                tracemalloc.start()
+            else:
+                # only when no other execution is measuring its peak
+                tracemalloc.reset_peak()
+        _tracing["count"] += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing():
+    """Return the peak of traced memory since the first running execution
+    started tracing."""
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing["count"] -= 1
+        if not _tracing["count"] and _tracing["started"]:
+            tracemalloc.stop()
+            _tracing["started"] = False
+        return peak
+
+
+def _cpu_times():
+    """Return the (user, system) cpu seconds of the thread or process."""
+    if RUSAGE_CPU is not None:
+        usage = resource.getrusage(RUSAGE_CPU)
+        return usage.ru_utime, usage.ru_stime
+    times = os.times()
+    return times.user, times.system
+
+
+def _max_rss():
+    """Return the peak resident set size of the process in bytes."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+class ResourceUsage(object):
+    """Measure the resources used by an execution between 'start' and
+    'stop'.
+
+    The peak RSS is of the whole process, so 'rss_delta' is how much the
+    execution raised the peak of the process (zero if it stayed under a
+    previous peak). The tracemalloc peak is exact but slows the allocations
+    down and, as the RSS, is shared by the threads and coroutines running at
+    the same time: when the executions overlap the peak is the one since
+    the first of them started, so it can include the memory of the others.
+    tracemalloc keeps running while any execution is measured.
+
+    Arguments:
+        - trace_memory: if True the peak of memory allocated by python is
+            measured with tracemalloc
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+
+    def start(self):
+        if self.trace_memory:
+            self._traced = _start_tracing()
+        self._max_rss = _max_rss()
+        self._cpu = _cpu_times()
+        self._wall = time.perf_counter()
+        return self
+
+    def stop(self):
+        """Return a dict with the fields of HueyExecutionLog measured."""
+        wall = time.perf_counter() - self._wall
+        cpu_user, cpu_system = _cpu_times()
+        max_rss = _max_rss()
+        values = {
+            "wall_time": wall,
+            "cpu_user_time": cpu_user - self._cpu[0],
+            "cpu_system_time": cpu_system - self._cpu[1],
+            "rss_delta": None,
+            "memory_peak": None,
+        }
+        if max_rss is not None:
+            values["rss_delta"] = max_rss - self._max_rss
+        if self.trace_memory:
+            values["memory_peak"] = max(_stop_tracing() - self._traced, 0)
+        return values
@@ -0,0 +1,163 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from hueylogs.fulltext import unindex_tracebacks
+from hueylogs.models import (
+    HueyExecutionLog,
+    HueyExecutionSlot,
+    HueyTraceback,
+)
+
+logger = logging.getLogger("hueylogs")
+
+# the slots are only checked in the window they were claimed, the windows
+# are at most one day long
+SLOTS_MAX_AGE = timedelta(days=2)
+# a traceback is stored before the log that references it is written, the
+# buffered logs can take a while
+TRACEBACKS_GRACE = timedelta(hours=1)
+
+
+def _as_timedelta(value):
+    if value is None or isinstance(value, timedelta):
+        return value
+    return timedelta(days=value)
+
+
+def get_retention():
+    """Return the 'HUEYLOGS_RETENTION' setting with the default values.
+
+    Example of the setting:
+
+    HUEYLOGS_RETENTION = {
+        "max_age": 30,  # days or timedelta, None keeps the logs forever
+        "codes": {"myapp.tasks.my_task": 7},  # max_age of some tasks
+        "keep_last": 1000,  # max logs kept by task
+        "batch_size": 1000,  # max logs deleted by query
+        "crontab": {"minute": "0", "hour": "3"},  # prune periodically
+    }
+    """
+    retention = {
+        "max_age": None,
+        "codes": {},
+        "keep_last": None,
+        "batch_size": 1000,
+        "crontab": None,
+    }
+    retention.update(getattr(settings, "HUEYLOGS_RETENTION", {}))
+    return retention
+
+
+def _delete_in_batches(queryset, batch_size, before_delete=None):
+    """Delete the rows of 'queryset' in primary key ranges of at most
+    'batch_size' rows, so each delete is a short transaction.
+
+    'before_delete' is called with the queryset of each batch before it is
+    deleted."""
+    deleted = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        batch = queryset.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        if before_delete is not None:
+            before_delete(batch)
+        deleted += batch.delete()[0]
+        last_pk = pks[-1]
+
+
+def prune_logs(
+    max_age=None, codes=None, keep_last=None, batch_size=None, now=None
+):
+    """Delete the logs out of the retention, return a report of the run.
+
+    The arguments not given are read from the 'HUEYLOGS_RETENTION' setting.
+
+    Arguments:
+        - max_age: timedelta or days, logs older than it are deleted
+        - codes: dict of task code to max_age, overrides 'max_age'
+        - keep_last: only the last 'keep_last' logs of each task are kept
+        - batch_size: max number of logs deleted by query
+        - now: datetime used as the current time
+    """
+    retention = get_retention()
+    max_age = _as_timedelta(
+        retention["max_age"] if max_age is None else max_age
+    )
+    codes = retention["codes"] if codes is None else codes
+    keep_last = retention["keep_last"] if keep_last is None else keep_last
+    batch_size = batch_size or retention["batch_size"]
+    now = now or timezone.now()
+    started = time.time()
+
+    expired = Q()
+    for code, code_max_age in codes.items():
+        expired |= Q(
+            code=code, start_time__lt=now - _as_timedelta(code_max_age)
+        )
+    if max_age is not None:
+        expired |= ~Q(code__in=list(codes)) & Q(start_time__lt=now - max_age)
+
+    deleted = 0
+    if expired:
+        deleted += _delete_in_batches(
+            HueyExecutionLog.objects.filter(expired), batch_size
+        )
+    if keep_last is not None:
+        all_codes = list(
+            HueyExecutionLog.objects.order_by()
+            .values_list("code", flat=True)
+            .distinct()
+        )
+        for code in all_codes:
+            queryset = HueyExecutionLog.objects.filter(code=code)
+            if keep_last > 0:
+                oldest_kept = list(
+                    queryset.order_by("-start_time").values_list(
+                        "start_time", flat=True
+                    )[keep_last - 1 : keep_last]
+                )
+                if not oldest_kept:
+                    continue
+                queryset = queryset.filter(start_time__lt=oldest_kept[0])
+            deleted += _delete_in_batches(queryset, batch_size)
+
+    slots_deleted = _delete_in_batches(
+        HueyExecutionSlot.objects.filter(slot_start__lt=now - SLOTS_MAX_AGE),
+        batch_size,
+    )
+    tracebacks_deleted = _delete_in_batches(
+        HueyTraceback.objects.filter(
+            logs__isnull=True, last_stored__lt=now - TRACEBACKS_GRACE
+        ),
+        batch_size,
+        # their text is only in the rows, the index must be cleaned first
+        before_delete=unindex_tracebacks,
+    )
+    report = {
+        "deleted": deleted,
+        "slots_deleted": slots_deleted,
+        "tracebacks_deleted": tracebacks_deleted,
+        "elapsed": time.time() - started,
+    }
+    logger.info(
+        "hueylogs pruned %s logs, %s slots and %s tracebacks in %.2f "
+        "seconds",
+        report["deleted"],
+        report["slots_deleted"],
+        report["tracebacks_deleted"],
+        report["elapsed"],
+    )
+    return report
@@ -0,0 +1,51 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+APP_LABEL = "hueylogs"
+
+
+def get_log_database():
+    """Return the database alias of the logs, the 'HUEYLOGS_DATABASE'
+    setting."""
+    return getattr(settings, "HUEYLOGS_DATABASE", DEFAULT_DB_ALIAS)
+
+
+class HueyLogsRouter(object):
+    """Route the models of hueylogs to the 'HUEYLOGS_DATABASE' alias.
+
+    Add it to the routers of the project:
+
+    DATABASE_ROUTERS = ["hueylogs.routers.HueyLogsRouter"]
+    HUEYLOGS_DATABASE = "logs"
+
+    The alias can point to the same database of 'default', the logs are
+    still written in their own connection, out of the transactions of the
+    tasks. With the 'default' alias they are written inside them and are
+    rolled back with the task.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return get_log_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return get_log_database()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if (
+            obj1._meta.app_label == APP_LABEL
+            and obj2._meta.app_label == APP_LABEL
+        ):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == APP_LABEL:
+            return db == get_log_database()
+        return None
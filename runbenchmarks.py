@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Run the hueylogs benchmarks and print the results as JSON.
+
+Usage: python runbenchmarks.py [benchmark ...] [--rows 10000,1000000]
+    [--workers 4,16] [--worker-type thread|process]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+from importlib import import_module
+
+import django
+from django.conf import settings
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..")))
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("benchmarks", nargs="*", default=["query_plans"])
+parser.add_argument(
+    "--rows",
+    default="10000",
+    help="comma separated sizes of the log table to benchmark",
+)
+parser.add_argument(
+    "--database",
+    default=os.path.join(tempfile.gettempdir(), "hueylogs_bench.sqlite3"),
+    help="sqlite file used by the benchmarks, it is recreated",
+)
+parser.add_argument(
+    "--workers",
+    default="4",
+    help="comma separated numbers of concurrent workers of the load",
+)
+parser.add_argument(
+    "--worker-type",
+    choices=["thread", "process"],
+    default="thread",
+    help="if the workers of the load are threads or processes",
+)
+options = parser.parse_args()
+huey_database = options.database + ".huey"
+
+for path in (options.database, huey_database):
+    if os.path.exists(path):
+        os.remove(path)
+
+settings.configure(
+    SECRET_KEY="django_benchmarks_secret_key",
+    DEBUG=False,
+    # a file, so the locks of the tasks are shared by the load processes
+    HUEY={"huey_class": "huey.SqliteHuey", "filename": huey_database},
+    INSTALLED_APPS=(
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "hueylogs",
+    ),
+    ROOT_URLCONF="hueylogs.urls",
+    DATABASES={
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": options.database,
+        }
+    },
+    TIME_ZONE="UTC",
+    USE_TZ=True,
+)
+django.setup()
+# the failure benchmarks log each error
+logging.getLogger("hueylogs").addHandler(logging.NullHandler())
+
+from django.core.management import call_command  # noqa: E402
+
+call_command("migrate", verbosity=0)
+results = {}
+for name in options.benchmarks:
+    module = import_module("hueylogs.benchmarks.{}".format(name))
+    results[name] = module.run(
+        rows=[int(i) for i in options.rows.split(",")], options=options
+    )
+json.dump(results, sys.stdout, indent=2, default=str)
+sys.stdout.write("\n")
@@ -67,7 +67,11 @@ settings.configure(
     DATABASES={
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
-        }
+        },
+        # used by the tests of the 'HUEYLOGS_DATABASE' setting
+        "logs": {
+            "ENGINE": "django.db.backends.sqlite3",
+        },
     },
     LANGUAGE_CODE="en-us",
     TIME_ZONE="UTC",
@@ -0,0 +1,45 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import threading
+
+
+class SuccessSampler(object):
+    """Choose which successful executions are written when only a fraction
+    of them is logged.
+
+    The successes of each task are counted and one of every
+    round(1 / sample_rate) is written with the count of successes it
+    represents as its weight, so the sum of the weights is the number of
+    successes. The first success after a failure is always written, so
+    the consecutive failures seen by 'max_tries' are reset.
+    """
+
+    def __init__(self):
+        self._skipped = {}
+        self._must_write = set()
+        self._lock = threading.Lock()
+
+    def add_failure(self, code):
+        """Make the next success of 'code' be written."""
+        with self._lock:
+            self._must_write.add(code)
+
+    def add_success(self, code, sample_rate):
+        """Return the weight of the success if it must be written or None.
+
+        Arguments:
+            - code: the task code
+            - sample_rate: fraction of the successes written, from 0 to 1
+        """
+        period = max(int(round(1.0 / sample_rate)), 1)
+        with self._lock:
+            count = self._skipped.pop(code, 0) + 1
+            if count >= period or code in self._must_write:
+                self._must_write.discard(code)
+                return count
+            self._skipped[code] = count
+            return None
+
+
+success_sampler = SuccessSampler()
@@ -0,0 +1,95 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class Schedule(object):
+    """Table of the windows of the day where a task can run.
+
+    Each hour of 'hours' opens a window from the hour to 'minutes_tolerance'
+    minutes after it (inclusive). The windows are compiled to a sorted table
+    of minute of the day intervals, a window crossing the midnight is split
+    in two intervals.
+
+    Arguments:
+        - hours: a list of datetime.time
+        - minutes_tolerance: int, size of the windows in minutes
+    """
+
+    def __init__(self, hours, minutes_tolerance):
+        self.hours = list(hours)
+        self.minutes_tolerance = minutes_tolerance
+        self.check_incompatible_hours()
+
+        intervals = []
+        for hour in self.hours:
+            start = hour.hour * 60 + hour.minute
+            end = start + minutes_tolerance
+            if end < MINUTES_PER_DAY:
+                intervals.append((start, end, hour, 0))
+            else:
+                # the last item is how many days ago the window opened
+                intervals.append((start, MINUTES_PER_DAY - 1, hour, 0))
+                intervals.append(
+                    (0, min(end - MINUTES_PER_DAY, start - 1), hour, 1)
+                )
+        intervals.sort(key=lambda interval: interval[0])
+        self._intervals = intervals
+        self._starts = [interval[0] for interval in intervals]
+
+    def check_incompatible_hours(self):
+        """Raise ValueError if a hour is less than 'minutes_tolerance' of
+        another, also across the midnight."""
+        minutes = sorted(
+            (hour.hour * 60 + hour.minute, hour) for hour in self.hours
+        )
+        pairs = list(zip(minutes, minutes[1:]))
+        if len(minutes) > 1:
+            pairs.append(
+                (minutes[-1], (minutes[0][0] + MINUTES_PER_DAY, minutes[0][1]))
+            )
+        for (minute_a, hour_a), (minute_b, hour_b) in pairs:
+            delta_minutes = minute_b - minute_a
+            if delta_minutes <= self.minutes_tolerance:
+                raise ValueError(
+                    "Is not possible have hours with less than {} minutes "
+                    "of distance. Incompatible hours: {} and {}".format(
+                        self.minutes_tolerance, hour_a, hour_b
+                    )
+                )
+
+    def lookup(self, minute_of_day):
+        """Return the (start, end, hour, days_ago) interval of the window
+        open in 'minute_of_day', None if there is no window open."""
+        index = bisect_right(self._starts, minute_of_day) - 1
+        if index < 0:
+            return None
+        interval = self._intervals[index]
+        if minute_of_day > interval[1]:
+            return None
+        return interval
+
+    def slot(self, now):
+        """Return the hour of the window open in 'now', None if no one is.
+
+        Arguments:
+            - now: datetime.datetime, local time without tzinfo
+        """
+        interval = self.lookup(now.hour * 60 + now.minute)
+        if interval is None:
+            return None
+        return interval[2]
+
+    def slot_start(self, now):
+        """Return the datetime when the window open in 'now' was opened,
+        None if there is no window open."""
+        interval = self.lookup(now.hour * 60 + now.minute)
+        if interval is None:
+            return None
+        hour = interval[2]
+        day = now.date() - timedelta(days=interval[3])
+        return datetime(day.year, day.month, day.day, hour.hour, hour.minute)
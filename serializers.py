@@ -4,10 +4,53 @@ from __future__ import unicode_literals
 
 from rest_framework import serializers
 
-from .models import HueyExecutionLog
+from .models import (
+    HueyDailyRollup,
+    HueyExecutionLog,
+    HueyExecutionProfile,
+    HueyHourlyRollup,
+    HueyTaskStatus,
+)
 
 
-class HueyExecutionLogSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin(object):
+    """Let the request choose the fields with '?fields=' or '?omit='.
+
+    Both receive a comma separated list of field names, example:
+    '?fields=code,start_time' or '?omit=error_description'.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsetMixin, self).__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+        kept = self.get_sparse_fields(request.query_params, self.fields)
+        for name in list(self.fields):
+            if name not in kept:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_sparse_fields(cls, query_params, field_names):
+        """Return the names of 'field_names' requested in 'query_params'."""
+        names = list(field_names)
+        if query_params.get("fields"):
+            requested = set(query_params["fields"].split(","))
+            names = [name for name in names if name in requested]
+        if query_params.get("omit"):
+            omitted = set(query_params["omit"].split(","))
+            names = [name for name in names if name not in omitted]
+        return names
+
+
+class HueyExecutionLogSerializer(
+    SparseFieldsetMixin, serializers.ModelSerializer
+):
+    # the full traceback, decompressed from HueyTraceback
+    error_description = serializers.CharField(
+        source="error_text", read_only=True
+    )
+
     class Meta:
         model = HueyExecutionLog
         fields = (
@@ -16,6 +59,106 @@ class HueyExecutionLogSerializer(serializers.ModelSerializer):
             "end_time",
             "is_success",
             "error_description",
+            "error_fingerprint",
             "finnished",
+            "wall_time",
+            "cpu_user_time",
+            "cpu_system_time",
+            "rss_delta",
+            "memory_peak",
+            "queue_wait",
+            "last_heartbeat",
+            "crashed",
             "pk",
         )
+
+
+class HueyExecutionProfileSerializer(serializers.ModelSerializer):
+    code = serializers.CharField(source="log.code", read_only=True)
+
+    class Meta:
+        model = HueyExecutionProfile
+        fields = (
+            "log",
+            "code",
+            "profiler",
+            "function",
+            "calls",
+            "own_time",
+            "cumulative_time",
+        )
+
+
+class HueyTaskStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HueyTaskStatus
+        fields = (
+            "code",
+            "last_start",
+            "last_success",
+            "last_failure",
+            "consecutive_failures",
+            "total_runs",
+            "is_healthy",
+        )
+
+
+class HueyExecutionRollupSerializer(serializers.ModelSerializer):
+    duration_p50 = serializers.SerializerMethodField()
+    duration_p95 = serializers.SerializerMethodField()
+    duration_p99 = serializers.SerializerMethodField()
+
+    class Meta:
+        fields = (
+            "code",
+            "bucket",
+            "run_count",
+            "success_count",
+            "failure_rate",
+            "duration_sum",
+            "duration_avg",
+            "duration_min",
+            "duration_max",
+            "duration_p50",
+            "duration_p95",
+            "duration_p99",
+            "histogram",
+        )
+
+    def get_duration_p50(self, obj):
+        return obj.percentile(50)
+
+    def get_duration_p95(self, obj):
+        return obj.percentile(95)
+
+    def get_duration_p99(self, obj):
+        return obj.percentile(99)
+
+
+class HueyHourlyRollupSerializer(HueyExecutionRollupSerializer):
+    class Meta(HueyExecutionRollupSerializer.Meta):
+        model = HueyHourlyRollup
+
+
+class HueyDailyRollupSerializer(HueyExecutionRollupSerializer):
+    class Meta(HueyExecutionRollupSerializer.Meta):
+        model = HueyDailyRollup
+
+
+class HueyExecutionStatsSerializer(serializers.Serializer):
+    """Aggregates of the finished logs of a task, by period if 'bucket'."""
+
+    code = serializers.CharField()
+    bucket = serializers.DateTimeField(required=False)
+    count = serializers.IntegerField()
+    success_count = serializers.IntegerField()
+    success_ratio = serializers.SerializerMethodField()
+    duration_avg = serializers.DurationField()
+    duration_min = serializers.DurationField()
+    duration_max = serializers.DurationField()
+    last_run = serializers.DateTimeField()
+
+    def get_success_ratio(self, obj):
+        if not obj["count"]:
+            return None
+        return obj["success_count"] / float(obj["count"])
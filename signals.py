@@ -0,0 +1,210 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import threading
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from huey import signals as huey_signals
+from huey.constants import EmptyData
+
+from hueylogs.backends import get_default_backend
+from hueylogs.models import HueyExecutionLog
+from hueylogs.tracebacks import capture_exception, summarize_traceback
+
+# signals that end an execution that started without an error
+FAILURE_SIGNALS = (
+    huey_signals.SIGNAL_INTERRUPTED,
+    huey_signals.SIGNAL_LOCKED,
+    huey_signals.SIGNAL_RATE_LIMITED,
+    huey_signals.SIGNAL_TIMEOUT,
+)
+# signals of tasks that were not executed
+SKIPPED_SIGNALS = (huey_signals.SIGNAL_EXPIRED, huey_signals.SIGNAL_REVOKED)
+
+
+def get_signals_settings():
+    """Return the 'HUEYLOGS_SIGNALS' setting with the default values.
+
+    Example of the setting:
+
+    HUEYLOGS_SIGNALS = {
+        "enabled": True,  # log all the huey tasks, connected in apps.py
+        "queue_wait": True,  # store the enqueue time of the tasks
+    }
+    """
+    options = {"enabled": False, "queue_wait": True}
+    options.update(getattr(settings, "HUEYLOGS_SIGNALS", {}))
+    return options
+
+
+class SignalLogger(object):
+    """Log the executions of all the tasks of 'huey' from its signals,
+    without decorating the tasks.
+
+    The time between the task being enqueued (or its eta, if later) and
+    the start of its execution is stored in 'queue_wait'. The enqueue time
+    is kept in the huey storage from the 'enqueued' signal, sent by the
+    process that enqueued the task, to the 'executing' one, so the clocks
+    of the machines must be in sync. The tasks decorated with
+    'register_log' are skipped, they are already logged.
+
+    Arguments:
+        - huey: the Huey instance whose signals are received
+        - backend: the LogBackend where the logs are written, default is
+            the one configured in 'HUEYLOGS_BACKEND' setting
+        - queue_wait: if False the enqueue time is not stored, only the
+            tasks with an eta have 'queue_wait'
+    """
+
+    key_prefix = "hueylogs.enqueued."
+
+    def __init__(self, huey, backend=None, queue_wait=True):
+        self.huey = huey
+        self.backend = backend or get_default_backend()
+        self.queue_wait = queue_wait
+        # logs of the tasks being executed, by task id
+        self._running = {}
+        self._lock = threading.Lock()
+        self._handlers = {
+            huey_signals.SIGNAL_ENQUEUED: self.enqueued,
+            huey_signals.SIGNAL_RETRYING: self.enqueued,
+            huey_signals.SIGNAL_EXECUTING: self.executing,
+            huey_signals.SIGNAL_COMPLETE: self.complete,
+            huey_signals.SIGNAL_ERROR: self.error,
+            huey_signals.SIGNAL_CANCELED: self.canceled,
+        }
+        for signal in FAILURE_SIGNALS:
+            self._handlers[signal] = self.failed
+        for signal in SKIPPED_SIGNALS:
+            self._handlers[signal] = self.skipped
+
+    def connect(self):
+        self.huey.signal(*self._handlers)(self.handle)
+        return self
+
+    def disconnect(self):
+        self.huey.disconnect_signal(self.handle, *self._handlers)
+
+    def handle(self, signal, task, *args, **kwargs):
+        code = HueyExecutionLog.task_to_string(type(task))
+        if code in HueyExecutionLog.registered_codes:
+            return
+        self._handlers[signal](signal, code, task, *args, **kwargs)
+
+    def _pop_enqueued(self, task):
+        """Return when the task was enqueued or None if it is unknown."""
+        if not self.queue_wait:
+            return None
+        data = self.huey.storage.pop_data(self.key_prefix + task.id)
+        if data is EmptyData:
+            return None
+        return datetime.fromtimestamp(float(data), dt_timezone.utc)
+
+    def _ready_time(self, task):
+        """Return since when the task could be executed or None."""
+        ready_time = self._pop_enqueued(task)
+        if task.eta is not None:
+            eta = task.eta
+            if timezone.is_naive(eta):
+                eta = (
+                    eta.replace(tzinfo=dt_timezone.utc)
+                    if self.huey.utc
+                    else timezone.make_aware(eta)
+                )
+            if ready_time is None or eta > ready_time:
+                ready_time = eta
+        return ready_time
+
+    def _start_log(self, code, task):
+        start_time = timezone.now()
+        log_instance = HueyExecutionLog(
+            code=code,
+            start_time=start_time,
+            end_time=start_time,
+            finnished=False,
+            is_success=False,
+        )
+        ready_time = self._ready_time(task)
+        if ready_time is not None:
+            # clocks of different machines can be a bit off
+            log_instance.queue_wait = max(
+                start_time - ready_time, timedelta(0)
+            )
+        return log_instance
+
+    def _finish_log(self, log_instance, is_success, error_text=None):
+        log_instance.finnished = True
+        log_instance.is_success = is_success
+        log_instance.end_time = timezone.now()
+        if error_text is not None:
+            log_instance.error_description = summarize_traceback(error_text)
+            log_instance.error_text = error_text
+        self.backend.write_finish(log_instance)
+
+    def enqueued(self, signal, code, task):
+        if self.queue_wait:
+            self.huey.storage.put_data(
+                self.key_prefix + task.id,
+                repr(timezone.now().timestamp()).encode("utf-8"),
+            )
+
+    def executing(self, signal, code, task):
+        log_instance = self._start_log(code, task)
+        with self._lock:
+            self._running[task.id] = log_instance
+        self.backend.write_start(log_instance)
+
+    def complete(self, signal, code, task):
+        with self._lock:
+            log_instance = self._running.pop(task.id, None)
+        if log_instance is not None:
+            self._finish_log(log_instance, True)
+
+    def error(self, signal, code, task, exc):
+        with self._lock:
+            log_instance = self._running.pop(task.id, None)
+        if log_instance is None:
+            return
+        error_text, log_instance.error_fingerprint = capture_exception(
+            (type(exc), exc, exc.__traceback__)
+        )
+        self._finish_log(log_instance, False, error_text)
+
+    def failed(self, signal, code, task):
+        with self._lock:
+            log_instance = self._running.pop(task.id, None)
+        if log_instance is not None:
+            self._finish_log(log_instance, False, "Task {}".format(signal))
+
+    def canceled(self, signal, code, task):
+        # a pre_execute hook can cancel the task before SIGNAL_EXECUTING
+        with self._lock:
+            running = task.id in self._running
+        if running:
+            self.failed(signal, code, task)
+        else:
+            self.skipped(signal, code, task)
+
+    def skipped(self, signal, code, task):
+        self._finish_log(
+            self._start_log(code, task), False, "Task {}".format(signal)
+        )
+
+
+_signal_logger = None
+
+
+def connect_signals():
+    """Log all the tasks of the djhuey instance, called by apps.py when
+    'HUEYLOGS_SIGNALS' is enabled."""
+    global _signal_logger
+    from huey.contrib.djhuey import HUEY
+
+    if _signal_logger is None:
+        _signal_logger = SignalLogger(
+            HUEY, queue_wait=get_signals_settings()["queue_wait"]
+        ).connect()
+    return _signal_logger
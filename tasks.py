@@ -0,0 +1,26 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task
+
+from hueylogs.heartbeats import get_heartbeat_settings, reap_crashed
+from hueylogs.retention import get_retention, prune_logs
+
+_prune_crontab = get_retention()["crontab"]
+_reap_crontab = get_heartbeat_settings()["crontab"]
+
+if _prune_crontab:
+
+    @db_periodic_task(crontab(**_prune_crontab))
+    def prune_hueylogs():
+        """Apply the 'HUEYLOGS_RETENTION' setting periodically."""
+        return prune_logs()
+
+
+if _reap_crontab:
+
+    @db_periodic_task(crontab(**_reap_crontab))
+    def reap_crashed_hueylogs():
+        """Mark the executions without heartbeat as crashed periodically."""
+        return reap_crashed()
@@ -1,15 +1,61 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import asyncio
+import gzip
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import threading
 import time
+import tracemalloc
 from datetime import datetime
+from datetime import time as datetimetime
+from io import StringIO
+from unittest import mock
 
 from dateutil.relativedelta import relativedelta
-from django.test import TestCase
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from huey import SqliteHuey
+from huey import signals as huey_signals
+from huey.exceptions import CancelExecution
 
+from hueylogs.backends import FileBackend, HueyStorageBackend
 from hueylogs.exceptions import HueyMaxTriesException
-from hueylogs.models import HueyExecutionLog
+from hueylogs.fulltext import (
+    clear_fulltext_cache,
+    disable_fulltext,
+    enable_fulltext,
+    fulltext_enabled,
+    repair_fulltext,
+    supports_fulltext,
+)
+from hueylogs.heartbeats import get_heartbeat, reap_crashed
+from hueylogs.metrics import MultiprocessMetricsRegistry, get_metrics_registry
+from hueylogs.models import (
+    HueyDailyRollup,
+    HueyExecutionLog,
+    HueyExecutionProfile,
+    HueyExecutionSlot,
+    HueyHourlyRollup,
+    HueyTaskStatus,
+    HueyTraceback,
+)
+from hueylogs.resources import ResourceUsage
+from hueylogs.retention import prune_logs
+from hueylogs.schedule import Schedule
+from hueylogs.signals import SignalLogger
+from hueylogs.tracebacks import capture_exception
+from hueylogs.writers import BufferedLogWriter
 
 
 class DecoratorsTest(TestCase):
@@ -87,6 +133,10 @@ class DecoratorsTest(TestCase):
 
         toggle_variable(VariableToggle)
         self.assertTrue(VariableToggle.runned)
+        self.assertEqual(
+            HueyExecutionLog.objects.get().claimed_slot,
+            HueyExecutionSlot.objects.get().slot_start,
+        )
 
         VariableToggle.runned = False
 
@@ -103,6 +153,7 @@ class DecoratorsTest(TestCase):
         self.assertFalse(VariableToggle.runned)
 
         HueyExecutionLog.objects.all().delete()
+        HueyExecutionSlot.objects.all().delete()
         VariableToggle.runned = False
 
         @HueyExecutionLog.run_at_times(
@@ -119,6 +170,31 @@ class DecoratorsTest(TestCase):
         toggle_variable(VariableToggle)
         self.assertFalse(VariableToggle.runned)
 
+    def test_run_at_times_retries_after_try_again_delay(self):
+        calls = []
+
+        @HueyExecutionLog.run_at_times(hours=[datetime.now().time()])
+        @HueyExecutionLog.max_tries(max_tries=1, try_again_delay=5)
+        @HueyExecutionLog.register_log
+        def _retried():
+            calls.append(1)
+
+        status = HueyTaskStatus.objects.create(
+            code=HueyExecutionLog.task_to_string(_retried),
+            last_start=timezone.now(),
+            consecutive_failures=1,
+        )
+        # skipped by max_tries, the window is not used up
+        _retried()
+        self.assertEqual(calls, [])
+        self.assertFalse(HueyExecutionSlot.objects.exists())
+
+        status.last_start = timezone.now() - relativedelta(minutes=10)
+        status.save()
+        _retried()
+        self.assertEqual(calls, [1])
+        self.assertEqual(HueyExecutionSlot.objects.count(), 1)
+
     def test_max_tries_decorator(self):
         # we must decorate the task with register_log before
         # use max_tries decorator
@@ -173,3 +249,1278 @@ class DecoratorsTest(TestCase):
         # were in error, so it must raises a maxtriesexception again
         with self.assertRaises(HueyMaxTriesException):
             _zero_division(1)
+
+
+class BufferedLogWriterTest(TestCase):
+    def test_buffered_logs_are_written_in_batches(self):
+        writer = BufferedLogWriter(batch_size=3, flush_interval=None)
+
+        @HueyExecutionLog.register_log(buffered=writer)
+        def _pass():
+            pass
+
+        HueyTaskStatus.objects.create(
+            code=HueyExecutionLog.task_to_string(_pass)
+        )
+        with self.assertNumQueries(0):
+            _pass()
+            _pass()
+        self.assertEqual(HueyExecutionLog.objects.count(), 0)
+
+        # reaching the batch size when the third call starts writes all the
+        # logs at once and updates the task status, the third one is updated
+        # in the next flush
+        with self.assertNumQueries(2):
+            _pass()
+        self.assertEqual(HueyExecutionLog.objects.count(), 3)
+        writer.flush()
+        self.assertEqual(
+            HueyExecutionLog.objects.filter(
+                is_success=True, finnished=True
+            ).count(),
+            3,
+        )
+
+    def test_unfinished_log_is_updated_on_next_flush(self):
+        writer = BufferedLogWriter(batch_size=100, flush_interval=None)
+
+        @HueyExecutionLog.register_log(buffered=writer)
+        def _flush_while_running():
+            writer.flush()
+            raise ValueError("error")
+
+        with self.assertRaises(ValueError):
+            _flush_while_running()
+        log = HueyExecutionLog.objects.get()
+        self.assertFalse(log.finnished)
+
+        writer.close()
+        log.refresh_from_db()
+        self.assertTrue(log.finnished)
+        self.assertFalse(log.is_success)
+        self.assertIn("ValueError", log.error_description)
+        self.assertEqual(HueyExecutionLog.objects.count(), 1)
+
+
+class BufferedLogWriterThreadTest(TransactionTestCase):
+    def _log(self):
+        now = timezone.now()
+        return HueyExecutionLog(
+            code="buffered", start_time=now, end_time=now, finnished=True
+        )
+
+    def _wait_for_logs(self, count):
+        deadline = time.monotonic() + 5
+        while HueyExecutionLog.objects.count() < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_background_flush(self):
+        writer = BufferedLogWriter(batch_size=100, flush_interval=0.01)
+        self.addCleanup(writer.close)
+
+        @HueyExecutionLog.register_log(buffered=writer)
+        def _pass():
+            pass
+
+        _pass()
+        self._wait_for_logs(1)
+        writer.close()
+        self.assertFalse(writer._thread.is_alive())
+        self.assertTrue(HueyExecutionLog.objects.get().finnished)
+
+        # the thread is stopped, written right away
+        _pass()
+        self.assertEqual(
+            HueyExecutionLog.objects.filter(finnished=True).count(), 2
+        )
+
+    def test_overflow_drop(self):
+        writer = BufferedLogWriter(batch_size=2, flush_interval=60, max_size=2)
+        self.addCleanup(writer.close)
+        # the background thread can not empty the buffer meanwhile
+        with writer._flush_lock:
+            self.assertTrue(writer.add(self._log()))
+            self.assertTrue(writer.add(self._log()))
+            self.assertFalse(writer.add(self._log()))
+            self.assertEqual(writer.dropped, 1)
+        self._wait_for_logs(2)
+        writer.close()
+        self.assertEqual(HueyExecutionLog.objects.count(), 2)
+
+    def test_overflow_block(self):
+        writer = BufferedLogWriter(
+            batch_size=2, flush_interval=60, max_size=2, overflow="block"
+        )
+        self.addCleanup(writer.close)
+        with writer._flush_lock:
+            writer.add(self._log())
+            writer.add(self._log())
+            blocked = threading.Thread(target=writer.add, args=[self._log()])
+            blocked.start()
+            blocked.join(0.1)
+            self.assertTrue(blocked.is_alive())
+        # added once the background thread made room
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        writer.close()
+        self.assertEqual(HueyExecutionLog.objects.count(), 3)
+        self.assertEqual(writer.dropped, 0)
+
+
+class LogsDecoratorTest(TestCase):
+    def test_logs_query_count(self):
+        @HueyExecutionLog.logs(
+            hours=[datetime.now().time()], minutes_tolerance=1, lock=False
+        )
+        def _logs_query_count():
+            pass
+
+        HueyTaskStatus.objects.create(
+            code="{}._logs_query_count".format(__name__)
+        )
+        # the slot claim (inside a savepoint because of the test
+        # transaction), one query to read the status, two to register the log
+        # and one to update the status
+        with self.assertNumQueries(7):
+            _logs_query_count.call_local()
+        self.assertEqual(
+            HueyExecutionLog.objects.get().claimed_slot,
+            HueyExecutionSlot.objects.get().slot_start,
+        )
+
+        # already runned in this window, only the claim is tried
+        with self.assertNumQueries(4):
+            _logs_query_count.call_local()
+        self.assertEqual(HueyExecutionLog.objects.count(), 1)
+
+        @HueyExecutionLog.logs(
+            hours=[(datetime.now() + relativedelta(hours=1)).time()],
+            lock=False,
+        )
+        def _logs_not_its_time():
+            pass
+
+        with self.assertNumQueries(0):
+            _logs_not_its_time.call_local()
+
+    def test_logs_max_tries(self):
+        now = datetime.now()
+        hours = [now.time()]
+
+        @HueyExecutionLog.logs(
+            hours=hours, minutes_tolerance=1, max_tries=2, lock=False
+        )
+        def _logs_zero_division():
+            return 1 / 0.0
+
+        code = "{}._logs_zero_division".format(__name__)
+        yesterday = timezone.now() - relativedelta(days=1)
+        HueyTaskStatus.objects.create(
+            code=code, last_start=yesterday, consecutive_failures=1
+        )
+        with self.assertRaises(HueyMaxTriesException):
+            _logs_zero_division.call_local()
+        self.assertTrue(HueyExecutionLog._reached_max_tries(code, 2))
+        self.assertEqual(HueyExecutionLog.objects.count(), 1)
+
+
+class ScheduleTest(TestCase):
+    def test_slot_lookup(self):
+        schedule = Schedule(
+            [datetimetime(12, 0), datetimetime(6, 30), datetimetime(23, 50)],
+            minutes_tolerance=15,
+        )
+        self.assertEqual(
+            schedule.slot(datetime(2020, 1, 1, 6, 30)), datetimetime(6, 30)
+        )
+        self.assertEqual(
+            schedule.slot(datetime(2020, 1, 1, 12, 15)), datetimetime(12, 0)
+        )
+        self.assertIsNone(schedule.slot(datetime(2020, 1, 1, 12, 16)))
+        self.assertIsNone(schedule.slot(datetime(2020, 1, 1, 6, 29)))
+
+    def test_window_crossing_midnight(self):
+        schedule = Schedule([datetimetime(23, 50)], minutes_tolerance=15)
+        self.assertEqual(
+            schedule.slot_start(datetime(2020, 1, 2, 0, 5)),
+            datetime(2020, 1, 1, 23, 50),
+        )
+        self.assertIsNone(schedule.slot_start(datetime(2020, 1, 2, 0, 6)))
+        self.assertTrue(
+            HueyExecutionLog.its_time(
+                datetimetime(23, 50), datetime(2020, 1, 2, 0, 1), 15
+            )
+        )
+
+    def test_incompatible_hours(self):
+        with self.assertRaises(ValueError):
+            Schedule([datetimetime(1, 0), datetimetime(1, 10)], 15)
+        with self.assertRaises(ValueError):
+            HueyExecutionLog.check_incompatible_hours(
+                [datetimetime(23, 55), datetimetime(0, 5)], 15
+            )
+        Schedule([datetimetime(1, 0), datetimetime(1, 16)], 15)
+
+
+class QueryPlanTest(TestCase):
+    def test_last_executions_uses_code_start_index(self):
+        plan = (
+            HueyExecutionLog.objects.filter(code="test")
+            .order_by("-start_time")
+            .values_list("start_time", "is_success")[:3]
+            .explain()
+        )
+        self.assertIn("hueylogs_code_start_idx", plan)
+
+    def test_running_executions_use_partial_index(self):
+        plan = (
+            HueyExecutionLog.objects.filter(finnished=False)
+            .order_by("start_time")
+            .explain()
+        )
+        self.assertIn("hueylogs_unfinished_idx", plan)
+
+
+class HueyExecutionSlotTest(TestCase):
+    def test_claim(self):
+        slot_start = timezone.now().replace(second=0, microsecond=0)
+        self.assertTrue(HueyExecutionSlot.claim("test", slot_start))
+        self.assertFalse(HueyExecutionSlot.claim("test", slot_start))
+        self.assertTrue(HueyExecutionSlot.claim("other", slot_start))
+
+        HueyExecutionSlot.release("test", slot_start)
+        self.assertTrue(HueyExecutionSlot.claim("test", slot_start))
+
+
+class HueyTaskStatusTest(TestCase):
+    def test_status_is_updated_by_register_log(self):
+        @HueyExecutionLog.register_log
+        def _status_task(fail):
+            if fail:
+                raise ValueError("error")
+
+        code = HueyExecutionLog.task_to_string(_status_task)
+        for fail in (True, False, True, True):
+            try:
+                _status_task(fail)
+            except ValueError:
+                pass
+
+        status = HueyTaskStatus.objects.get(pk=code)
+        self.assertEqual(status.total_runs, 4)
+        self.assertEqual(status.consecutive_failures, 2)
+        self.assertFalse(status.is_healthy)
+        self.assertIsNotNone(status.last_success)
+        self.assertGreater(status.last_failure, status.last_success)
+
+        response = self.client.get(
+            "/hueylogs/status/{}/".format(code), HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["consecutive_failures"], 2)
+
+
+@override_settings(HUEYLOGS_ROLLUPS=True)
+class HueyExecutionRollupTest(TestCase):
+    def create_log(self, start_time, seconds, is_success=True):
+        return HueyExecutionLog.objects.create(
+            code="test",
+            start_time=start_time,
+            end_time=start_time + relativedelta(seconds=seconds),
+            is_success=is_success,
+            finnished=True,
+        )
+
+    def test_record_and_rebuild(self):
+        start = timezone.now().replace(
+            hour=10, minute=0, second=0, microsecond=0
+        )
+        logs = [
+            self.create_log(start, 0.05),
+            self.create_log(start + relativedelta(minutes=5), 2),
+            self.create_log(start + relativedelta(minutes=10), 20, False),
+            self.create_log(start + relativedelta(hours=1), 1000),
+        ]
+        HueyExecutionLog._logs_finished(logs[:2])
+        HueyExecutionLog._logs_finished(logs[2:])
+
+        hourly = HueyHourlyRollup.objects.get(bucket=start)
+        self.assertEqual(hourly.run_count, 3)
+        self.assertEqual(hourly.success_count, 2)
+        self.assertAlmostEqual(hourly.duration_sum, 22.05)
+        self.assertAlmostEqual(hourly.duration_min, 0.05)
+        self.assertAlmostEqual(hourly.duration_max, 20)
+        self.assertEqual(hourly.histogram, [1, 0, 0, 1, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(hourly.percentile(50), 5)
+        self.assertEqual(hourly.percentile(99), 20)
+        self.assertEqual(HueyHourlyRollup.objects.count(), 2)
+
+        daily = HueyDailyRollup.objects.get()
+        self.assertEqual(daily.run_count, 4)
+        self.assertEqual(daily.histogram[-1], 1)
+
+        HueyDailyRollup.objects.update(run_count=0)
+        call_command(
+            "hueylogs_rebuild_rollups", chunk_size=3, stdout=StringIO()
+        )
+        self.assertEqual(HueyDailyRollup.objects.get().run_count, 4)
+        self.assertEqual(
+            HueyHourlyRollup.objects.get(bucket=start).run_count, 3
+        )
+
+        response = self.client.get(
+            "/hueylogs/rollups/daily/?code=test",
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["run_count"], 4)
+
+
+class RetentionTest(TestCase):
+    def test_prune_logs(self):
+        now = timezone.now()
+        for code in ("a", "b"):
+            for days in range(10):
+                start_time = now - relativedelta(days=days)
+                HueyExecutionLog.objects.create(
+                    code=code, start_time=start_time, end_time=start_time
+                )
+        HueyExecutionSlot.objects.create(
+            code="a", slot_start=now - relativedelta(days=3)
+        )
+
+        report = prune_logs(max_age=5, codes={"b": 2}, batch_size=2, now=now)
+        self.assertEqual(report["deleted"], 4 + 7)
+        self.assertEqual(report["slots_deleted"], 1)
+        self.assertEqual(HueyExecutionLog.objects.filter(code="a").count(), 6)
+        self.assertEqual(HueyExecutionLog.objects.filter(code="b").count(), 3)
+
+        report = prune_logs(max_age=None, codes={}, keep_last=2, now=now)
+        self.assertEqual(report["deleted"], 4 + 1)
+        newest = HueyExecutionLog.objects.filter(code="a").latest("start_time")
+        self.assertEqual(newest.start_time, now)
+
+
+class HueyExecutionLogApiTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for minutes in range(3):
+            start_time = now - relativedelta(minutes=minutes)
+            HueyExecutionLog.objects.create(
+                code="test",
+                start_time=start_time,
+                end_time=start_time,
+                error_description="Traceback",
+            )
+
+    def test_cursor_pagination(self):
+        response = self.client.get(
+            "/hueylogs/?page_size=2", HTTP_ACCEPT="application/json"
+        )
+        page = response.json()
+        self.assertEqual(len(page["results"]), 2)
+        self.assertGreater(
+            page["results"][0]["start_time"], page["results"][1]["start_time"]
+        )
+        response = self.client.get(
+            page["next"], HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIsNone(response.json()["next"])
+
+    def test_sparse_fieldsets(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/hueylogs/?omit=error_description",
+                HTTP_ACCEPT="application/json",
+            )
+        self.assertNotIn("error_description", response.json()["results"][0])
+        self.assertFalse(
+            [i for i in queries if "error_description" in i["sql"]]
+        )
+
+        response = self.client.get(
+            "/hueylogs/?fields=code,pk", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(
+            set(response.json()["results"][0]), set(["code", "pk"])
+        )
+
+    def test_metrics_filter_and_ordering(self):
+        for wall_time in (3, 1, 2):
+            HueyExecutionLog.objects.create(
+                code="metrics",
+                start_time=timezone.now(),
+                end_time=timezone.now(),
+                wall_time=wall_time,
+            )
+        response = self.client.get(
+            "/hueylogs/?ordering=-wall_time&page_size=1&wall_time__gte=1.5",
+            HTTP_ACCEPT="application/json",
+        )
+        page = response.json()
+        self.assertEqual([i["wall_time"] for i in page["results"]], [3])
+        page = self.client.get(
+            page["next"], HTTP_ACCEPT="application/json"
+        ).json()
+        self.assertEqual([i["wall_time"] for i in page["results"]], [2])
+        self.assertIsNone(page["next"])
+
+    def test_ordering_ties(self):
+        for i in range(3):
+            HueyExecutionLog.objects.create(
+                code="ties",
+                start_time=timezone.now(),
+                end_time=timezone.now(),
+                wall_time=1,
+            )
+        url = "/hueylogs/?ordering=wall_time&page_size=1"
+        pks = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                page = self.client.get(
+                    url, HTTP_ACCEPT="application/json"
+                ).json()
+                pks += [i["pk"] for i in page["results"]]
+                url = page["next"]
+        self.assertEqual(
+            pks,
+            list(
+                HueyExecutionLog.objects.filter(code="ties")
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            ),
+        )
+        # the primary key breaks the ties
+        self.assertTrue(
+            [
+                i
+                for i in queries
+                if '"wall_time" ASC, "hueylogs_hueyexecutionlog"."id" ASC'
+                in i["sql"]
+            ]
+        )
+
+    def test_stats(self):
+        now = timezone.now()
+        for seconds, is_success, weight in ((2, True, 3), (4, False, 1)):
+            HueyExecutionLog.objects.create(
+                code="stats",
+                start_time=now - relativedelta(days=1),
+                end_time=now - relativedelta(days=1, seconds=-seconds),
+                is_success=is_success,
+                weight=weight,
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/hueylogs/stats/?code=stats", HTTP_ACCEPT="application/json"
+            )
+        self.assertEqual(len(queries), 1)
+        self.assertIn("GROUP BY", queries[0]["sql"])
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "code": "stats",
+                    "count": 4,
+                    "success_count": 3,
+                    "success_ratio": 0.75,
+                    "duration_avg": "00:00:03",
+                    "duration_min": "00:00:02",
+                    "duration_max": "00:00:04",
+                    "last_run": response.json()[0]["last_run"],
+                }
+            ],
+        )
+        # cached, also with other order and parameters that do not change
+        # the stats
+        with self.assertNumQueries(0):
+            self.client.get(
+                "/hueylogs/stats/?code=stats", HTTP_ACCEPT="application/json"
+            )
+            self.client.get(
+                "/hueylogs/stats/?page_size=1&code=stats&ordering=wall_time",
+                HTTP_ACCEPT="application/json",
+            )
+
+        # the logs without metrics are not left out
+        HueyExecutionLog.objects.filter(code="stats", weight=3).update(
+            wall_time=1
+        )
+        cache.clear()
+        response = self.client.get(
+            "/hueylogs/stats/?ordering=-wall_time&code=stats",
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.json()[0]["count"], 4)
+
+        response = self.client.get(
+            "/hueylogs/stats/?bucket=day", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(
+            [(i["code"], i["count"]) for i in response.json()],
+            [("stats", 4), ("test", 3)],
+        )
+        self.assertEqual(len(set(i["bucket"] for i in response.json())), 2)
+        response = self.client.get(
+            "/hueylogs/stats/?bucket=week", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_export(self):
+        HueyExecutionLog.objects.create(
+            code="other", start_time=timezone.now(), end_time=timezone.now()
+        )
+        response = self.client.get("/hueylogs/export/?code=test")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([i["code"] for i in records], ["test"] * 3)
+        self.assertGreater(records[0]["start_time"], records[1]["start_time"])
+
+        response = self.client.get(
+            "/hueylogs/export/?file_format=csv&gzip=true"
+        )
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = (
+            gzip.decompress(b"".join(response.streaming_content))
+            .decode("utf-8")
+            .splitlines()
+        )
+        self.assertEqual(lines[0].split(",")[:2], ["id", "code"])
+        self.assertEqual(len(lines), 5)
+
+        # the logs without metrics are exported when ordering by them
+        HueyExecutionLog.objects.filter(code="other").update(wall_time=1)
+        response = self.client.get("/hueylogs/export/?ordering=wall_time")
+        self.assertEqual(
+            len(b"".join(response.streaming_content).splitlines()), 4
+        )
+
+        @HueyExecutionLog.register_log
+        def _exported_failure():
+            raise ValueError("exported")
+
+        with self.assertRaises(ValueError):
+            _exported_failure()
+        response = self.client.get(
+            "/hueylogs/export/?is_success=false&tracebacks=true"
+            "&code={}".format(
+                HueyExecutionLog.task_to_string(_exported_failure)
+            )
+        )
+        record = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(record["error_description"], "ValueError: exported")
+        self.assertIn("_exported_failure", record["traceback"])
+
+        path = os.path.join(tempfile.mkdtemp(), "logs.csv")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command(
+            "hueylogs_export",
+            "--format=csv",
+            "--code=other",
+            "--output={}".format(path),
+        )
+        with open(path) as export_file:
+            lines = export_file.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("other", lines[1])
+
+    def test_fulltext_search(self):
+        if not supports_fulltext(connection):
+            self.skipTest("no full-text index on this database")
+        HueyExecutionLog.objects.create(
+            code="fulltext",
+            start_time=timezone.now(),
+            end_time=timezone.now(),
+            error_description="KeyError: 'customer_id'",
+        )
+        call_command("hueylogs_fulltext", stdout=StringIO())
+        self.addCleanup(disable_fulltext)
+        # written after the index was created
+        log = HueyExecutionLog.objects.create(
+            code="fulltext",
+            start_time=timezone.now(),
+            end_time=timezone.now(),
+        )
+        log.error_description = "ValueError: invalid customer"
+        log.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/hueylogs/?search=custom", HTTP_ACCEPT="application/json"
+            )
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertTrue([i for i in queries if "MATCH" in i["sql"]])
+        response = self.client.get(
+            "/hueylogs/?search=fulltext valueerror",
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(
+            [i["pk"] for i in response.json()["results"]], [log.pk]
+        )
+        log.delete()
+        response = self.client.get(
+            "/hueylogs/?search=invalid", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.json()["results"], [])
+
+        disable_fulltext()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/hueylogs/?search=ustom", HTTP_ACCEPT="application/json"
+            )
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertFalse([i for i in queries if "MATCH" in i["sql"]])
+
+
+class FullTextMigrationTest(TransactionTestCase):
+    def setUp(self):
+        if not supports_fulltext(connection):
+            self.skipTest("no full-text index on this database")
+        enable_fulltext()
+        self.addCleanup(disable_fulltext)
+
+    def test_tracebacks_and_table_remake(self):
+        @HueyExecutionLog.register_log
+        def _remade(key):
+            def _fulltext_helper_fn():
+                raise KeyError(key)
+
+            _fulltext_helper_fn()
+
+        with self.assertRaises(KeyError):
+            _remade("customer_id")
+        response = self.client.get(
+            "/hueylogs/?search=fulltext_helper", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+
+        # the remake of 'migrate' drops the triggers
+        with connection.schema_editor() as editor:
+            editor._remake_table(HueyExecutionLog)
+            editor._remake_table(HueyTraceback)
+        clear_fulltext_cache(connection)
+        self.assertFalse(fulltext_enabled(connection))
+        repair_fulltext(connection.alias)
+        self.assertTrue(fulltext_enabled(connection))
+        # other traceback, indexed by the recreated triggers
+        with self.assertRaises(KeyError):
+            _remade("order_id")
+        self.assertEqual(HueyTraceback.objects.count(), 2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/hueylogs/?search=fulltext_helper",
+                HTTP_ACCEPT="application/json",
+            )
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertTrue([i for i in queries if "MATCH" in i["sql"]])
+        # keyed by the digest, not by the rowid that VACUUM can renumber
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM {}_fts".format(HueyTraceback._meta.db_table)
+            )
+            self.assertEqual(
+                sorted(row[0] for row in cursor.fetchall()),
+                sorted(
+                    HueyTraceback.digest_key(i)
+                    for i in HueyTraceback.objects.values_list("pk", flat=True)
+                ),
+            )
+        # checked once by connection
+        with self.assertNumQueries(0):
+            self.assertTrue(fulltext_enabled(connection))
+
+
+class ResourceUsageTest(TestCase):
+    def test_register_log_metrics(self):
+        @HueyExecutionLog.register_log(trace_memory=True)
+        def _allocate():
+            data = [0] * 1000000
+            time.sleep(0.01)
+            return len(data)
+
+        @HueyExecutionLog.register_log
+        def _without_metrics():
+            pass
+
+        self.assertEqual(_allocate(), 1000000)
+        _without_metrics()
+        log = HueyExecutionLog.objects.get(code__endswith="_allocate")
+        self.assertGreaterEqual(log.wall_time, 0.01)
+        self.assertGreaterEqual(log.cpu_user_time, 0)
+        self.assertGreaterEqual(log.cpu_system_time, 0)
+        self.assertGreaterEqual(log.memory_peak, 8000000)
+        log = HueyExecutionLog.objects.get(code__endswith="_without_metrics")
+        self.assertIsNone(log.wall_time)
+        self.assertIsNone(log.memory_peak)
+
+    def test_overlapping_measures(self):
+        outer = ResourceUsage(trace_memory=True).start()
+        inner = ResourceUsage(trace_memory=True).start()
+        data = [0] * 1000000
+        self.assertGreaterEqual(inner.stop()["memory_peak"], 8000000)
+        # the first measure that stops does not stop tracemalloc
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertGreaterEqual(outer.stop()["memory_peak"], 8000000)
+        self.assertFalse(tracemalloc.is_tracing())
+        del data
+
+
+@override_settings(HUEYLOGS_PROFILING={"top": 5, "interval": 0.001})
+class HueyExecutionProfileTest(TestCase):
+    def test_cprofile_sample(self):
+        @HueyExecutionLog.register_log(profile_sample_rate=1)
+        def _profiled():
+            return sorted(range(1000), reverse=True)
+
+        _profiled()
+        log = HueyExecutionLog.objects.get()
+        functions = list(log.profile_functions.all())
+        self.assertEqual(len(functions), 5)
+        self.assertEqual(functions[0].profiler, "cprofile")
+        self.assertTrue([i for i in functions if "_profiled" in i.function])
+
+        response = self.client.get(
+            "/hueylogs/profiles/?code={}".format(log.code),
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(len(response.json()), 5)
+
+    def test_slow_executions_are_sampled(self):
+        @HueyExecutionLog.register_log(profile_threshold=0.05)
+        def _slow(seconds):
+            time.sleep(seconds)
+
+        _slow(0)
+        self.assertFalse(HueyExecutionProfile.objects.exists())
+        _slow(0.2)
+        functions = HueyExecutionProfile.objects.all()
+        self.assertTrue(functions)
+        self.assertEqual(functions[0].profiler, "sampling")
+        # only the task, not the wrapper nor what called it
+        self.assertEqual(
+            [i.function.rsplit("(", 1)[1] for i in functions], ["_slow)"]
+        )
+
+
+class SuccessSamplingTest(TestCase):
+    @override_settings(HUEYLOGS_ROLLUPS=True)
+    def test_sampled_successes_are_weighted(self):
+        @HueyExecutionLog.register_log(sample_rate=0.25)
+        def _frequent(fail=False):
+            if fail:
+                raise ValueError("error")
+
+        for i in range(10):
+            _frequent()
+        self.assertEqual(
+            list(HueyExecutionLog.objects.values_list("weight", flat=True)),
+            [4, 4],
+        )
+        with self.assertRaises(ValueError):
+            _frequent(fail=True)
+        # the success after a failure is always written
+        _frequent()
+        log = HueyExecutionLog.objects.filter(is_success=True).last()
+        self.assertEqual(log.weight, 3)
+
+        status = HueyTaskStatus.objects.get(code=log.code)
+        self.assertEqual(status.total_runs, 12)
+        self.assertEqual(status.consecutive_failures, 0)
+        rollups = HueyHourlyRollup.objects.filter(code=log.code)
+        self.assertEqual(
+            rollups.aggregate(Sum("run_count"), Sum("success_count")),
+            {"run_count__sum": 12, "success_count__sum": 11},
+        )
+
+        with self.assertRaises(ValueError):
+            HueyExecutionLog.register_log(sample_rate=0)(_frequent)
+
+
+class LogBackendTest(TestCase):
+    def assert_backend_max_tries(self, backend):
+        @HueyExecutionLog.max_tries(max_tries=2, try_again_delay=5)
+        @HueyExecutionLog.register_log(backend=backend)
+        def _flaky(fail):
+            if fail:
+                raise ValueError("error")
+
+        with self.assertNumQueries(0):
+            _flaky(False)
+            with self.assertRaises(ValueError):
+                _flaky(True)
+            with self.assertRaises(HueyMaxTriesException):
+                _flaky(True)
+            # waiting 'try_again_delay'
+            self.assertIsNone(_flaky(False))
+        outcomes = backend.recent_outcomes(_flaky.__module__ + "._flaky", 5)
+        self.assertEqual(
+            [is_success for start_time, is_success in outcomes],
+            [False, False, True],
+        )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_file_backend(self):
+        backend = FileBackend(self.directory, segment_size=1000, fsync_every=2)
+        self.addCleanup(backend.close)
+        self.assert_backend_max_tries(backend)
+        self.assertGreater(len(backend._segments()), 1)
+
+        # other process reads all the segments once, then what is appended
+        other = FileBackend(self.directory, max_outcomes=2)
+        code = __name__ + "._flaky"
+        outcomes = other.recent_outcomes(code, 5)
+        self.assertEqual([i[1] for i in outcomes], [False, False])
+        offsets = dict(other._offsets)
+        self.assertEqual(other.recent_outcomes(code, 5), outcomes)
+        self.assertEqual(other._offsets, offsets)
+        self.assertEqual(backend.recent_outcomes(code, 1), outcomes[:1])
+
+    def test_huey_storage_backend(self):
+        huey = SqliteHuey(filename=os.path.join(self.directory, "huey.db"))
+        self.assert_backend_max_tries(HueyStorageBackend(huey, max_outcomes=3))
+
+
+class SignalLoggerTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.huey = SqliteHuey(filename=os.path.join(directory, "huey.db"))
+        self.signal_logger = SignalLogger(self.huey).connect()
+        self.addCleanup(self.signal_logger.disconnect)
+
+    def run_next_task(self):
+        self.huey.execute(self.huey.dequeue())
+
+    def test_tasks_are_logged_without_decorator(self):
+        @self.huey.task()
+        def signal_task(fail):
+            if fail:
+                raise ValueError("signal error")
+
+        @self.huey.task()
+        @HueyExecutionLog.register_log
+        def decorated_task():
+            pass
+
+        signal_task(False)
+        signal_task(True)
+        decorated_task()
+        time.sleep(0.05)
+        for i in range(3):
+            self.run_next_task()
+
+        logs = HueyExecutionLog.objects.order_by("pk")
+        self.assertEqual(
+            [(i.code, i.is_success) for i in logs],
+            [
+                ("{}.signal_task".format(__name__), True),
+                ("{}.signal_task".format(__name__), False),
+                ("{}.decorated_task".format(__name__), True),
+            ],
+        )
+        self.assertGreaterEqual(logs[0].queue_wait.total_seconds(), 0.05)
+        self.assertIsNone(logs[2].queue_wait)
+        self.assertEqual(logs[1].error_description, "ValueError: signal error")
+        self.assertIn("Traceback", logs[1].error_text)
+
+    def test_revoked_task(self):
+        @self.huey.task()
+        def revoked_task():
+            pass
+
+        revoked_task().revoke()
+        self.run_next_task()
+        log = HueyExecutionLog.objects.get()
+        self.assertFalse(log.is_success)
+        self.assertEqual(log.error_description, "Task revoked")
+
+    def test_canceled_task(self):
+        @self.huey.task()
+        def canceled_task():
+            pass
+
+        @self.huey.pre_execute()
+        def cancel(task):
+            raise CancelExecution()
+
+        self.addCleanup(self.huey.unregister_pre_execute, cancel)
+        canceled_task()
+        self.run_next_task()
+        log = HueyExecutionLog.objects.get()
+        self.assertFalse(log.is_success)
+        self.assertTrue(log.finnished)
+        self.assertEqual(log.error_description, "Task canceled")
+
+        # canceled without being executed, like huey 2 does for the hooks
+        self.huey.unregister_pre_execute(cancel)
+        self.signal_logger.handle(
+            huey_signals.SIGNAL_CANCELED, canceled_task.s()
+        )
+        self.assertEqual(
+            HueyExecutionLog.objects.filter(
+                finnished=True, error_description="Task canceled"
+            ).count(),
+            2,
+        )
+
+
+class AsyncDecoratorsTest(TestCase):
+    async def test_coroutine_functions(self):
+        @HueyExecutionLog.max_tries(max_tries=1, try_again_delay=5)
+        @HueyExecutionLog.register_log
+        async def _async_task(fail):
+            await asyncio.sleep(0.05)
+            if fail:
+                raise ValueError("async error")
+            return "done"
+
+        self.assertTrue(inspect.iscoroutinefunction(_async_task))
+        self.assertEqual(await _async_task(False), "done")
+        with self.assertRaises(HueyMaxTriesException):
+            await _async_task(True)
+        # waiting 'try_again_delay'
+        self.assertIsNone(await _async_task(False))
+
+        logs = [
+            log
+            async for log in HueyExecutionLog.objects.order_by("start_time")
+        ]
+        self.assertEqual([i.is_success for i in logs], [True, False])
+        self.assertGreaterEqual(
+            (logs[0].end_time - logs[0].start_time).total_seconds(), 0.05
+        )
+
+    async def test_run_at_times(self):
+        now = datetime.now()
+
+        @HueyExecutionLog.run_at_times([now.time()])
+        @HueyExecutionLog.register_log
+        async def _async_scheduled():
+            return "done"
+
+        self.assertEqual(await _async_scheduled(), "done")
+        log = await HueyExecutionLog.objects.aget()
+        slot = await HueyExecutionSlot.objects.aget()
+        self.assertEqual(log.claimed_slot, slot.slot_start)
+        # the window was already claimed
+        self.assertIsNone(await _async_scheduled())
+
+    async def test_cancelled_coroutine(self):
+        @HueyExecutionLog.register_log
+        async def _cancelled():
+            await asyncio.sleep(10)
+
+        code = HueyExecutionLog.task_to_string(_cancelled)
+        task = asyncio.ensure_future(_cancelled())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        metrics = get_metrics_registry().snapshot()[code]
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertEqual(metrics["failures"], 1)
+        log = await HueyExecutionLog.objects.aget(code=code)
+        self.assertTrue(log.finnished)
+        self.assertFalse(log.is_success)
+        self.assertIn("CancelledError", log.error_description)
+
+    def test_logs_rejects_coroutine_functions(self):
+        async def _async_logs():
+            pass
+
+        with self.assertRaises(TypeError):
+            HueyExecutionLog.logs(hours=[datetime.now().time()])(_async_logs)
+        self.assertFalse(HueyExecutionSlot.objects.exists())
+
+
+@override_settings(
+    DATABASE_ROUTERS=["hueylogs.routers.HueyLogsRouter"],
+    HUEYLOGS_DATABASE="logs",
+)
+class HueyLogsRouterTest(TestCase):
+    databases = {"default", "logs"}
+
+    def test_logs_survive_task_rollback(self):
+        @HueyExecutionLog.register_log
+        def _rolled_back():
+            with transaction.atomic():
+                Group.objects.create(name="rolled back")
+                raise ValueError("rollback")
+
+        with self.assertRaises(ValueError):
+            _rolled_back()
+        self.assertFalse(Group.objects.exists())
+        self.assertFalse(HueyExecutionLog.objects.using("default").exists())
+        log = HueyExecutionLog.objects.get()
+        self.assertEqual(log.error_description, "ValueError: rollback")
+        self.assertEqual(log._state.db, "logs")
+        self.assertEqual(log.traceback._state.db, "logs")
+
+
+class HeartbeatTest(TestCase):
+    def test_heartbeat_and_reap(self):
+        heartbeats = []
+
+        @HueyExecutionLog.register_log(heartbeat=True)
+        def _running():
+            log = HueyExecutionLog.objects.get(finnished=False)
+            heartbeats.append(log.last_heartbeat)
+            get_heartbeat().beat()
+            log.refresh_from_db()
+            heartbeats.append(log.last_heartbeat)
+
+        _running()
+        self.assertEqual(len(heartbeats), 2)
+        self.assertGreater(heartbeats[1], heartbeats[0])
+        self.assertEqual(get_heartbeat().beat(), 0)
+
+        now = timezone.now()
+        code = "test_crashed"
+        claimed_slot = now - relativedelta(minutes=1)
+        HueyExecutionSlot.claim(code, claimed_slot)
+        log = HueyExecutionLog.objects.create(
+            code=code,
+            start_time=now,
+            end_time=now,
+            finnished=False,
+            last_heartbeat=now - relativedelta(minutes=10),
+            claimed_slot=claimed_slot,
+        )
+        # without claimed window, like the calls without run_at_times
+        HueyExecutionSlot.claim("test_other", claimed_slot)
+        HueyExecutionLog.objects.create(
+            code="test_other",
+            start_time=now,
+            end_time=now,
+            finnished=False,
+            last_heartbeat=now - relativedelta(minutes=10),
+        )
+        self.assertEqual(reap_crashed(stale_after=300, now=now), 2)
+        self.assertEqual(reap_crashed(stale_after=300, now=now), 0)
+        self.assertTrue(
+            HueyExecutionSlot.objects.filter(code="test_other").exists()
+        )
+        log.refresh_from_db()
+        self.assertTrue(log.crashed)
+        self.assertTrue(log.finnished)
+        self.assertFalse(log.is_success)
+        self.assertEqual(
+            HueyTaskStatus.objects.get(code=code).consecutive_failures, 1
+        )
+        # the window can run again
+        self.assertFalse(HueyExecutionSlot.objects.filter(code=code).exists())
+
+        out = StringIO()
+        call_command("hueylogs_reap", stdout=out)
+        self.assertIn("0 executions", out.getvalue())
+
+    def test_reaped_execution_finishing_late(self):
+        @HueyExecutionLog.register_log(heartbeat=True)
+        def _late():
+            later = timezone.now() + relativedelta(hours=1)
+            self.assertEqual(reap_crashed(stale_after=300, now=later), 1)
+
+        _late()
+        log = HueyExecutionLog.objects.get()
+        self.assertTrue(log.crashed)
+        self.assertFalse(log.is_success)
+        status = HueyTaskStatus.objects.get(code=log.code)
+        self.assertEqual(status.total_runs, 1)
+        self.assertEqual(status.consecutive_failures, 1)
+
+
+class MetricsTest(TestCase):
+    def test_register_log_metrics(self):
+        @HueyExecutionLog.register_log(sample_rate=0.5)
+        def _metrics_task(fail):
+            if fail:
+                raise ValueError("error")
+
+        code = HueyExecutionLog.task_to_string(_metrics_task)
+        for fail in (False, False, False, True):
+            try:
+                _metrics_task(fail)
+            except ValueError:
+                pass
+        # the successes not written are counted too
+        metrics = get_metrics_registry().snapshot()[code]
+        self.assertEqual(metrics["runs"], 4)
+        self.assertEqual(metrics["successes"], 3)
+        self.assertEqual(metrics["failures"], 1)
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertEqual(sum(metrics["duration_buckets"]), 4)
+
+        # an error writing the log is not counted as other call
+        backend = HueyStorageBackend(SqliteHuey(filename=":memory:"))
+
+        @HueyExecutionLog.register_log(backend=backend)
+        def _unwritten():
+            pass
+
+        backend.write_finish = mock.Mock(side_effect=OSError("disk full"))
+        with self.assertRaises(OSError):
+            _unwritten()
+        metrics = get_metrics_registry().snapshot()[
+            HueyExecutionLog.task_to_string(_unwritten)
+        ]
+        self.assertEqual((metrics["runs"], metrics["failures"]), (1, 0))
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertEqual(backend.write_finish.call_count, 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/hueylogs/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        text = response.content.decode("utf-8")
+        self.assertIn('hueylogs_runs_total{{code="{}"}} 4'.format(code), text)
+        self.assertIn(
+            'hueylogs_duration_seconds_bucket{{code="{}",le="+Inf"}} 4'.format(
+                code
+            ),
+            text,
+        )
+
+    def test_multiprocess_registry(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        registry = MultiprocessMetricsRegistry(
+            (1, 10), directory, flush_interval=60
+        )
+        registry.start("task")
+        pid = os.fork()
+        if pid == 0:
+            # the counts of the parent are not inherited
+            registry.start("task")
+            registry.finish("task", 0.5, True)
+            registry.flush()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        registry.finish("task", 20, False)
+        metrics = registry.collect()["task"]
+        self.assertEqual(metrics["runs"], 2)
+        self.assertEqual(metrics["successes"], 1)
+        self.assertEqual(metrics["failures"], 1)
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertEqual(metrics["duration_buckets"], [1, 0, 1])
+
+
+class CaptureExceptionTest(TestCase):
+    def recursion_error(self, depth):
+        def _recurse(value):
+            if value == 0:
+                raise ValueError("x" * 10000)
+            return _recurse(value - 1)
+
+        try:
+            _recurse(depth)
+        except ValueError:
+            return capture_exception(head_frames=3, tail_frames=3)
+
+    def test_bounded_traceback(self):
+        text, fingerprint = self.recursion_error(100)
+        self.assertIn("frames omitted", text)
+        self.assertEqual(text.count("in _recurse"), 5)
+        self.assertIn("ValueError", text)
+
+        text, _ = capture_exception(
+            (ValueError, ValueError("x" * 10000), None), max_bytes=1000
+        )
+        self.assertLessEqual(len(text.encode("utf-8")), 1000)
+        self.assertIn("bytes omitted", text)
+
+    def test_fingerprint(self):
+        _, fingerprint = self.recursion_error(100)
+        _, other_depth_fingerprint = self.recursion_error(200)
+        self.assertEqual(fingerprint, other_depth_fingerprint)
+
+        try:
+            raise KeyError("test")
+        except KeyError:
+            _, other_fingerprint = capture_exception()
+        self.assertNotEqual(fingerprint, other_fingerprint)
+
+    def test_register_log_stores_fingerprint(self):
+        @HueyExecutionLog.register_log
+        def _fingerprint_error():
+            raise ValueError("error")
+
+        for i in range(2):
+            with self.assertRaises(ValueError):
+                _fingerprint_error()
+        fingerprints = set(
+            HueyExecutionLog.objects.values_list(
+                "error_fingerprint", flat=True
+            )
+        )
+        self.assertEqual(len(fingerprints), 1)
+        self.assertEqual(len(fingerprints.pop()), 40)
+
+
+class HueyTracebackTest(TestCase):
+    def test_tracebacks_are_stored_once(self):
+        def _inner_helper_fn():
+            raise ValueError("repeated error")
+
+        @HueyExecutionLog.register_log
+        def _repeated_error():
+            _inner_helper_fn()
+
+        for i in range(3):
+            with self.assertRaises(ValueError):
+                _repeated_error()
+
+        traceback = HueyTraceback.objects.get()
+        self.assertIn("Traceback", traceback.text)
+        self.assertEqual(traceback.logs.count(), 3)
+        log = HueyExecutionLog.objects.first()
+        self.assertEqual(log.error_description, "ValueError: repeated error")
+        self.assertEqual(log.error_text, traceback.text)
+
+        response = self.client.get(
+            "/hueylogs/{}/".format(log.pk), HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.json()["error_description"], traceback.text)
+
+        # the text is only stored compressed, the frames are searched by the
+        # full-text index
+        response = self.client.get(
+            "/hueylogs/?search=_inner_helper_fn",
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.json()["results"], [])
+        fulltext = supports_fulltext(connection)
+        if fulltext:
+            enable_fulltext()
+            self.addCleanup(disable_fulltext)
+            response = self.client.get(
+                "/hueylogs/?search=_inner_helper_fn",
+                HTTP_ACCEPT="application/json",
+            )
+            self.assertEqual(len(response.json()["results"]), 3)
+
+        HueyExecutionLog.objects.all().delete()
+        # the orphan can be about to be referenced by a log being written
+        report = prune_logs(max_age=None, codes={})
+        self.assertEqual(report["tracebacks_deleted"], 0)
+        report = prune_logs(
+            max_age=None, codes={}, now=timezone.now() + relativedelta(days=1)
+        )
+        self.assertEqual(report["tracebacks_deleted"], 1)
+        self.assertFalse(HueyTraceback.objects.exists())
+        if fulltext:
+            # removed from the index too
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM {}_fts".format(
+                        HueyTraceback._meta.db_table
+                    )
+                )
+                self.assertEqual(cursor.fetchone()[0], 0)
@@ -0,0 +1,160 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import sys
+import traceback
+from collections import deque
+
+from django.conf import settings
+
+TRACEBACK_HEADER = "Traceback (most recent call last):\n"
+CAUSE_MESSAGE = (
+    "\nThe above exception was the direct cause of the following "
+    "exception:\n\n"
+)
+CONTEXT_MESSAGE = (
+    "\nDuring handling of the above exception, another exception "
+    "occurred:\n\n"
+)
+
+
+def get_traceback_settings():
+    """Return the 'HUEYLOGS_TRACEBACK' setting with the default values.
+
+    Example of the setting:
+
+    HUEYLOGS_TRACEBACK = {
+        "max_bytes": 65536,  # max size of the stored traceback
+        "head_frames": 10,  # first frames kept of each exception
+        "tail_frames": 20,  # last frames kept of each exception
+    }
+    """
+    options = {"max_bytes": 65536, "head_frames": 10, "tail_frames": 20}
+    options.update(getattr(settings, "HUEYLOGS_TRACEBACK", {}))
+    return options
+
+
+def _normalize_filename(filename):
+    """Remove the parts of the path that change between installations."""
+    for marker in ("site-packages", "dist-packages"):
+        if marker in filename:
+            return filename.split(marker, 1)[1].lstrip(os.sep)
+    return os.path.basename(filename)
+
+
+def _format_frames(tb, head_frames, tail_frames, fingerprint):
+    """Return the formatted lines of the first and last frames of 'tb'.
+
+    Walks all the frames only once, the source lines are read only for the
+    frames kept. The normalized frames are added to 'fingerprint'.
+    """
+    head = []
+    tail = deque(maxlen=tail_frames)
+    total = 0
+    last_key = None
+    for frame, lineno in traceback.walk_tb(tb):
+        total += 1
+        if len(head) < head_frames:
+            head.append((frame, lineno))
+        elif tail_frames:
+            tail.append((frame, lineno))
+        code = frame.f_code
+        key = (_normalize_filename(code.co_filename), code.co_name)
+        # repeated frames (recursion) does not change the fingerprint
+        if key != last_key:
+            fingerprint.update("{}:{}\n".format(*key).encode("utf-8"))
+            last_key = key
+    lines = traceback.StackSummary.extract(head).format()
+    omitted = total - len(head) - len(tail)
+    if omitted:
+        lines.append("  ... {} frames omitted ...\n".format(omitted))
+    lines.extend(traceback.StackSummary.extract(tail).format())
+    return lines
+
+
+def _exception_chain(value):
+    """Return (exception, message after it) from the first to the last."""
+    chain = []
+    seen = set()
+    message = None
+    while value is not None and id(value) not in seen:
+        seen.add(id(value))
+        chain.append((value, message))
+        if value.__cause__ is not None:
+            value, message = value.__cause__, CAUSE_MESSAGE
+        elif value.__context__ is not None and not value.__suppress_context__:
+            value, message = value.__context__, CONTEXT_MESSAGE
+        else:
+            value = None
+    chain.reverse()
+    return chain
+
+
+def _truncate(text, max_bytes):
+    """Keep the head and the tail of 'text' if it is bigger than
+    'max_bytes'."""
+    if max_bytes is None or len(text.encode("utf-8")) <= max_bytes:
+        return text
+    half = max(max_bytes // 2 - 64, 0)
+    encoded = text.encode("utf-8")
+    return "{}\n... {} bytes omitted ...\n{}".format(
+        encoded[:half].decode("utf-8", "ignore"),
+        len(encoded) - 2 * half,
+        encoded[len(encoded) - half :].decode("utf-8", "ignore"),
+    )
+
+
+def capture_exception(exc_info=None, **options):
+    """Return the bounded traceback text and the fingerprint of an exception.
+
+    The traceback keeps the first 'head_frames' and the last 'tail_frames'
+    frames of each exception and at most 'max_bytes' bytes. The fingerprint
+    is a sha1 of the exception type and of the file and function of the
+    frames, so the same error has the same fingerprint regardless of line
+    numbers, messages and recursion depth.
+
+    Arguments:
+        - exc_info: (type, value, traceback), default is sys.exc_info()
+        - options: override the 'HUEYLOGS_TRACEBACK' setting
+    """
+    exc_type, exc_value, exc_tb = exc_info or sys.exc_info()
+    options = dict(get_traceback_settings(), **options)
+    if exc_value is None:
+        exc_value = exc_type()
+    if exc_tb is not None and exc_value.__traceback__ is None:
+        exc_value = exc_value.with_traceback(exc_tb)
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(
+        "{}.{}\n".format(exc_type.__module__, exc_type.__qualname__).encode(
+            "utf-8"
+        )
+    )
+    lines = []
+    for value, message in _exception_chain(exc_value):
+        if value.__traceback__ is not None:
+            lines.append(TRACEBACK_HEADER)
+            lines.extend(
+                _format_frames(
+                    value.__traceback__,
+                    options["head_frames"],
+                    options["tail_frames"],
+                    # only the frames of the raised exception are used
+                    fingerprint if value is exc_value else hashlib.sha1(),
+                )
+            )
+        lines.extend(traceback.format_exception_only(type(value), value))
+        if message:
+            lines.append(message)
+    text = _truncate("".join(lines), options["max_bytes"])
+    return text, fingerprint.hexdigest()
+
+
+def summarize_traceback(text, max_length=1000):
+    """Return the last line of the traceback, the exception message."""
+    lines = text.rstrip().splitlines()
+    if not lines:
+        return ""
+    return lines[-1][:max_length]
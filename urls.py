@@ -4,10 +4,28 @@ should be added within the test folders, and use TestCase.urls to set them.
 This helps the tests remain isolated.
 """
 
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .api_views import HueyExecutionLogViewSet
+from .api_views import (
+    HueyDailyRollupViewSet,
+    HueyExecutionLogViewSet,
+    HueyExecutionProfileViewSet,
+    HueyHourlyRollupViewSet,
+    HueyMetricsView,
+    HueyTaskStatusViewSet,
+)
 
 router = DefaultRouter()
+# registered before "hueylogs" so the prefixes are not taken as a log pk
+router.register("hueylogs/status", HueyTaskStatusViewSet)
+router.register("hueylogs/rollups/hourly", HueyHourlyRollupViewSet)
+router.register("hueylogs/rollups/daily", HueyDailyRollupViewSet)
+router.register("hueylogs/profiles", HueyExecutionProfileViewSet)
 router.register("hueylogs", HueyExecutionLogViewSet)
-urlpatterns = router.urls
+urlpatterns = [
+    # before the router so "metrics" is not taken as a log pk
+    path(
+        "hueylogs/metrics/", HueyMetricsView.as_view(), name="hueylogs-metrics"
+    ),
+] + router.urls
@@ -0,0 +1,204 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections, router
+
+logger = logging.getLogger("hueylogs")
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_BLOCK = "block"
+
+
+class BufferedLogWriter(object):
+    """Write log instances in batches instead of one query per change.
+
+    The logs are kept in a bounded in-memory buffer and written with
+    'bulk_create' (new logs) and 'bulk_update' (logs already written that
+    changed after that, like a long task that finished) when the buffer
+    reaches 'batch_size' logs or every 'flush_interval' seconds.
+
+    Arguments:
+        - batch_size: how many buffered logs trigger a flush
+        - flush_interval: max seconds a log waits in the buffer. If None no
+            background thread is started and the buffer is only flushed
+            when it reaches 'batch_size' or when 'flush' is called
+        - max_size: max number of logs kept in memory
+        - overflow: what to do when the buffer is full. 'drop' discards the
+            log (and counts it in 'dropped'), 'block' waits until the
+            background thread makes room
+    """
+
+    def __init__(
+        self,
+        batch_size=100,
+        flush_interval=1.0,
+        max_size=10000,
+        overflow=OVERFLOW_DROP,
+    ):
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_BLOCK):
+            raise ValueError("Invalid overflow policy: {}".format(overflow))
+        if batch_size > max_size:
+            raise ValueError("'batch_size' can not be greater than 'max_size'")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.overflow = overflow
+        self.dropped = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # logs are indexed by identity so a log added when it starts and
+        # again when it finishes is written only once if both happen
+        # before the flush
+        self._pending = {}
+        self._thread = None
+        self._closed = False
+        self._pid = os.getpid()
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            # forked worker: the parent buffer and thread are not ours
+            self._reset()
+        if self.flush_interval is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="hueylogs-writer"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, log_instance):
+        """Buffer the log, return False if it was dropped."""
+        flush_now = False
+        with self._condition:
+            self._ensure_thread()
+            if id(log_instance) not in self._pending:
+                while len(self._pending) >= self.max_size:
+                    if self._thread is None or self._closed:
+                        flush_now = True
+                        break
+                    if self.overflow == OVERFLOW_DROP:
+                        self.dropped += 1
+                        logger.warning(
+                            "hueylogs buffer is full, dropping log of '%s'",
+                            log_instance.code,
+                        )
+                        return False
+                    self._condition.notify_all()
+                    self._condition.wait()
+                self._pending[id(log_instance)] = log_instance
+            if self._closed:
+                # the background thread is stopped, written right away
+                flush_now = True
+            elif len(self._pending) >= self.batch_size:
+                if self._thread is None:
+                    flush_now = True
+                else:
+                    self._condition.notify_all()
+        if flush_now:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Write all buffered logs, return how many logs were written."""
+        with self._flush_lock:
+            with self._condition:
+                logs = list(self._pending.values())
+                self._pending.clear()
+                self._condition.notify_all()
+            if not logs:
+                return 0
+            try:
+                self._write(logs)
+            except Exception:
+                logger.exception("hueylogs could not write %s logs", len(logs))
+                return 0
+            return len(logs)
+
+    def _write(self, logs):
+        model = type(logs[0])
+        new_logs = [i for i in logs if i.pk is None]
+        changed_logs = [i for i in logs if i.pk is not None]
+        if new_logs:
+            db = router.db_for_write(model)
+            if connections[db].features.can_return_rows_from_bulk_insert:
+                model.objects.bulk_create(new_logs)
+            else:
+                # without the primary keys the unfinished logs could not be
+                # updated later, so they are inserted one by one
+                for log_instance in [i for i in new_logs if not i.finnished]:
+                    log_instance.save()
+                model.objects.bulk_create([i for i in new_logs if i.finnished])
+        if changed_logs:
+            model.objects.bulk_update(
+                changed_logs,
+                [
+                    field.name
+                    for field in model._meta.concrete_fields
+                    if not field.primary_key
+                ],
+            )
+        model._logs_finished([i for i in logs if i.finnished])
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    if (
+                        not self._closed
+                        and len(self._pending) < self.batch_size
+                    ):
+                        self._condition.wait(self.flush_interval)
+                    closed = self._closed
+                self.flush()
+                if closed:
+                    return
+        finally:
+            connections.close_all()
+
+    def close(self):
+        """Stop the background thread and write the remaining logs, the
+        logs added after that are written by 'add' itself."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+def get_default_writer():
+    """Return the writer configured by the 'HUEYLOGS_BUFFER' setting.
+
+    The setting is a dict with the BufferedLogWriter arguments, example:
+
+    HUEYLOGS_BUFFER = {"batch_size": 500, "flush_interval": 5}
+    """
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = BufferedLogWriter(
+                **getattr(settings, "HUEYLOGS_BUFFER", {})
+            )
+            try:
+                from huey.contrib.djhuey import on_shutdown
+
+                on_shutdown(name="hueylogs_flush_logs")(_default_writer.close)
+            except Exception:
+                # huey is not configured, 'atexit' still flushes the logs
+                pass
+        return _default_writer